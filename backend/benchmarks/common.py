@@ -0,0 +1,61 @@
+import os
+import json
+import mimetypes
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def load_fixtures(fixtures_dir: str) -> list[dict]:
+    """
+    Loads benchmark fixtures: every image in fixtures_dir, plus the expected extraction
+    from a sibling <name>.json ({"entries": [...]}) when one exists.
+    """
+    fixtures = []
+    for filename in sorted(os.listdir(fixtures_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_EXTENSIONS:
+            continue
+        path = os.path.join(fixtures_dir, filename)
+        with open(path, "rb") as f:
+            content = f.read()
+        expected = None
+        expected_path = os.path.join(fixtures_dir, f"{stem}.json")
+        if os.path.exists(expected_path):
+            with open(expected_path) as f:
+                expected = json.load(f).get("entries", [])
+        fixtures.append({
+            "name": filename,
+            "content": content,
+            "mime_type": mimetypes.guess_type(filename)[0] or "image/jpeg",
+            "expected": expected,
+        })
+    return fixtures
+
+def _normalize(entry: dict) -> tuple[str, str]:
+    name = " ".join(str(entry.get("name", "")).lower().split())
+    try:
+        amount = f"{float(str(entry.get('amount', '')).replace(',', '')):.2f}"
+    except ValueError:
+        amount = str(entry.get("amount", ""))
+    return name, amount
+
+def row_recall(expected: list[dict], extracted: list[dict]) -> float:
+    """
+    Fraction of expected rows found in the extraction, matching on normalized name and amount.
+    """
+    if not expected:
+        return 1.0
+    remaining = [_normalize(e) for e in extracted]
+    found = 0
+    for entry in expected:
+        key = _normalize(entry)
+        if key in remaining:
+            remaining.remove(key)
+            found += 1
+    return found / len(expected)
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
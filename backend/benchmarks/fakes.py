@@ -0,0 +1,412 @@
+"""
+Local stand-ins for Gemini, Sheets, Drive and the WhatsApp Graph API, used by the
+load test. Each one is driven by a FakeProfile (latency, error rate, quota).
+
+- Gemini: genai.GenerativeModel/upload_file/delete_file are replaced in-process.
+- Sheets/Drive: the pooled googleapiclient Resources are built from the bundled
+  discovery documents on top of FakeGoogleHttp, so request serialization, HttpError
+  handling and MediaIoBaseDownload all run for real.
+- Graph API: a small FastAPI app served over HTTP; point WHATSAPP_GRAPH_API_BASE at it.
+"""
+import io
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+
+class QuotaExceeded(Exception):
+    pass
+
+class InjectedError(Exception):
+    pass
+
+class FakeProfile:
+    """
+    Latency (mean +- jitter), random failure rate and a per-minute quota for one fake API.
+    A rate_per_minute of 0 means no quota. A stall_rate fraction of calls hangs for
+    stall_ms instead of the usual latency.
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, rate_per_minute: float = 0,
+                 stall_rate: float = 0, stall_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_per_minute = rate_per_minute
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self._lock = threading.Lock()
+        self._tokens = rate_per_minute
+        self._updated = time.monotonic()
+        self.stats = {"calls": 0, "errors": 0, "throttled": 0, "stalls": 0}
+
+    def delay(self) -> float:
+        if self.stall_rate and random.random() < self.stall_rate:
+            with self._lock:
+                self.stats["stalls"] += 1
+            return self.stall_ms / 1000
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def admit(self):
+        """
+        Counts a call and raises QuotaExceeded or InjectedError according to the profile.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            if self.rate_per_minute:
+                now = time.monotonic()
+                self._tokens = min(self.rate_per_minute, self._tokens + (now - self._updated) * self.rate_per_minute / 60)
+                self._updated = now
+                if self._tokens < 1:
+                    self.stats["throttled"] += 1
+                    raise QuotaExceeded()
+                self._tokens -= 1
+            if self.error_rate and random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                raise InjectedError()
+
+# ------------------------------------------------------------------
+# Gemini
+# ------------------------------------------------------------------
+
+def fake_extraction(content: bytes, entries_per_image: int) -> dict:
+    """
+    Deterministic ledger extraction derived from the image bytes.
+    """
+    seed = int.from_bytes(hashlib.sha256(content).digest()[:8], "big")
+    rng = random.Random(seed)
+    names = ["Ramesh", "Suresh", "Anita", "Milk", "Rice", "Diesel", "Rent", "Sugar", "Tea", "Kiran"]
+    return {
+        "is_valid_ledger": True,
+        "error_message": "",
+        "entries": [
+            {
+                "date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026",
+                "name": rng.choice(names),
+                "amount": float(rng.randint(10, 5000)),
+                "status": rng.choice(["Paid", "Pending", ""]),
+            }
+            for _ in range(entries_per_image)
+        ],
+        "confidence": round(rng.uniform(0.55, 1.0), 2),
+    }
+
+class _FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class _FakeUploadedFile:
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+
+def install_fake_gemini(profile: FakeProfile, entries_per_image: int = 12):
+    """
+    Replaces the google.generativeai entry points used by gemini_service. A request_options
+    timeout shorter than the simulated latency ends the call with DeadlineExceeded, as the
+    real client does. Returns the names of uploaded files not yet deleted.
+    """
+    import google.generativeai as genai
+    from google.api_core import exceptions
+    uploaded = set()
+    uploaded_lock = threading.Lock()
+
+    def call(delay: float | None = None, request_options=None):
+        delay = profile.delay() if delay is None else delay
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise exceptions.DeadlineExceeded("504 Deadline Exceeded (fake Gemini)")
+        time.sleep(delay)
+        try:
+            profile.admit()
+        except QuotaExceeded:
+            raise exceptions.ResourceExhausted("429 Quota exceeded (fake Gemini)")
+        except InjectedError:
+            raise exceptions.InternalServerError("500 Injected failure (fake Gemini)")
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name: str, *args, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, contents, generation_config=None, stream=False, request_options=None, **kwargs):
+            image = next((part for part in contents if not isinstance(part, str)), None)
+            data = image["data"] if isinstance(image, dict) else getattr(image, "data", b"")
+            text = json.dumps(fake_extraction(data, entries_per_image))
+            if not stream:
+                call(request_options=request_options)
+                return _FakeGeminiResponse(text)
+
+            # Streaming: a fifth of the latency before the first chunk, the rest spread over the chunks.
+            total = profile.delay()
+            call(total / 5, request_options)
+            chunks = [text[i:i + 64] for i in range(0, len(text), 64)]
+
+            def iterate():
+                for chunk in chunks:
+                    time.sleep(total * 4 / 5 / len(chunks))
+                    yield _FakeGeminiResponse(chunk)
+            return iterate()
+
+    def upload_file(path, mime_type=None, **kwargs):
+        call()
+        data = path.read() if hasattr(path, "read") else open(path, "rb").read()
+        name = f"files/{hashlib.sha1(data).hexdigest()[:8]}-{random.getrandbits(32):08x}"
+        with uploaded_lock:
+            uploaded.add(name)
+        return _FakeUploadedFile(name, data)
+
+    def delete_file(name, **kwargs):
+        time.sleep(profile.delay() / 4)
+        with uploaded_lock:
+            uploaded.discard(name)
+
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.upload_file = upload_file
+    genai.delete_file = delete_file
+    return uploaded
+
+# ------------------------------------------------------------------
+# Sheets / Drive
+# ------------------------------------------------------------------
+
+class FakeGoogleBackend:
+    """
+    Spreadsheet state shared by every FakeGoogleHttp: tabs created per spreadsheet, rows
+    appended, spreadsheets created and the folder each was moved to.
+    """
+
+    def __init__(self, sheets: FakeProfile, drive: FakeProfile, export_max_rows: int = 5000):
+        self.sheets = sheets
+        self.drive = drive
+        self.export_max_rows = export_max_rows
+        self._lock = threading.Lock()
+        self.tabs: dict[tuple[str, str], int] = {}
+        self.rows: list[list[str]] = []
+        self.created: list[str] = []
+        self.parents: dict[str, str] = {}
+
+    def _cell(self, cell: dict) -> str:
+        value = cell.get("userEnteredValue", {})
+        return str(next(iter(value.values()), "")) if value else ""
+
+    def batch_update(self, spreadsheet_id: str, body: dict) -> dict:
+        replies = []
+        with self._lock:
+            for request in body.get("requests", []):
+                if "addSheet" in request:
+                    properties = request["addSheet"]["properties"]
+                    if (spreadsheet_id, properties["title"]) in self.tabs:
+                        return {"_status": 400, "error": {"code": 400, "message": f"A sheet with the name \"{properties['title']}\" already exists."}}
+                    sheet_id = properties.get("sheetId") or random.randint(1, 2**31 - 1)
+                    self.tabs[(spreadsheet_id, properties["title"])] = sheet_id
+                    replies.append({"addSheet": {"properties": {"sheetId": sheet_id, "title": properties["title"]}}})
+                else:
+                    for row in request.get("appendCells", {}).get("rows", []):
+                        self.rows.append([self._cell(c) for c in row.get("values", [])])
+                    replies.append({})
+        return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+    def metadata(self, spreadsheet_id: str) -> dict:
+        with self._lock:
+            return {"sheets": [
+                {"properties": {"sheetId": sheet_id, "title": title}}
+                for (owner, title), sheet_id in self.tabs.items() if owner == spreadsheet_id
+            ]}
+
+    def create_spreadsheet(self, body: dict) -> dict:
+        with self._lock:
+            spreadsheet_id = f"fake-spreadsheet-{len(self.created) + 1}"
+            self.created.append(spreadsheet_id)
+        return {"spreadsheetId": spreadsheet_id, "properties": body.get("properties", {})}
+
+    def move_file(self, file_id: str, folder_id: str) -> dict:
+        with self._lock:
+            self.parents[file_id] = folder_id
+        return {"id": file_id}
+
+    def append(self, body: dict) -> dict:
+        with self._lock:
+            self.rows.extend(body.get("values", []))
+        return {"updates": {"updatedRows": len(body.get("values", []))}}
+
+    def export(self) -> bytes:
+        from services.xlsx_service import build_ledger_xlsx
+        with self._lock:
+            rows = list(self.rows[-self.export_max_rows:])
+        return build_ledger_xlsx(rows, "Export")
+
+_SCOPE = "https://www.googleapis.com/auth/"
+# OAuth scopes that allow each kind of call, as the real APIs check them
+SHEETS_READ_SCOPES = {_SCOPE + s for s in ("spreadsheets", "spreadsheets.readonly", "drive", "drive.readonly", "drive.file")}
+SHEETS_WRITE_SCOPES = {_SCOPE + s for s in ("spreadsheets", "drive", "drive.file")}
+DRIVE_READ_SCOPES = {_SCOPE + s for s in ("drive", "drive.readonly", "drive.file")}
+DRIVE_WRITE_SCOPES = {_SCOPE + s for s in ("drive", "drive.file")}
+
+class FakeGoogleHttp:
+    """
+    httplib2.Http look-alike answering the Sheets v4 and Drive v3 calls the app makes.
+    Calls the client's OAuth scopes would not allow get the real API's 403.
+    """
+
+    def __init__(self, backend: FakeGoogleBackend, scopes: list[str]):
+        self.backend = backend
+        self.scopes = set(scopes)
+
+    def _required_scopes(self, method: str, is_drive: bool) -> set[str]:
+        if is_drive:
+            return DRIVE_READ_SCOPES if method == "GET" else DRIVE_WRITE_SCOPES
+        return SHEETS_READ_SCOPES if method == "GET" else SHEETS_WRITE_SCOPES
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        import httplib2
+        parsed = urlparse(uri)
+        is_drive = "/drive/" in parsed.path
+        profile = self.backend.drive if is_drive else self.backend.sheets
+
+        time.sleep(profile.delay())
+        try:
+            profile.admit()
+        except QuotaExceeded:
+            return self._json(429, {"error": {"code": 429, "message": "Quota exceeded (fake)", "status": "RESOURCE_EXHAUSTED"}})
+        except InjectedError:
+            return self._json(500, {"error": {"code": 500, "message": "Injected failure (fake)", "status": "INTERNAL"}})
+
+        if not self.scopes & self._required_scopes(method, is_drive):
+            return self._json(403, {"error": {"code": 403, "message": "Request had insufficient authentication scopes (fake)",
+                                              "status": "PERMISSION_DENIED", "errors": [{"reason": "insufficientPermissions"}]}})
+
+        if is_drive and parsed.path.endswith("/export"):
+            content = self.backend.export()
+            return httplib2.Response({"status": 200, "content-length": str(len(content))}), content
+
+        payload = json.loads(body) if body else {}
+        if is_drive and method == "PATCH" and "/files/" in parsed.path:
+            file_id = parsed.path.rsplit("/", 1)[-1]
+            return self._json(200, self.backend.move_file(file_id, parse_qs(parsed.query).get("addParents", [""])[0]))
+        if method == "POST" and parsed.path.endswith("/v4/spreadsheets"):
+            return self._json(200, self.backend.create_spreadsheet(payload))
+        spreadsheet_id = parsed.path.split("/spreadsheets/")[-1].split("/")[0].split(":")[0]
+        if parsed.path.endswith(":batchUpdate"):
+            result = self.backend.batch_update(spreadsheet_id, payload)
+            return self._json(result.pop("_status", 200), result)
+        if method == "GET" and parsed.path.endswith(f"/spreadsheets/{spreadsheet_id}"):
+            return self._json(200, self.backend.metadata(spreadsheet_id))
+        if parsed.path.endswith(":append"):
+            return self._json(200, self.backend.append(payload))
+        return self._json(404, {"error": {"code": 404, "message": f"Not faked: {method} {parsed.path}"}})
+
+    def _json(self, status: int, data: dict):
+        import httplib2
+        return httplib2.Response({"status": status, "content-type": "application/json"}), json.dumps(data).encode()
+
+def install_fake_google(backend: FakeGoogleBackend):
+    """
+    Makes the Sheets/Drive client pools build their Resources on FakeGoogleHttp.
+    """
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    from services import google_clients
+
+    def build(pool):
+        return build_from_document(get_static_doc(pool.api, pool.version), http=FakeGoogleHttp(backend, pool.scopes))
+
+    google_clients.ClientPool._build = build
+
+# ------------------------------------------------------------------
+# WhatsApp Graph API
+# ------------------------------------------------------------------
+
+class FakeGraphApi:
+    """
+    Graph API stand-in: media lookup/download, media upload and message sends.
+    Sent messages are recorded in `deliveries` as (to, type, monotonic time).
+    """
+
+    def __init__(self, profile: FakeProfile, media: list[tuple[bytes, str]]):
+        self.profile = profile
+        self.media = media
+        self.base_url = ""
+        self._lock = threading.Lock()
+        self._uploads = 0
+        self.deliveries: list[tuple[str, str, float]] = []
+
+    def delivered_to(self, to_number: str) -> list[tuple[str, float]]:
+        with self._lock:
+            return [(kind, at) for to, kind, at in self.deliveries if to == to_number]
+
+    def app(self):
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse, Response
+
+        app = FastAPI()
+
+        async def gate():
+            await asyncio.sleep(self.profile.delay())
+            try:
+                self.profile.admit()
+            except QuotaExceeded:
+                return JSONResponse({"error": {"code": 4, "message": "Rate limit (fake)"}}, status_code=429, headers={"Retry-After": "1"})
+            except InjectedError:
+                return JSONResponse({"error": {"code": 2, "message": "Injected failure (fake)"}}, status_code=500)
+            return None
+
+        @app.get("/media/{media_id}")
+        async def download(media_id: str):
+            if (failure := await gate()) is not None:
+                return failure
+            content, mime_type = self.media[int(hashlib.sha1(media_id.encode()).hexdigest(), 16) % len(self.media)]
+            return Response(content, media_type=mime_type)
+
+        @app.get("/v19.0/{media_id}")
+        async def media_url(media_id: str):
+            if (failure := await gate()) is not None:
+                return failure
+            return {"url": f"{self.base_url}/media/{media_id}", "id": media_id}
+
+        @app.post("/v19.0/{phone_id}/media")
+        async def upload(request: Request):
+            await request.body()
+            if (failure := await gate()) is not None:
+                return failure
+            with self._lock:
+                self._uploads += 1
+                media_id = f"upload_{self._uploads}"
+            return {"id": media_id}
+
+        @app.post("/v19.0/{phone_id}/messages")
+        async def send(request: Request):
+            payload = await request.json()
+            if (failure := await gate()) is not None:
+                return failure
+            with self._lock:
+                self.deliveries.append((payload.get("to"), payload.get("type"), time.monotonic()))
+            return {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{random.getrandbits(48):x}"}]}
+
+        return app
+
+def synthetic_ledger_images(count: int, width: int = 1600, height: int = 2200) -> list[tuple[bytes, str]]:
+    """
+    JPEG "photos" of a ruled page with scribbles, distinct per index so the extraction cache never hits.
+    """
+    from PIL import Image, ImageDraw
+    images = []
+    for i in range(count):
+        rng = random.Random(i)
+        img = Image.new("RGB", (width, height), (rng.randint(60, 90),) * 3)
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((120, 100, width - 120, height - 100), fill=(235, 232, 220))
+        for y in range(200, height - 150, 70):
+            draw.line((140, y, width - 140, y), fill=(150, 170, 210), width=2)
+            x = 160
+            while x < width - 300:
+                length = rng.randint(40, 220)
+                draw.line((x, y - 12, x + length, y - 12 + rng.randint(-6, 6)), fill=(20, 20, 60), width=4)
+                x += length + rng.randint(20, 80)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append((buffer.getvalue(), "image/jpeg"))
+    return images
@@ -0,0 +1,94 @@
+"""
+Deadline-aware, hedged Gemini calls against the fake Gemini with injected hangs: extraction
+latency with hedging off and on, and whether every Files API upload is deleted.
+
+    cd backend
+    python -m benchmarks.hedging_benchmark --requests 300 --stall-rate 0.03
+
+- latency: p50/p95/p99/max of _generate_tiered per mode, plus hedges sent/won and
+  deadline failures
+- files: the same calls forced through upload_file/delete_file, with uploads and deletes
+  hanging too; reports uploaded files left behind once abandoned attempts have finished
+
+Timings are scaled down (hundreds of ms instead of seconds, --deadline 10s instead of 60s)
+so a run takes about a minute; the ratios are what matter.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+
+def run(gemini_service, requests: int, concurrency: int, mime_type: str = "image/jpeg") -> tuple[list[float], int]:
+    def one(i: int):
+        image = random.Random(i).randbytes(2048)
+        start = time.perf_counter()
+        try:
+            with gemini_service._request_contents(image, mime_type) as contents:
+                gemini_service._generate_tiered(contents)
+            return time.perf_counter() - start, False
+        except Exception as e:
+            print(f"Request {i} failed: {type(e).__name__}: {e}")
+            return time.perf_counter() - start, True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    return [duration for duration, _ in results], sum(failed for _, failed in results)
+
+def events(prefix: str) -> dict:
+    from services.metrics import EVENTS
+    return {labels[0][1]: value for labels, value in EVENTS._values.items() if labels and labels[0][1].startswith(prefix)}
+
+def measure(label: str, gemini_service, requests: int, concurrency: int):
+    before = events("gemini_")
+    start = time.perf_counter()
+    durations, failed = run(gemini_service, requests, concurrency)
+    elapsed = time.perf_counter() - start
+    after = events("gemini_")
+    delta = {k: int(v - before.get(k, 0)) for k, v in after.items() if v != before.get(k, 0)}
+    print(f"{label}: p50={percentile(durations, 50) * 1000:.0f}ms p95={percentile(durations, 95) * 1000:.0f}ms "
+          f"p99={percentile(durations, 99) * 1000:.0f}ms max={max(durations) * 1000:.0f}ms "
+          f"failed={failed} in {elapsed:.1f}s {delta}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--jitter-ms", type=float, default=150)
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall-ms", type=float, default=20000)
+    parser.add_argument("--deadline", type=float, default=10.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["GEMINI_DEADLINE_SECONDS"] = str(args.deadline)
+    os.environ["GEMINI_HEDGE_AFTER_SECONDS"] = str(args.latency_ms * 3 / 1000)
+    os.environ["GEMINI_HEDGE_MIN_SECONDS"] = "0.1"
+    # Measure Gemini's tail, not the admission limiter's rate limit
+    os.environ["ADMISSION_GEMINI_RATE_PER_SECOND"] = "0"
+
+    from benchmarks.fakes import FakeProfile, install_fake_gemini
+    profile = FakeProfile(args.latency_ms, args.jitter_ms, stall_rate=args.stall_rate, stall_ms=args.stall_ms)
+    uploaded = install_fake_gemini(profile)
+    from services import gemini_service
+
+    for hedge in (False, True):
+        gemini_service.GEMINI_HEDGE = hedge
+        measure(f"hedging {'on ' if hedge else 'off'}", gemini_service, args.requests, args.concurrency)
+    print(f"Hedge threshold: {gemini_service.get_latency_stats()['latency']}")
+
+    gemini_service.GEMINI_INLINE_MAX_BYTES = 0
+    measure("Files API", gemini_service, args.requests // 3, args.concurrency)
+    print(f"{len(uploaded)} uploads not yet deleted; waiting {args.stall_ms / 1000:.0f}s for abandoned ones...")
+    # Abandoned uploads and background deletes have all finished by then.
+    time.sleep(args.stall_ms / 1000 * 1.25 + 2)
+    print(f"Uploaded files left behind: {len(uploaded)}")
+
+if __name__ == "__main__":
+    main()
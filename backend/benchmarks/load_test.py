@@ -0,0 +1,298 @@
+"""
+Offline load test for /upload, /confirm and /webhook. Gemini, Sheets, Drive and the
+WhatsApp Graph API are replaced by local fakes (see benchmarks/fakes.py), so no real
+Google or Meta endpoint is ever called.
+
+    cd backend
+    python -m benchmarks.load_test --requests 200 --concurrency 20
+    python -m benchmarks.load_test --gemini-latency-ms 4000 --gemini-rpm 300 --sheets-error-rate 0.02
+
+The app is served by uvicorn on a local port, next to a fake Graph API server, and
+driven over HTTP at the given concurrency. Reports throughput and p50/p95/p99 per
+endpoint, plus per pipeline stage and external call from the app's trace spans.
+Records, ledger mirror and extraction cache go to a temporary directory.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import load_fixtures, percentile
+
+FAKE_APIS = {
+    "gemini": {"latency_ms": 3000, "jitter_ms": 1000},
+    "sheets": {"latency_ms": 400, "jitter_ms": 150},
+    "drive": {"latency_ms": 800, "jitter_ms": 300},
+    "graph": {"latency_ms": 150, "jitter_ms": 50},
+}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit(f"Server on port {port} failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+def stop_server(server, thread):
+    server.should_exit = True
+    thread.join(timeout=30)
+
+def configure_environment(args, graph_port: int, workdir: str):
+    """
+    Must run before main and the services are imported: they read their settings at import time.
+    """
+    os.environ.update({
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY") or "fake",
+        "GOOGLE_SHEET_ID": "load-test-sheet",
+        "WHATSAPP_ACCESS_TOKEN": "fake",
+        "WHATSAPP_PHONE_ID": "100000000000000",
+        "WHATSAPP_GRAPH_API_BASE": f"http://127.0.0.1:{graph_port}/v19.0",
+        "RECORDS_DB_PATH": os.path.join(workdir, "records.db"),
+        "EXTRACTION_CACHE_DB": os.path.join(workdir, "extraction_cache.db"),
+        "EXTRACTION_CACHE_ENABLED": "1" if args.cache else "0",
+        "PREPROCESS_IMAGES": "1" if args.preprocess else "0",
+        "TRACE_SPANS": "1",
+        "SHEETS_LAYOUT": args.sheets_layout,
+        "TRACE_MAX_TRACES": str(max(10000, args.requests * 10)),
+    })
+
+async def run_phase(name: str, count: int, concurrency: int, call) -> dict:
+    """
+    Runs call(i) count times with at most `concurrency` in flight and times each one.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, results = [], defaultdict(int), []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status, result = await call(i)
+            except Exception as e:
+                status, result = type(e).__name__, None
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+            results.append(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    return {"name": name, "latencies": latencies, "statuses": dict(statuses), "elapsed": elapsed, "results": results}
+
+def webhook_payload(sender: str, message_id: str, media_id: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"field": "messages", "value": {"messages": [
+            {"from": sender, "id": message_id, "type": "image", "image": {"id": media_id, "mime_type": "image/jpeg"}}
+        ]}}]}],
+    }
+
+def track_whatsapp_pipeline(app_module) -> list[tuple[str, int, float]]:
+    """
+    Wraps the WhatsApp batch handler to record (sender, image count, finish time) for every run,
+    both for per-message background tasks and for coalesced bursts.
+    """
+    completed = []
+    original = app_module.process_whatsapp_images
+
+    async def tracked(sender_phone: str, media_ids: list[str]) -> bool:
+        try:
+            return await original(sender_phone, media_ids)
+        finally:
+            completed.append((sender_phone, len(media_ids), time.monotonic()))
+
+    # Both paths reach it through process_claimed_images
+    app_module.process_whatsapp_images = tracked
+    return completed
+
+async def drive_load(args, base_url: str, images: list[tuple[bytes, str]], graph, completed: list) -> list[dict]:
+    import httpx
+    phases = []
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        if "upload" in args.phases or "confirm" in args.phases:
+            async def upload(i):
+                content, mime_type = images[i % len(images)]
+                response = await client.post("/upload", files={"file": (f"page_{i}.jpg", content, mime_type)})
+                body = response.json() if response.status_code == 200 else {}
+                return response.status_code, body if body.get("status") == "success" else None
+
+            phase = await run_phase("POST /upload", args.requests, args.concurrency, upload)
+            uploaded = [r for r in phase["results"] if r]
+            if "upload" in args.phases:
+                phases.append(phase)
+
+            if "confirm" in args.phases:
+                async def confirm(i):
+                    record = uploaded[i]
+                    response = await client.post(f"/confirm/{record['record_id']}", json=record["data"])
+                    return response.status_code, None
+
+                phases.append(await run_phase("POST /confirm", len(uploaded), args.concurrency, confirm))
+
+        if "webhook" in args.phases:
+            senders = [f"91{9000000000 + i}" for i in range(args.senders)]
+            posted = defaultdict(list)
+
+            async def webhook(i):
+                sender = senders[i % len(senders)]
+                posted[sender].append(time.monotonic())
+                payload = webhook_payload(sender, f"wamid.load.{i}.{random.getrandbits(32):x}", f"media_{i}")
+                response = await client.post("/webhook", json=payload)
+                return response.status_code, None
+
+            phases.append(await run_phase("POST /webhook", args.requests, args.concurrency, webhook))
+
+            # The webhook acks before processing; wait for the background pipelines to finish.
+            deadline = time.monotonic() + args.drain_timeout
+            while sum(n for _, n, _ in completed) < args.requests and time.monotonic() < deadline:
+                await asyncio.sleep(0.25)
+            phases.append(webhook_completion(posted, completed, graph))
+    return phases
+
+def webhook_completion(posted: dict, completed: list, graph) -> dict:
+    """
+    End-to-end latency per image: webhook POST until its pipeline run (and reply) finished.
+    """
+    latencies = []
+    waiting = {sender: sorted(times) for sender, times in posted.items()}
+    for sender, image_count, finished_at in sorted(completed, key=lambda c: c[2]):
+        batch, waiting[sender] = waiting[sender][:image_count], waiting[sender][image_count:]
+        latencies.extend(finished_at - post_time for post_time in batch)
+    documents = sum(1 for _, kind, _ in graph.deliveries if kind == "document")
+    statuses = {
+        "pipeline_runs": len(completed),
+        "reply_documents": documents,
+        "unfinished_images": sum(len(times) for times in waiting.values()),
+    }
+    return {"name": "webhook -> pipeline done", "latencies": latencies, "statuses": statuses, "elapsed": 0, "results": []}
+
+def collect_spans() -> dict[str, list[float]]:
+    from services.metrics import recent_traces, get_trace, TRACE_MAX_TRACES
+    durations = defaultdict(list)
+    for summary in recent_traces(TRACE_MAX_TRACES):
+        trace = get_trace(summary["trace_id"])
+        for span in (trace or {}).get("spans", []):
+            durations[span["name"]].append(span["duration"])
+    return durations
+
+def format_row(label: str, values: list[float], extra: str = "") -> str:
+    return (
+        f"{label:<34} n={len(values):<6} p50={percentile(values, 50) * 1000:>8.0f}ms "
+        f"p95={percentile(values, 95) * 1000:>8.0f}ms p99={percentile(values, 99) * 1000:>8.0f}ms {extra}"
+    )
+
+def report(phases: list[dict], spans: dict[str, list[float]], profiles: dict, google, as_json: str = ""):
+    print("\nEndpoints")
+    for phase in phases:
+        throughput = f"{len(phase['latencies']) / phase['elapsed']:.1f} req/s" if phase["elapsed"] else ""
+        print(format_row(phase["name"], phase["latencies"], f"{throughput} {phase['statuses']}"))
+
+    print("\nStages and external calls")
+    for name in sorted(spans):
+        print(format_row(name, spans[name]))
+
+    print("\nFake APIs")
+    for api, profile in profiles.items():
+        print(f"{api:<10} {profile.stats}")
+    print(f"Sheets: {len(google.tabs)} tabs, {len(google.rows)} rows, {len(google.created)} spreadsheets created")
+
+    if as_json:
+        summary = {
+            "endpoints": {
+                p["name"]: {"count": len(p["latencies"]), "elapsed": p["elapsed"], "statuses": p["statuses"],
+                            **{f"p{q}": percentile(p["latencies"], q) for q in (50, 95, 99)}}
+                for p in phases
+            },
+            "stages": {name: {"count": len(v), **{f"p{q}": percentile(v, q) for q in (50, 95, 99)}} for name, v in spans.items()},
+            "fakes": {api: profile.stats for api, profile in profiles.items()},
+            "sheets": {"tabs": len(google.tabs), "rows": len(google.rows), "spreadsheets_created": len(google.created)},
+        }
+        with open(as_json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nWrote {as_json}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per phase")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--phases", default="upload,confirm,webhook")
+    parser.add_argument("--senders", type=int, default=20, help="Distinct WhatsApp senders in the webhook phase")
+    parser.add_argument("--fixtures", default="", help="Image directory; synthetic ledger photos are used when empty")
+    parser.add_argument("--entries-per-image", type=int, default=12)
+    parser.add_argument("--preprocess", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False, help="Keep the extraction cache on")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="How long to wait for webhook replies")
+    parser.add_argument("--sheets-layout", choices=("tabs", "partitioned"), default="tabs", help="SHEETS_LAYOUT for the app")
+    parser.add_argument("--json", default="", help="Also write the summary to this file")
+    for api, defaults in FAKE_APIS.items():
+        parser.add_argument(f"--{api}-latency-ms", type=float, default=defaults["latency_ms"])
+        parser.add_argument(f"--{api}-jitter-ms", type=float, default=defaults["jitter_ms"])
+        parser.add_argument(f"--{api}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{api}-rpm", type=float, default=0.0, help="Per-minute quota (0 = unlimited)")
+        parser.add_argument(f"--{api}-stall-rate", type=float, default=0.0, help="Fraction of calls that hang")
+        parser.add_argument(f"--{api}-stall-ms", type=float, default=30000.0, help="How long a hanging call takes")
+    args = parser.parse_args()
+    args.phases = {p.strip() for p in args.phases.split(",") if p.strip()}
+
+    from benchmarks.fakes import FakeProfile, FakeGoogleBackend, FakeGraphApi, install_fake_gemini, install_fake_google, synthetic_ledger_images
+
+    profiles = {
+        api: FakeProfile(
+            getattr(args, f"{api}_latency_ms"), getattr(args, f"{api}_jitter_ms"),
+            getattr(args, f"{api}_error_rate"), getattr(args, f"{api}_rpm"),
+            getattr(args, f"{api}_stall_rate"), getattr(args, f"{api}_stall_ms"),
+        )
+        for api in FAKE_APIS
+    }
+    if args.fixtures:
+        images = [(f["content"], f["mime_type"]) for f in load_fixtures(args.fixtures)]
+        if not images:
+            sys.exit(f"No images found in {args.fixtures}")
+    else:
+        images = synthetic_ledger_images(min(args.requests, 50))
+
+    workdir = tempfile.mkdtemp(prefix="airstore_load_")
+    graph = FakeGraphApi(profiles["graph"], images)
+    graph_port, app_port = free_port(), free_port()
+    graph.base_url = f"http://127.0.0.1:{graph_port}"
+    configure_environment(args, graph_port, workdir)
+
+    install_fake_gemini(profiles["gemini"], args.entries_per_image)
+    google = FakeGoogleBackend(profiles["sheets"], profiles["drive"])
+    install_fake_google(google)
+    import main as app_module
+    completed = track_whatsapp_pipeline(app_module)
+
+    servers = [start_server(graph.app(), graph_port), start_server(app_module.app, app_port)]
+    print(f"Load test: {args.requests} requests/phase at concurrency {args.concurrency}, data in {workdir}")
+    try:
+        phases = asyncio.run(drive_load(args, f"http://127.0.0.1:{app_port}", images, graph, completed))
+    finally:
+        for server, thread in reversed(servers):
+            stop_server(server, thread)
+
+    report(phases, collect_spans(), profiles, google, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Near-duplicate page detection: lookup latency of the multi-index hash at scale, and how
+far apart the page hashes of re-shot and of different pages are.
+
+    cd backend
+    python -m benchmarks.page_index_benchmark --pages 300000
+    python -m benchmarks.page_index_benchmark --fixtures ./fixtures
+
+- lookup: p50/p99 search time over --pages stored hashes, and recall of planted
+  near-duplicates checked against a linear scan
+- hashes: Hamming distance between each page and a re-shot copy (brightness, scale,
+  JPEG quality changed) and between different pages, plus the time to hash one photo
+
+Stored hashes are random, which spreads them evenly over the buckets. Real pages cluster
+more, so expect somewhat larger buckets and slower lookups than reported here.
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import load_fixtures, percentile
+from services.page_index import MultiIndexHash, page_hash, PAGE_DEDUP_MAX_DISTANCE
+
+def benchmark_lookup(pages: int, queries: int, max_distance: int, seed: int = 0):
+    rng = random.Random(seed)
+    index = MultiIndexHash()
+    hashes = [rng.getrandbits(64) for _ in range(pages)]
+    start = time.perf_counter()
+    for item_id, value in enumerate(hashes):
+        index.add(item_id, value)
+    print(f"Indexed {pages} hashes in {time.perf_counter() - start:.1f}s")
+
+    # Half the queries are planted near-duplicates of stored pages, half are unrelated.
+    planted = []
+    for _ in range(queries):
+        if rng.random() < 0.5:
+            target = rng.randrange(pages)
+            flips = rng.sample(range(64), rng.randint(0, max_distance))
+            planted.append((hashes[target] ^ sum(1 << b for b in flips), target))
+        else:
+            planted.append((rng.getrandbits(64), None))
+
+    timings, found = [], 0
+    for value, target in planted:
+        start = time.perf_counter()
+        matches = index.search(value, max_distance)
+        timings.append(time.perf_counter() - start)
+        if target is not None and any(item_id == target for _, item_id in matches):
+            found += 1
+
+    # The search must return exactly what a full scan would.
+    for value, _ in planted[:20]:
+        expected = sorted((d, i) for i, h in enumerate(hashes) if (d := (h ^ value).bit_count()) <= max_distance)
+        assert index.search(value, max_distance) == expected, "multi-index search disagrees with linear scan"
+
+    expected_found = sum(1 for _, target in planted if target is not None)
+    print(f"Lookup over {pages} pages, max distance {max_distance}: "
+          f"p50={percentile(timings, 50) * 1e6:.0f}us p99={percentile(timings, 99) * 1e6:.0f}us, "
+          f"planted duplicates found {found}/{expected_found}")
+
+def reshoot(content: bytes, seed: int) -> bytes:
+    from PIL import Image, ImageEnhance
+    rng = random.Random(seed)
+    img = Image.open(io.BytesIO(content)).convert("RGB")
+    img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.75, 1.25))
+    scale = rng.uniform(0.5, 1.0)
+    img = img.resize((int(img.width * scale), int(img.height * scale)))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=rng.randint(60, 90))
+    return out.getvalue()
+
+def benchmark_hashes(images: list[tuple[bytes, str]]):
+    start = time.perf_counter()
+    hashes = [page_hash(content, mime_type) for content, mime_type in images]
+    hash_ms = (time.perf_counter() - start) / len(images) * 1000
+
+    same = [(hashes[i] ^ page_hash(reshoot(content, i), "image/jpeg")).bit_count() for i, (content, _) in enumerate(images)]
+    different = [(hashes[i] ^ hashes[j]).bit_count() for i in range(len(hashes)) for j in range(i + 1, len(hashes))]
+    print(f"Hashing: {hash_ms:.1f}ms per photo")
+    print(f"Re-shot page: max={max(same)} p90={percentile(same, 90):.0f} bits")
+    if different:
+        print(f"Different pages: min={min(different)} p10={percentile(different, 10):.0f} bits")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=PAGE_DEDUP_MAX_DISTANCE)
+    parser.add_argument("--fixtures", default="", help="Image directory; synthetic ledger photos are used when empty")
+    parser.add_argument("--images", type=int, default=20, help="Synthetic photos to hash when --fixtures is not given")
+    args = parser.parse_args()
+
+    benchmark_lookup(args.pages, args.queries, args.max_distance)
+
+    if args.fixtures:
+        images = [(f["content"], f["mime_type"]) for f in load_fixtures(args.fixtures)]
+    else:
+        from benchmarks.fakes import synthetic_ledger_images
+        images = synthetic_ledger_images(args.images)
+    benchmark_hashes(images)
+
+if __name__ == "__main__":
+    main()
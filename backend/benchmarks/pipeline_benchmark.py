@@ -0,0 +1,127 @@
+"""
+Wall-clock time per image of the WhatsApp pipeline, step by step (WHATSAPP_PIPELINE=sequential)
+versus the stage graph (dag), against the local fakes of benchmarks/fakes.py.
+
+    cd backend
+    python -m benchmarks.pipeline_benchmark --images 20 --reply-modes full,entries,recent
+
+Every image runs process_whatsapp_image from its own sender, --concurrency at a time.
+Reported per reply mode and pipeline:
+- p50/p95 wall-clock per image
+- the average time of each stage, from the app's trace spans
+- whether every sender got its messages in order (status, progress, document)
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+from benchmarks.load_test import FAKE_APIS, free_port, start_server, stop_server, configure_environment
+
+PIPELINE_STAGES = (
+    "status_message", "extract_images", "read_recent_rows", "create_and_append_sheet",
+    "progress_message", "build_reply_xlsx", "upload_reply_media", "send_reply_document",
+)
+
+async def run_mode(app_module, graph_api, images: int, concurrency: int, first_sender: int) -> dict:
+    from services.metrics import recent_traces, get_trace, TRACE_MAX_TRACES
+    before = {t["trace_id"] for t in recent_traces(TRACE_MAX_TRACES)}
+    semaphore = asyncio.Semaphore(concurrency)
+    durations, senders = [], []
+
+    async def one(i: int):
+        sender = f"91{first_sender + i}"
+        senders.append(sender)
+        async with semaphore:
+            start = time.perf_counter()
+            await app_module.process_whatsapp_image(f"media_{i}", sender)
+            durations.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(images)))
+
+    stages = defaultdict(list)
+    for summary in recent_traces(TRACE_MAX_TRACES):
+        if summary["trace_id"] in before:
+            continue
+        for span in (get_trace(summary["trace_id"]) or {}).get("spans", []):
+            if span["name"] in PIPELINE_STAGES:
+                stages[span["name"]].append(span["duration"])
+
+    expected = ["text", "text", "document"]
+    in_order = sum(1 for sender in senders if [kind for kind, _ in graph_api.delivered_to(sender)] == expected)
+    return {"durations": durations, "stages": stages, "in_order": in_order}
+
+async def run_all(args, app_module, graph_api):
+    results = {}
+    async with app_module.lifespan(app_module.app):
+        # One untimed run so SDK imports and client pools are warm for both pipelines
+        await app_module.process_whatsapp_image("media_warmup", "919999999999")
+        first_sender = 8000000000
+        for reply_mode in args.reply_modes:
+            app_module.WHATSAPP_REPLY_XLSX_MODE = reply_mode
+            for pipeline in ("sequential", "dag"):
+                app_module.WHATSAPP_PIPELINE = pipeline
+                results[(reply_mode, pipeline)] = await run_mode(app_module, graph_api, args.images, args.concurrency, first_sender)
+                first_sender += args.images
+    return results
+
+def report(results: dict, images: int):
+    for (reply_mode, pipeline), result in results.items():
+        durations = result["durations"]
+        print(f"\n{reply_mode:<8} {pipeline:<10} p50={percentile(durations, 50) * 1000:>6.0f}ms "
+              f"p95={percentile(durations, 95) * 1000:>6.0f}ms  messages in order: {result['in_order']}/{images}")
+        for stage in PIPELINE_STAGES:
+            values = result["stages"].get(stage)
+            if values:
+                print(f"    {stage:<26} avg={sum(values) / len(values) * 1000:>6.0f}ms")
+
+    for reply_mode in dict.fromkeys(mode for mode, _ in results):
+        sequential = percentile(results[(reply_mode, "sequential")]["durations"], 50)
+        dag = percentile(results[(reply_mode, "dag")]["durations"], 50)
+        print(f"{reply_mode}: p50 {sequential * 1000:.0f}ms -> {dag * 1000:.0f}ms ({(1 - dag / sequential) * 100:.0f}% lower)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20, help="Images per reply mode and pipeline")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--reply-modes", default="full,entries,recent")
+    parser.add_argument("--preprocess", action=argparse.BooleanOptionalAction, default=False)
+    for api, defaults in FAKE_APIS.items():
+        parser.add_argument(f"--{api}-latency-ms", type=float, default=defaults["latency_ms"])
+        parser.add_argument(f"--{api}-jitter-ms", type=float, default=defaults["jitter_ms"])
+    args = parser.parse_args()
+    args.reply_modes = [m.strip() for m in args.reply_modes.split(",") if m.strip()]
+
+    from benchmarks.fakes import FakeProfile, FakeGoogleBackend, FakeGraphApi, install_fake_gemini, install_fake_google, synthetic_ledger_images
+
+    profiles = {api: FakeProfile(getattr(args, f"{api}_latency_ms"), getattr(args, f"{api}_jitter_ms")) for api in FAKE_APIS}
+    workdir = tempfile.mkdtemp(prefix="airstore_pipeline_")
+    graph_api = FakeGraphApi(profiles["graph"], synthetic_ledger_images(10))
+    graph_port = free_port()
+    graph_api.base_url = f"http://127.0.0.1:{graph_port}"
+    requests = args.images * len(args.reply_modes) * 2 + 1
+    configure_environment(SimpleNamespace(cache=False, preprocess=args.preprocess, sheets_layout="tabs", requests=requests), graph_port, workdir)
+    # The same photos come back in every run; they must not be treated as resent pages.
+    os.environ["PAGE_DEDUP_MODE"] = "off"
+
+    install_fake_gemini(profiles["gemini"])
+    install_fake_google(FakeGoogleBackend(profiles["sheets"], profiles["drive"]))
+    import main as app_module
+
+    server = start_server(graph_api.app(), graph_port)
+    print(f"Pipeline benchmark: {args.images} images per run at concurrency {args.concurrency}, data in {workdir}")
+    try:
+        results = asyncio.run(run_all(args, app_module, graph_api))
+    finally:
+        stop_server(*server)
+    report(results, args.images)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares extraction with and without image preprocessing on a fixture set.
+
+    cd backend
+    python -m benchmarks.preprocess_benchmark --fixtures benchmarks/fixtures
+
+Each fixture is an image plus an optional <name>.json with the expected entries,
+used to score row recall. This calls the real Gemini API (GEMINI_API_KEY from .env)
+with the extraction cache disabled, so every run costs two extractions per image.
+"""
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+
+from benchmarks.common import load_fixtures, row_recall, percentile
+from services import extraction_cache
+from services.gemini_service import init_gemini, extract_ledger_data_from_bytes
+from services.image_preprocessing import preprocess_image
+
+def run_variant(fixture: dict, preprocess: bool) -> dict:
+    start = time.perf_counter()
+    sent, mime_type = fixture["content"], fixture["mime_type"]
+    if preprocess:
+        sent, mime_type = preprocess_image(sent, mime_type)
+    prep_seconds = time.perf_counter() - start
+    # Preprocessing already happened above, so it is timed as part of this variant.
+    data = extract_ledger_data_from_bytes(sent, mime_type, preprocess=False)
+    return {
+        "latency": time.perf_counter() - start,
+        "prep": prep_seconds,
+        "bytes": len(sent),
+        "rows": len(data.get("entries", [])),
+        "recall": row_recall(fixture["expected"], data.get("entries", [])) if fixture["expected"] is not None else None,
+    }
+
+def summarize(label: str, results: list[dict]):
+    latencies = [r["latency"] for r in results]
+    recalls = [r["recall"] for r in results if r["recall"] is not None]
+    print(
+        f"{label:<14} p50={percentile(latencies, 50):.2f}s p95={percentile(latencies, 95):.2f}s "
+        f"avg_bytes={sum(r['bytes'] for r in results) / len(results) / 1024:.0f}KB "
+        f"avg_prep={sum(r['prep'] for r in results) / len(results) * 1000:.0f}ms "
+        f"recall={(sum(recalls) / len(recalls)) if recalls else float('nan'):.3f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.fixtures):
+        sys.exit(f"Fixture directory not found: {args.fixtures}")
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        sys.exit(f"No images found in {args.fixtures}")
+
+    init_gemini()
+    extraction_cache.CACHE_ENABLED = False
+
+    raw, processed = [], []
+    for _ in range(args.repeat):
+        for fixture in fixtures:
+            raw_result = run_variant(fixture, preprocess=False)
+            processed_result = run_variant(fixture, preprocess=True)
+            raw.append(raw_result)
+            processed.append(processed_result)
+            print(
+                f"{fixture['name']}: raw {raw_result['latency']:.2f}s/{raw_result['bytes'] // 1024}KB/{raw_result['rows']} rows, "
+                f"processed {processed_result['latency']:.2f}s/{processed_result['bytes'] // 1024}KB/{processed_result['rows']} rows"
+            )
+
+    print()
+    summarize("unprocessed", raw)
+    summarize("preprocessed", processed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Measures cold-start cost of the API in fresh processes:
+
+    cd backend
+    python -m benchmarks.startup_benchmark --repeat 5
+    python -m benchmarks.startup_benchmark --warmup eager --workers 2
+
+- import: time to `import main`
+- ready: from launching uvicorn to the first 200 from GET /
+- first/second request: latency of the first two GET / once the port answers
+- sdk imports: what the first extraction or Sheets call pays for the lazily loaded
+  SDKs when STARTUP_WARMUP=lazy (or before the background warm-up has finished)
+
+Uses a throwaway records/cache database; no Google or Meta endpoint is called.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SDK_MODULES = ("google.generativeai", "googleapiclient.discovery", "openpyxl")
+
+def benchmark_env(workdir: str, warmup: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "startup-benchmark")
+    env.update({
+        "RECORDS_DB_PATH": os.path.join(workdir, "records.db"),
+        "EXTRACTION_CACHE_DB": os.path.join(workdir, "extraction_cache.db"),
+        "STARTUP_WARMUP": warmup,
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+def time_import(module: str, env: dict) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def get(url: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - start
+
+def time_server_start(env: dict, workers: int, timeout: float) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        command += ["--workers", str(workers)]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while True:
+            if process.poll() is not None:
+                sys.exit(f"uvicorn exited during startup:\n{process.stderr.read().decode()}")
+            if time.perf_counter() - start > timeout:
+                sys.exit(f"uvicorn not ready after {timeout}s")
+            try:
+                first = get(url)
+                break
+            except OSError:
+                time.sleep(0.01)
+        ready = time.perf_counter() - start
+        second = get(url)
+        return {"ready": ready, "first_request": first, "second_request": second}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def summarize(label: str, values: list[float]):
+    print(f"{label:<32} p50={percentile(values, 50) * 1000:>7.0f}ms  max={max(values) * 1000:>7.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", choices=("background", "eager", "lazy"), default="background", help="STARTUP_WARMUP for the server runs")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    results = {"import main": [], "ready (first 200)": [], "first request": [], "second request": []}
+    sdk_results = {module: [] for module in SDK_MODULES}
+    with tempfile.TemporaryDirectory(prefix="airstore_startup_") as workdir:
+        env = benchmark_env(workdir, args.warmup)
+        for i in range(args.repeat):
+            results["import main"].append(time_import("main", env))
+            server = time_server_start(env, args.workers, args.timeout)
+            results["ready (first 200)"].append(server["ready"])
+            results["first request"].append(server["first_request"])
+            results["second request"].append(server["second_request"])
+            for module in SDK_MODULES:
+                sdk_results[module].append(time_import(module, env))
+            print(f"run {i + 1}: import {results['import main'][-1]:.2f}s, ready {server['ready']:.2f}s")
+
+    print(f"\nSTARTUP_WARMUP={args.warmup}, workers={args.workers}, {args.repeat} runs")
+    for label, values in results.items():
+        summarize(label, values)
+    print("\nLazily imported SDKs (paid on first use)")
+    for module, values in sdk_results.items():
+        summarize(f"import {module}", values)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares whole-page and tiled extraction on long ledger pages.
+
+    cd backend
+    python -m benchmarks.tiling_benchmark --fixtures benchmarks/fixtures
+
+Only fixtures at least --min-aspect times taller than wide (after preprocessing) are used;
+each is extracted whole and as overlapping strips (EXTRACTION_TILES=always). Each fixture
+is an image plus an optional <name>.json with the expected entries, used to score row
+recall. This calls the real Gemini API (GEMINI_API_KEY from .env) with the extraction
+cache and page index disabled, so every run costs 1 + tiles extractions per image.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+os.environ["PAGE_DEDUP_MODE"] = "off"
+
+from benchmarks.common import load_fixtures, row_recall, percentile
+from services import extraction_cache, gemini_service, tiled_extraction
+from services.gemini_service import init_gemini, extract_ledger_data_from_bytes
+from services.image_preprocessing import preprocess_image
+
+def set_tiling(mode: str):
+    tiled_extraction.EXTRACTION_TILES = mode
+    gemini_service.EXTRACTION_TILES = mode
+
+def run_variant(fixture: dict, content: bytes, mime_type: str, mode: str) -> dict:
+    set_tiling(mode)
+    start = time.perf_counter()
+    data = extract_ledger_data_from_bytes(content, mime_type, preprocess=False)
+    return {
+        "latency": time.perf_counter() - start,
+        "rows": len(data.get("entries", [])),
+        "tiles": data.get("tiles", 1),
+        "overlap_duplicates": data.get("overlap_duplicates", 0),
+        "recall": row_recall(fixture["expected"], data.get("entries", [])) if fixture["expected"] is not None else None,
+    }
+
+def summarize(label: str, results: list[dict]):
+    latencies = [r["latency"] for r in results]
+    recalls = [r["recall"] for r in results if r["recall"] is not None]
+    print(
+        f"{label:<6} p50={percentile(latencies, 50):.2f}s p95={percentile(latencies, 95):.2f}s "
+        f"avg_rows={sum(r['rows'] for r in results) / len(results):.1f} "
+        f"avg_tiles={sum(r['tiles'] for r in results) / len(results):.1f} "
+        f"recall={(sum(recalls) / len(recalls)) if recalls else float('nan'):.3f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    parser.add_argument("--min-aspect", type=float, default=tiled_extraction.EXTRACTION_TILE_MIN_ASPECT,
+                        help="Skip fixtures less than this many times taller than wide")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.fixtures):
+        sys.exit(f"Fixture directory not found: {args.fixtures}")
+    from PIL import Image
+    pages = []
+    for fixture in load_fixtures(args.fixtures):
+        content, mime_type = preprocess_image(fixture["content"], fixture["mime_type"])
+        width, height = Image.open(io.BytesIO(content)).size
+        if height / width >= args.min_aspect:
+            pages.append((fixture, content, mime_type))
+        else:
+            print(f"{fixture['name']}: skipped, aspect {height / width:.2f}")
+    if not pages:
+        sys.exit(f"No fixtures in {args.fixtures} are at least {args.min_aspect} times taller than wide")
+
+    init_gemini()
+    extraction_cache.CACHE_ENABLED = False
+
+    whole, tiled = [], []
+    for _ in range(args.repeat):
+        for fixture, content, mime_type in pages:
+            whole_result = run_variant(fixture, content, mime_type, "off")
+            tiled_result = run_variant(fixture, content, mime_type, "always")
+            whole.append(whole_result)
+            tiled.append(tiled_result)
+            print(
+                f"{fixture['name']}: whole {whole_result['latency']:.2f}s/{whole_result['rows']} rows, "
+                f"tiled {tiled_result['latency']:.2f}s/{tiled_result['rows']} rows "
+                f"({tiled_result['tiles']} strips, {tiled_result['overlap_duplicates']} overlap rows dropped)"
+            )
+
+    print()
+    summarize("whole", whole)
+    summarize("tiled", tiled)
+
+if __name__ == "__main__":
+    main()
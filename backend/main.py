@@ -1,27 +1,89 @@
 import os
-import sqlite3
-import uuid
 import json
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+import time
+import asyncio
+import threading
+import mimetypes
+from email.utils import parsedate_to_datetime, format_datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-import os
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, Response
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
 from dotenv import load_dotenv
 
-# Explicitly load environment variables from the absolute path of the backend directory
+# Explicitly load environment variables from the absolute path of the backend directory.
+# Variables already set by the host (deployment config) take precedence over .env.
 env_path = os.path.join(os.path.dirname(__file__), ".env")
-load_dotenv(dotenv_path=env_path, override=True)
+load_dotenv(dotenv_path=env_path, override=False)
 
-from services.gemini_service import init_gemini, extract_ledger_data
-from services.sheets_service import append_to_sheet, create_and_append_sheet, export_sheet_to_xlsx
-from services.whatsapp_service import get_media_url, download_media, send_whatsapp_message, upload_whatsapp_media, send_whatsapp_document
+from services.gemini_service import init_gemini, extract_ledger_data_from_bytes, stream_ledger_extraction, get_latency_stats as get_gemini_latency_stats, warm_up as warm_up_gemini
+from services.extraction_cache import init_cache, get_cache_stats
+from services.database import start_maintenance_thread, stop_maintenance_thread
+from services.record_store import init_record_store, create_record, get_record_version, list_records as list_record_page, claim_for_confirm, release_claim, mark_confirmed, RECORD_STATUSES
+from services.idempotency import init_idempotency_store, claim_messages, finish_messages, release_messages
+from services.ledger_mirror import init_ledger_mirror, search_rows, summarize_rows, recent_rows as recent_rows_for_source
+from services.sender_batcher import SenderBatcher
+from services.metrics import observe_stage, start_trace, get_trace, recent_traces, render_metrics, STAGE_DURATION, ERRORS, EVENTS, QUEUE_DEPTH, TRACE_SPANS
+from services.admission import AdmissionRejected, check_capacity, waiting_admission, get_admission_stats
+from services.hedging import DeadlineExceeded
+from services.pdf_pages import split_pdf_pages
+from services.stage_graph import StageGraph
+from services.page_index import init_page_index, load_page_index, get_page_index_stats, remember_sent_pages, PAGE_DEDUP_MODE
+from services.image_preprocessing import shutdown_pool as shutdown_preprocess_pool
+from services.google_clients import get_pool_stats, warm_up as warm_up_google_clients
+from services.job_queue import init_job_queue, submit_job, get_job, watch_job, JobQueueFull
+from services.sheets_service import write_ledger_rows, export_sheet_to_xlsx_bytes, SHEETS_LAYOUT
+from services.sheet_partitions import init_sheet_partitions, list_partitions
+from services.xlsx_service import build_ledger_xlsx, XLSX_MIME_TYPE
+from services.whatsapp_async import get_media_url, download_media_bytes, send_whatsapp_message, upload_whatsapp_media_bytes, send_whatsapp_document, close_client as close_whatsapp_client
 import datetime
 
 WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "airstore_secure_token_123")
 
-# Initialize Gemini
-init_gemini()
+# The Gemini and Google API SDKs are imported on first use. STARTUP_WARMUP decides when that happens:
+#   background - on a thread right after startup, while the server already accepts requests
+#   eager      - during startup, before the first request is accepted
+#   lazy       - only when a request first needs them
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+
+def warm_up_clients():
+    for name, warm_up in (("gemini", warm_up_gemini), ("google_clients", warm_up_google_clients), ("page_index", load_page_index)):
+        start = time.perf_counter()
+        try:
+            warm_up()
+            print(f"Warmed up {name} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"Warm-up of {name} failed, it will be retried on first use: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only checks the key; nothing heavy happens at import time.
+    init_gemini()
+    # Idempotent schema setup, safe when several workers start at once.
+    init_record_store()
+    init_ledger_mirror()
+    init_sheet_partitions()
+    init_idempotency_store()
+    init_cache()
+    init_page_index()
+    init_job_queue()
+    start_maintenance_thread()
+
+    if STARTUP_WARMUP == "eager":
+        await run_in_threadpool(warm_up_clients)
+    elif STARTUP_WARMUP == "background":
+        threading.Thread(target=warm_up_clients, name="warm-up", daemon=True).start()
+
+    yield
 
-app = FastAPI(title="Handwritten Records to Google Sheets API")
+    # Images still waiting in a coalescing window are processed before the client closes
+    await image_batcher.drain()
+    await close_whatsapp_client()
+    shutdown_preprocess_pool()
+    stop_maintenance_thread()
+
+app = FastAPI(title="Handwritten Records to Google Sheets API", lifespan=lifespan)
 
 # Allow frontend to communicate with backend
 app.add_middleware(
@@ -32,114 +94,449 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DB_PATH = "records.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS records (
-            id TEXT PRIMARY KEY,
-            data TEXT,
-            status TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """
+    An external API is saturated: tell the client when to come back instead of failing with a 500.
+    """
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"AirStore is busy right now, please retry in {exc.retry_after} seconds.", "api": exc.api, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
-init_db()
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Times every request per route and, with TRACE_SPANS=1, ties all stages it runs to one trace id.
+    """
+    trace_id = start_trace("http", method=request.method, path=request.url.path)
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    endpoint = f"{request.method} {route.path if route else 'unmatched'}"
+    STAGE_DURATION.observe(time.perf_counter() - start, stage=f"http {endpoint}")
+    if trace_id:
+        response.headers["X-Trace-Id"] = trace_id
+    return response
 
 @app.get("/")
 def read_root():
     return {"message": "Handwritten Records API is running"}
 
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus exposition of per-stage and per-API latency histograms, error/retry counters and queue depths.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+def list_traces(limit: int = 50):
+    """
+    Most recent traces (requires TRACE_SPANS=1).
+    """
+    return {"enabled": TRACE_SPANS, "traces": recent_traces(max(1, min(limit, 500)))}
+
+@app.get("/traces/{trace_id}")
+def read_trace(trace_id: str):
+    trace = get_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters for the extraction cache in front of Gemini.
+    """
+    return get_cache_stats()
+
+@app.get("/page-index/stats")
+def page_index_stats():
+    """
+    Pages in the near-duplicate index, lookups and matches.
+    """
+    return get_page_index_stats()
+
+@app.get("/admission/stats")
+def admission_stats():
+    """
+    Slots in use, waiting callers and rejections per external API.
+    """
+    return get_admission_stats()
+
+@app.get("/gemini/latency")
+def gemini_latency():
+    """
+    Recent Gemini latency per model (and for uploads) and the delay after which a call is hedged.
+    """
+    return get_gemini_latency_stats()
+
+@app.get("/sheets/partitions")
+def sheets_partitions():
+    """
+    The local partition map: every partition tab written, with its spreadsheet, gid and row count.
+    """
+    return {"layout": SHEETS_LAYOUT, "partitions": list_partitions(os.getenv("GOOGLE_SHEET_ID", ""))}
+
+@app.get("/google-clients/stats")
+def google_client_stats():
+    """
+    Reuse counters for the pooled Sheets/Drive API clients.
+    """
+    return get_pool_stats()
+
+def save_pending_record(extracted_data: dict) -> str:
+    """
+    Stores an extraction as PENDING and returns its record_id.
+    """
+    return create_record(extracted_data, "PENDING")
+
+def extract_and_store(content: bytes, mime_type: str) -> dict:
+    """
+    Blocking part of an upload: Gemini extraction plus the PENDING insert.
+    Always runs on a worker thread, never on the event loop.
+    """
+    # 2. Process with Gemini
+    with observe_stage("extract"):
+        extracted_data = extract_ledger_data_from_bytes(content, mime_type)
+    
+    # 3. Handle invalid images
+    if not extracted_data.get("is_valid_ledger"):
+        return {"status": "error", "message": extracted_data.get("error_message")}
+    
+    # 4. Save to DB temporarily
+    record_id = save_pending_record(extracted_data)
+    
+    return {
+        "status": "success",
+        "record_id": record_id,
+        "data": extracted_data
+    }
+
+def extract_and_store_queued(content: bytes, mime_type: str) -> dict:
+    """
+    extract_and_store for queued jobs: waits for Gemini capacity instead of being rejected.
+    """
+    with waiting_admission():
+        return extract_and_store(content, mime_type)
+
+def upload_mime_type(file: UploadFile) -> str:
+    if file.content_type and file.content_type != "application/octet-stream":
+        return file.content_type
+    return mimetypes.guess_type(file.filename or "")[0] or "image/jpeg"
+
 @app.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
     """
     Receives an image, extracts data via Gemini, and stores it as PENDING.
+    The image is only ever held in memory and is never written to disk.
     """
-    # 1. Save uploaded file temporarily
-    file_id = str(uuid.uuid4())
-    temp_path = f"temp_{file_id}_{file.filename}"
+    # Answer 429 straight away when Gemini already has a full wait queue
+    check_capacity("gemini")
+
+    # 1. Read the uploaded file into memory
+    content = await file.read()
     
     try:
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-            
-        # 2. Process with Gemini
-        extracted_data = extract_ledger_data(temp_path)
-        
-        # 3. Handle invalid images
-        if not extracted_data.get("is_valid_ledger"):
-             # Clean up
-             os.remove(temp_path)
-             return {"status": "error", "message": extracted_data.get("error_message")}
-        
-        # 4. Save to DB temporarily
-        record_id = str(uuid.uuid4())
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO records (id, data, status) VALUES (?, ?, ?)", 
-                       (record_id, json.dumps(extracted_data), "PENDING"))
-        conn.commit()
-        conn.close()
-        
-        # 5. Clean up local image file (Security/Privacy)
-        os.remove(temp_path)
-        
-        return {
-            "status": "success",
-            "record_id": record_id,
-            "data": extracted_data
-        }
+        return await run_in_threadpool(extract_and_store, content, upload_mime_type(file))
         
+    except AdmissionRejected:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Gemini did not answer in time, please retry. ({e})")
     except Exception as e:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/upload/jobs", status_code=202)
+async def upload_image_job(file: UploadFile = File(...)):
+    """
+    Queues an image for extraction and returns a job id immediately.
+    Poll GET /jobs/{job_id} or subscribe to GET /jobs/{job_id}/events for the result,
+    which has the same shape as the /upload response.
+    """
+    content = await file.read()
+    try:
+        job_id = submit_job(extract_and_store_queued, content, upload_mime_type(file))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "100"))
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def merge_page_extractions(pages: list[dict]) -> dict:
+    """
+    Merges per-page extractions (in page order) into the single record stored for a batch.
+    """
+    entries = []
+    for page in pages:
+        entries.extend(page.get("entries", []))
+    return {
+        "is_valid_ledger": bool(entries),
+        "error_message": "" if entries else "No valid ledger entries found in any page.",
+        "entries": entries,
+        "pages": [
+            {k: page[k] for k in ("page", "source", "status", "entry_count", "error", "page_hash") if k in page}
+            for page in pages
+        ]
+    }
+
+def sent_page_extractions(record_data: dict) -> list[dict]:
+    """
+    The pages of a stored record to remember once it is confirmed: the record itself for a
+    single upload, or each page of a batch with its slice of the merged entries.
+    """
+    if "pages" not in record_data:
+        return [record_data]
+    pages, offset = [], 0
+    entries = record_data.get("entries", [])
+    for page in record_data["pages"]:
+        count = page.get("entry_count", 0)
+        if page.get("page_hash"):
+            pages.append({"is_valid_ledger": True, "error_message": "", "entries": entries[offset:offset + count], "page_hash": page["page_hash"]})
+        offset += count
+    return pages
+
+@app.post("/upload/batch")
+async def upload_batch(files: list[UploadFile] = File(...)):
+    """
+    Accepts many images and/or multi-page PDFs, extracts every page concurrently
+    (at most BATCH_MAX_CONCURRENCY at a time) and streams per-page results as
+    Server-Sent Events as they finish. The merged entries are stored as one PENDING
+    record, so a single /confirm writes the whole book.
+    """
+    check_capacity("gemini")
+    pages = []
+    for file in files:
+        content = await file.read()
+        mime_type = upload_mime_type(file)
+        if mime_type == "application/pdf":
+            try:
+                pdf_pages = await run_in_threadpool(split_pdf_pages, content)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Could not read PDF {file.filename}: {e}")
+            for i, page_bytes in enumerate(pdf_pages):
+                pages.append((f"{file.filename}#page={i + 1}", page_bytes, mime_type))
+        else:
+            pages.append((file.filename, content, mime_type))
+
+    if not pages:
+        raise HTTPException(status_code=400, detail="No pages uploaded")
+    if len(pages) > BATCH_MAX_PAGES:
+        raise HTTPException(status_code=400, detail=f"Too many pages ({len(pages)}), the limit is {BATCH_MAX_PAGES}")
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def extract_page(page_number: int, source: str, content: bytes, mime_type: str) -> dict:
+        result = {"page": page_number, "source": source, "status": "success", "entry_count": 0, "error": "", "entries": []}
+        async with semaphore:
+            try:
+                with observe_stage("extract"):
+                    extracted = await run_in_threadpool(extract_ledger_data_from_bytes, content, mime_type)
+            except Exception as e:
+                result.update(status="failed", error=str(e))
+                return result
+        if not extracted.get("is_valid_ledger"):
+            result.update(status="invalid", error=extracted.get("error_message", ""))
+        else:
+            result.update(entries=extracted.get("entries", []), entry_count=len(extracted.get("entries", [])))
+            if extracted.get("page_hash"):
+                result["page_hash"] = extracted["page_hash"]
+        return result
+
+    async def event_stream():
+        tasks = [
+            asyncio.create_task(extract_page(i + 1, source, content, mime_type))
+            for i, (source, content, mime_type) in enumerate(pages)
+        ]
+        finished = []
+        try:
+            yield sse_event("started", {"total_pages": len(pages)})
+            for next_done in asyncio.as_completed(tasks):
+                page = await next_done
+                finished.append(page)
+                yield sse_event("page", page)
+
+            finished.sort(key=lambda p: p["page"])
+            merged = merge_page_extractions(finished)
+            if not merged["is_valid_ledger"]:
+                yield sse_event("done", {"status": "error", "message": merged["error_message"], "data": merged})
+                return
+            record_id = await run_in_threadpool(save_pending_record, merged)
+            yield sse_event("done", {"status": "success", "record_id": record_id, "data": merged})
+        finally:
+            # Client went away: stop the pages that have not started yet.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/upload/stream")
+async def upload_image_stream(file: UploadFile = File(...)):
+    """
+    Same as /upload, but streams the extraction as Server-Sent Events while Gemini writes it:
+    - entry: one row, as soon as it is complete
+    - restart: drop the rows received so far, a stronger model is re-reading the page
+    - done: the full extraction and its PENDING record_id, exactly as /upload returns them
+    """
+    check_capacity("gemini")
+    content = await file.read()
+    mime_type = upload_mime_type(file)
+
+    async def event_stream():
+        start = time.perf_counter()
+        first_entry = True
+        extracted = None
+        try:
+            with observe_stage("extract_stream"):
+                async for kind, payload in iterate_in_threadpool(stream_ledger_extraction(content, mime_type)):
+                    if kind == "done":
+                        extracted = payload
+                        continue
+                    if kind == "entry" and first_entry:
+                        first_entry = False
+                        STAGE_DURATION.observe(time.perf_counter() - start, stage="stream_first_entry")
+                    yield sse_event(kind, payload)
+
+            if not extracted.get("is_valid_ledger"):
+                yield sse_event("done", {"status": "error", "message": extracted.get("error_message")})
+                return
+            record_id = await run_in_threadpool(save_pending_record, extracted)
+            yield sse_event("done", {"status": "success", "record_id": record_id, "data": extracted})
+        except Exception as e:
+            print("Streaming extraction failed:", e)
+            yield sse_event("done", {"status": "error", "message": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """
+    Polling endpoint for an extraction job.
+    """
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_status(job_id: str):
+    """
+    Server-Sent Events stream of job status changes; closes once the job is done or failed.
+    """
+    if not await run_in_threadpool(get_job, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for job in watch_job(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event(job["status"], job)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def is_not_modified(request: Request, version: dict) -> bool:
+    """
+    Conditional GET check: If-None-Match when the client sent one, else If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or version["etag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and version["modified_at"]:
+        try:
+            return version["modified_at"].replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_json(request: Request, body: dict, version: dict) -> Response:
+    """
+    The JSON body with ETag/Last-Modified (from a record_store version), or an empty 304
+    when the client's copy is current.
+    """
+    headers = {"ETag": version["etag"], "Cache-Control": "no-cache"}
+    modified_at = version["modified_at"]
+    # Last-Modified has whole seconds. It is only sent once the second of the change is
+    # over, so a later change can never fall in the second a client sends back.
+    if modified_at and datetime.datetime.now(datetime.timezone.utc) >= modified_at.replace(microsecond=0) + datetime.timedelta(seconds=1):
+        headers["Last-Modified"] = format_datetime(modified_at, usegmt=True)
+    if is_not_modified(request, version):
+        EVENTS.inc(event="not_modified")
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
 @app.get("/record/{record_id}")
-def get_record(record_id: str):
+def get_record(record_id: str, request: Request):
     """
     Fetches a pending record for the frontend confirmation screen.
+    Polls of an unchanged record are answered from memory, with 304 when the client sends
+    the ETag (If-None-Match) or Last-Modified (If-Modified-Since) it already has.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT data, status FROM records WHERE id = ?", (record_id,))
-    row = cursor.fetchone()
-    conn.close()
+    record = get_record_version(record_id)
     
-    if not row:
+    if not record:
         raise HTTPException(status_code=404, detail="Record not found")
         
-    return {"record_id": record_id, "status": row[1], "data": json.loads(row[0])}
+    body = {"record_id": record_id, "status": record["status"], "data": record["data"]}
+    return conditional_json(request, body, record)
+
+@app.get("/records")
+def list_records(request: Request, status: str = "", limit: int = 50, cursor: str = "", with_data: bool = False):
+    """
+    Lists records newest first, optionally with one status (PENDING, SYNCING, CONFIRMED),
+    up to `limit` (max 200) per page. Pass `next_cursor` back as `cursor` for the next page.
+    Each record has its entry count; with_data=true adds the full extraction.
+    Answers 304 to a matching If-None-Match; lists carry no Last-Modified (see list_records).
+    """
+    status = status.upper()
+    if status and status not in RECORD_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status {status}, expected one of {', '.join(RECORD_STATUSES)}")
+    try:
+        page = list_record_page(status, limit, cursor, with_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return conditional_json(request, {"records": page["records"], "next_cursor": page["next_cursor"]}, page)
 
 @app.post("/confirm/{record_id}")
 def confirm_record(record_id: str, verified_data: dict):
     """
     Receives confirmed and potentially edited data from the user and appends to Google Sheets.
     """
-    # Verify record is PENDING
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT status FROM records WHERE id = ?", (record_id,))
-    row = cursor.fetchone()
+    # Format data for Sheets
+    entries = verified_data.get("entries", [])
+
+    # Verify record is PENDING and claim it, so no DB connection is held during the Sheets call
+    claim = claim_for_confirm(record_id)
     
-    if not row:
-         conn.close()
+    if claim is None:
          raise HTTPException(status_code=404, detail="Record not found")
          
-    if row[0] == "CONFIRMED":
-         conn.close()
+    if claim == "CONFIRMED":
          raise HTTPException(status_code=400, detail="Record already confirmed")
+
+    if claim == "SYNCING":
+         raise HTTPException(status_code=409, detail="Record is already being confirmed")
          
-    # Format data for Sheets
-    entries = verified_data.get("entries", [])
     if not entries:
-        conn.close()
+        release_claim(record_id)
         raise HTTPException(status_code=400, detail="No entries provided to save")
+
+    # The extraction as uploaded, with its page hashes (verified_data may not carry them)
+    stored = get_record_version(record_id)
         
     sheet_rows = []
     for entry in entries:
@@ -157,31 +554,65 @@ def confirm_record(record_id: str, verified_data: dict):
         if not sheet_id:
              raise ValueError("GOOGLE_SHEET_ID not set")
              
-        timestamp_str = datetime.datetime.now().strftime("%Y-%b-%d_%H%M")
-        new_tab_name = f"WebLog_{timestamp_str}"
-        
-        # Create a new tab uniquely for this web upload
-        new_gid = create_and_append_sheet(sheet_id, new_tab_name, sheet_rows)
+        # A new WebLog_ tab for this upload, or the current WebLog_ partition (SHEETS_LAYOUT)
+        with observe_stage("create_and_append_sheet"):
+            target_id, tab_name, new_gid = write_ledger_rows(sheet_id, "WebLog", sheet_rows, "web")
         
-        sheet_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/edit#gid={new_gid}"
+        sheet_url = f"https://docs.google.com/spreadsheets/d/{target_id}/edit#gid={new_gid}"
         
         # Mark as confirmed
-        cursor.execute("UPDATE records SET status = 'CONFIRMED', data = ? WHERE id = ?", (json.dumps(verified_data), record_id))
-        conn.commit()
-        conn.close()
+        mark_confirmed(record_id, verified_data)
+        # Only now are these pages "already sent"
+        if stored:
+            remember_sent_pages(sent_page_extractions(stored["data"]))
         
-        return {"status": "success", "message": "Data saved to unique Google Sheets tab", "sheet_url": sheet_url, "entries": entries}
+        return {"status": "success", "message": f"Data saved to Google Sheets tab {tab_name}", "sheet_url": sheet_url, "entries": entries}
         
+    except AdmissionRejected:
+        # Sheets is saturated: the record stays PENDING so the user can simply retry
+        release_claim(record_id)
+        raise
     except Exception as e:
-        conn.close()
+        release_claim(record_id)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ledger/search")
+def search_ledger(q: str = "", name: str = "", status: str = "", date_from: str = "", date_to: str = "",
+                  source: str = "", limit: int = 50, before_id: int | None = None):
+    """
+    Searches every row ever synced to Google Sheets, answered from the local mirror.
+    Dates are ISO (YYYY-MM-DD). Page with before_id = the last row id of the previous page.
+    """
+    limit = max(1, min(limit, 500))
+    rows = search_rows(limit=limit, before_id=before_id, name=name, query=q, status=status,
+                       date_from=date_from, date_to=date_to, source=source)
+    next_before_id = rows[-1]["id"] if len(rows) == limit else None
+    return {"rows": rows, "next_before_id": next_before_id}
+
+@app.get("/ledger/summary")
+def summarize_ledger(name: str = "", q: str = "", status: str = "", date_from: str = "", date_to: str = "",
+                     month: str = "", source: str = "", group_by: str = ""):
+    """
+    Count and total amount over synced rows, e.g. ?name=Ramesh&month=2026-10 for
+    "total owed by Ramesh this month". group_by may be name, day or month.
+    """
+    if month:
+        try:
+            first_day = datetime.datetime.strptime(month, "%Y-%m").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+        next_month = (first_day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        date_from = first_day.isoformat()
+        date_to = (next_month - datetime.timedelta(days=1)).isoformat()
+    if group_by and group_by not in ("name", "day", "month"):
+        raise HTTPException(status_code=400, detail="group_by must be name, day or month")
+    return summarize_rows(group_by=group_by, name=name, query=q, status=status,
+                          date_from=date_from, date_to=date_to, source=source)
+
 # ==========================================
 # WHATSAPP WEBHOOK INTEGRATION
 # ==========================================
 
-from fastapi import Request
-from fastapi.responses import PlainTextResponse
 
 @app.get("/webhook")
 async def verify_webhook(request: Request):
@@ -209,68 +640,220 @@ async def receive_whatsapp_message(request: Request, background_tasks: Backgroun
     """
     body = await request.json()
     
-    # 1. Parse incoming message structure
+    # 1. Parse incoming message structure: a payload can batch several entries, changes and messages
     try:
-        entries = body.get("entry", [])
-        if not entries: return {"status": "success"}
-        
-        changes = entries[0].get("changes", [])
-        if not changes: return {"status": "success"}
-        
-        value = changes[0].get("value", {})
-        messages = value.get("messages", [])
+        messages = [
+            message
+            for entry in body.get("entry", [])
+            for change in entry.get("changes", [])
+            for message in change.get("value", {}).get("messages", [])
+        ]
         if not messages: return {"status": "success"} # Could be a status update (read/delivered)
         
-        message = messages[0]
-        sender_phone = message.get("from")
-        msg_type = message.get("type")
+        # 2. Drop messages already handled by an earlier (retried) delivery
+        message_ids = [m["id"] for m in messages if m.get("id")]
+        new_ids = await run_in_threadpool(claim_messages, message_ids) if message_ids else set()
+        answered_ids = []
         
-        if msg_type != "image":
-            # Just reply saying we only accept images for now
-            background_tasks.add_task(send_whatsapp_message, sender_phone, "👋 Welcome to AirStore! Please send a clear photo of your handwritten ledger/record to automatically digitize it into Google Sheets.")
-            return {"status": "success"}
+        for message in messages:
+            message_id = message.get("id")
+            if message_id:
+                if message_id not in new_ids:
+                    print(f"Skipping duplicate WhatsApp message {message_id}")
+                    EVENTS.inc(event="webhook_duplicate")
+                    continue
+                # The same id twice in one payload is only handled once
+                new_ids.discard(message_id)
             
-        print(f"Received Image from {sender_phone}...")
-        image_data = message.get("image", {})
-        media_id = image_data.get("id")
-        
-        # We process the heavy extraction in the background to not timeout Meta's webhook
-        background_tasks.add_task(process_whatsapp_image, media_id, sender_phone)
+            sender_phone = message.get("from")
+            msg_type = message.get("type")
+            
+            if msg_type != "image":
+                # Just reply saying we only accept images for now
+                background_tasks.add_task(send_whatsapp_message, sender_phone, "👋 Welcome to AirStore! Please send a clear photo of your handwritten ledger/record to automatically digitize it into Google Sheets.")
+                if message_id:
+                    answered_ids.append(message_id)
+                continue
+                
+            print(f"Received Image from {sender_phone}...")
+            image_data = message.get("image", {})
+            media_id = image_data.get("id")
+            
+            # We process the heavy extraction in the background to not timeout Meta's webhook
+            if WHATSAPP_COALESCE_WINDOW_SECONDS > 0:
+                image_batcher.add(sender_phone, (media_id, message_id))
+            else:
+                background_tasks.add_task(process_claimed_images, sender_phone, [(media_id, message_id)])
+
+        if answered_ids:
+            await run_in_threadpool(finish_messages, answered_ids)
         
     except Exception as e:
         print("Webhook Error:", e)
         
     return {"status": "success"}
 
-def process_whatsapp_image(media_id: str, sender_phone: str):
+# What the WhatsApp reply document contains:
+#   full    - the whole spreadsheet exported through Drive (slowest, grows with every upload)
+#   entries - only the rows extracted from this image, built locally
+#   recent  - this sender's last WHATSAPP_REPLY_RECENT_ROWS rows, built locally
+WHATSAPP_REPLY_XLSX_MODE = os.getenv("WHATSAPP_REPLY_XLSX_MODE", "full")
+WHATSAPP_REPLY_RECENT_ROWS = int(os.getenv("WHATSAPP_REPLY_RECENT_ROWS", "200"))
+# How the WhatsApp pipeline runs its steps: "dag" overlaps independent ones (see StageGraph),
+# "sequential" runs them one after another (the reference the benchmark compares against).
+WHATSAPP_PIPELINE = os.getenv("WHATSAPP_PIPELINE", "dag")
+REPLY_PROGRESS_MESSAGES = {
+    "full": "📥 Data extracted! Downloading updated Excel file directly from Google Sheets...",
+    "entries": "📥 Data extracted! Preparing your Excel file...",
+    "recent": "📥 Data extracted! Preparing your Excel file with your latest entries...",
+}
+
+# Images from one sender arriving within this window are processed as one batch (0 disables).
+WHATSAPP_COALESCE_WINDOW_SECONDS = float(os.getenv("WHATSAPP_COALESCE_WINDOW_SECONDS", "0"))
+WHATSAPP_COALESCE_MAX_WAIT_SECONDS = float(os.getenv("WHATSAPP_COALESCE_MAX_WAIT_SECONDS", "30"))
+WHATSAPP_COALESCE_MAX_IMAGES = int(os.getenv("WHATSAPP_COALESCE_MAX_IMAGES", "10"))
+
+def whatsapp_source(sender_phone: str) -> str:
+    return f"whatsapp:{sender_phone}"
+
+def add_reply_xlsx_stage(graph: StageGraph, sheet_rows: list[list[str]], timestamp_str: str):
+    """
+    Adds the "build_reply_xlsx" stage, which produces the reply .xlsx in memory according to
+    WHATSAPP_REPLY_XLSX_MODE and returns (xlsx bytes, caption line describing the file).
+    Only the full export has to wait for the Sheets write; the other modes are built from
+    local data while the write is still running.
+    """
+    if WHATSAPP_REPLY_XLSX_MODE == "entries":
+        async def build_entries():
+            content = await run_in_threadpool(build_ledger_xlsx, sheet_rows, f"Log_{timestamp_str}")
+            return content, "Here are the extracted entries as an Excel file."
+        graph.add("build_reply_xlsx", build_entries)
+        return
+
+    if WHATSAPP_REPLY_XLSX_MODE == "recent":
+        async def build_recent(earlier_rows: list[list[str]]):
+            # The sender's rows from the local ledger mirror as they were before this write, plus the new ones
+            recent_rows = (earlier_rows + sheet_rows)[-WHATSAPP_REPLY_RECENT_ROWS:]
+            content = await run_in_threadpool(build_ledger_xlsx, recent_rows, "Recent Entries")
+            return content, f"Here are your latest {len(recent_rows)} entries as an Excel file."
+        graph.add("build_reply_xlsx", build_recent, "read_recent_rows")
+        return
+
+    # E. Export the entire requested sheet (now with new tab) as Excel
+    async def export_full(written: tuple):
+        # After a partition rollover the rows went to a new spreadsheet, which is the one exported
+        content = await run_in_threadpool(export_sheet_to_xlsx_bytes, written[0])
+        return content, "Here is your full updated Google Sheet file."
+    graph.add("build_reply_xlsx", export_full, "create_and_append_sheet")
+
+async def fetch_and_extract(media_id: str) -> dict:
+    """
+    Downloads one WhatsApp image and extracts it. Returns the extraction; raises on download errors.
+    """
+    # B. Download Media
+    with observe_stage("get_media_url"):
+        media_url = await get_media_url(media_id)
+    if not media_url: raise ValueError("Could not get media URL")
+    
+    with observe_stage("download_media"):
+        image_bytes, mime_type = await download_media_bytes(media_url)
+    if not image_bytes: raise ValueError("Could not download image")
+    
+    # C. Extract Data via Gemini
+    with observe_stage("extract"):
+        return await run_in_threadpool(extract_ledger_data_from_bytes, image_bytes, mime_type)
+
+async def process_whatsapp_image(media_id: str, sender_phone: str) -> bool:
     """
     Background worker to download, extract, and push the image to Sheets.
     """
+    return await process_whatsapp_images(sender_phone, [media_id])
+
+async def process_claimed_images(sender_phone: str, items: list[tuple[str, str | None]]):
+    """
+    Runs the pipeline for image messages claimed by the webhook, as (media id, message id)
+    pairs. Their ids count as handled only once the pipeline succeeds; on failure the claims
+    are released so a redelivery of the same messages is processed again.
+    """
+    message_ids = [message_id for _, message_id in items if message_id]
+    handled = False
     try:
-        # A. Send "Processing" message
-        send_whatsapp_message(sender_phone, "⏳ Extracting your ledger with AirStore AI... Please wait a moment.")
+        handled = await process_whatsapp_images(sender_phone, [media_id for media_id, _ in items])
+    finally:
+        if message_ids:
+            await run_in_threadpool(finish_messages if handled else release_messages, message_ids)
+
+async def process_whatsapp_images(sender_phone: str, media_ids: list[str]) -> bool:
+    """
+    Background worker to download, extract, and push one or more images from the same
+    sender to Sheets. Images are extracted concurrently; their entries go into a single
+    new tab and are answered with a single Excel document.
+    The steps run as a StageGraph: status messages go out alongside the work instead of
+    before it, and the reply document is prepared while Sheets is written where the
+    reply mode allows. Messages to the sender still arrive in order.
+    Graph API calls share one keep-alive pool; blocking Gemini/Sheets/Drive work runs on a worker thread.
+    Returns False when processing failed with an error, True once the sender got an answer.
+    """
+    image_count = len(media_ids)
+    start_trace("whatsapp", sender=sender_phone, media_ids=media_ids)
+    pipeline_start = time.perf_counter()
+    graph = StageGraph(sequential=WHATSAPP_PIPELINE == "sequential")
+
+    async def reply(message: str):
+        # Never overtake a status message still on its way
+        await graph.settle("status_message", "progress_message")
+        await send_whatsapp_message(sender_phone, message)
+
+    # Webhook work has no user waiting on an HTTP response: queue for Gemini/Sheets/Drive capacity rather than fail.
+    with waiting_admission():
+        try:
+            # A. Send "Processing" message, without holding up the download and extraction
+            if image_count == 1:
+                status = "⏳ Extracting your ledger with AirStore AI... Please wait a moment."
+            else:
+                status = f"⏳ Extracting your {image_count} ledger photos with AirStore AI... Please wait a moment."
+            graph.add("status_message", lambda: send_whatsapp_message(sender_phone, status))
         
-        # B. Download Media
-        media_url = get_media_url(media_id)
-        if not media_url: raise ValueError("Could not get media URL")
+            graph.add("extract_images", lambda: asyncio.gather(*(fetch_and_extract(media_id) for media_id in media_ids), return_exceptions=True))
+            results = await graph.result("extract_images")
         
-        local_image_path = download_media(media_url)
-        if not local_image_path: raise ValueError("Could not download image")
+            entries = []
+            problems = []
+            notes = []
+            for page, result in enumerate(results, start=1):
+                if isinstance(result, Exception):
+                    print(f"Processing Error ({media_ids[page - 1]}):", result)
+                    problems.append(f"Photo {page}: could not be processed")
+                elif not result.get("is_valid_ledger"):
+                    problems.append(f"Photo {page}: {result.get('error_message')}")
+                elif result.get("duplicate_of") and PAGE_DEDUP_MODE == "reuse":
+                    # Its rows are already in the sheet from the first time this page was sent
+                    problems.append(f"Photo {page}: already sent on {result['duplicate_of']['first_seen']}, not added again")
+                else:
+                    entries.extend(result.get("entries", []))
+                    if result.get("duplicate_of"):
+                        notes.append(f"Photo {page} looks like a page already sent on {result['duplicate_of']['first_seen']}; check for repeated rows.")
         
-        try:
-            # C. Extract Data via Gemini
-            extracted_data = extract_ledger_data(local_image_path)
+            if image_count == 1 and isinstance(results[0], Exception):
+                raise results[0]
+            if image_count == 1 and not results[0].get("is_valid_ledger"):
+                await reply(f"❌ Validation failed: {results[0].get('error_message')}")
+                return True
             
-            if not extracted_data.get("is_valid_ledger"):
-                send_whatsapp_message(sender_phone, f"❌ Validation failed: {extracted_data.get('error_message')}")
-                return
-                
-            entries = extracted_data.get("entries", [])
+            if image_count == 1 and problems:
+                # Only a reused duplicate gets this far with a problem
+                first_seen = results[0]["duplicate_of"]["first_seen"]
+                await reply(f"♻️ This page was already sent on {first_seen}. Its entries are in your sheet, so it was not added again.")
+                return True
+
             if not entries:
-                send_whatsapp_message(sender_phone, "⚠️ Could not find any valid entries in the image.")
-                return
-                
-            # D. Push to Google Sheets in a NEW Tab
+                message = "⚠️ Could not find any valid entries in the image."
+                if image_count > 1:
+                    message = "⚠️ Could not find any valid entries in your photos.\n\n" + "\n".join(problems)
+                await reply(message)
+                return True
+            
+            # D. Push to Google Sheets
             sheet_rows = []
             for entry in entries:
                 sheet_rows.append([
@@ -279,39 +862,71 @@ def process_whatsapp_image(media_id: str, sender_phone: str):
                     str(entry.get("amount", "")),
                     str(entry.get("status", ""))
                 ])
-                
+            
             sheet_id = os.getenv("GOOGLE_SHEET_ID")
             timestamp_str = datetime.datetime.now().strftime("%Y-%b-%d_%H%M")
-            new_tab_name = f"Log_{timestamp_str}"
-            
-            # Create tab and append rows
-            create_and_append_sheet(sheet_id, new_tab_name, sheet_rows)
-            
-            # E. Export the entire requested sheet (now with new tab) as Excel
-            send_whatsapp_message(sender_phone, "📥 Data extracted! Downloading updated Excel file directly from Google Sheets...")
-            
-            excel_path = f"AirStore_Ledger_{timestamp_str}.xlsx"
-            export_sheet_to_xlsx(sheet_id, excel_path)
-            
+            source = whatsapp_source(sender_phone)
+
+            if WHATSAPP_REPLY_XLSX_MODE == "recent":
+                # Read before the write, so the reply can be built while it runs
+                graph.add("read_recent_rows", lambda: run_in_threadpool(recent_rows_for_source, source, WHATSAPP_REPLY_RECENT_ROWS))
+        
+            # Pages count as already sent only once their rows are in the sheet
+            sent_pages = [r for r in results if not isinstance(r, Exception) and r.get("page_hash")]
+
+            def write_rows():
+                written = write_ledger_rows(sheet_id, "Log", sheet_rows, source)
+                remember_sent_pages(sent_pages)
+                return written
+
+            # A new Log_ tab, or the current Log_ partition. After a rollover the full export reads the new spreadsheet.
+            graph.add("create_and_append_sheet", lambda: run_in_threadpool(write_rows))
+        
+            # E. Build the reply Excel file in memory
+            progress = REPLY_PROGRESS_MESSAGES.get(WHATSAPP_REPLY_XLSX_MODE, REPLY_PROGRESS_MESSAGES["full"])
+            graph.add("progress_message", lambda: send_whatsapp_message(sender_phone, progress), wait_for=("status_message",))
+        
+            excel_name = f"AirStore_Ledger_{timestamp_str}.xlsx"
+            add_reply_xlsx_stage(graph, sheet_rows, timestamp_str)
+        
             # F. Upload Media to WhatsApp Meta API
-            media_id = upload_whatsapp_media(excel_path, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            if not media_id:
-                raise ValueError("Failed to upload Excel file to WhatsApp")
-            
-            # G. Send Document
+            async def upload_reply(built: tuple) -> str:
+                media_id = await upload_whatsapp_media_bytes(built[0], excel_name, XLSX_MIME_TYPE)
+                if not media_id:
+                    raise ValueError("Failed to upload Excel file to WhatsApp")
+                return media_id
+            graph.add("upload_reply_media", upload_reply, "build_reply_xlsx")
+        
+            # G. Send Document, once the rows are safely in Sheets
             total_items = len(entries)
             total_amount = sum([float(str(e.get("amount", 0)).replace(',','')) for e in entries if str(e.get("amount", 0)).replace(',','').replace('.','').isdigit()])
-            caption = f"✅ *Extraction Complete!*\n\nProcessed {total_items} entries (Total: {total_amount}).\n\nHere is your full updated Google Sheet file."
-            
-            send_whatsapp_document(sender_phone, media_id, excel_path, caption)
-            
+            processed_note = f" from {image_count - len(problems)} photos" if image_count > 1 else ""
+
+            async def send_reply(written: tuple, built: tuple, media_id: str):
+                caption = f"✅ *Extraction Complete!*\n\nProcessed {total_items} entries{processed_note} (Total: {total_amount}).\n\n{built[1]}"
+                if problems:
+                    caption += "\n\nSkipped:\n" + "\n".join(problems)
+                if notes:
+                    caption += "\n\n⚠️ " + "\n⚠️ ".join(notes)
+                await send_whatsapp_document(sender_phone, media_id, excel_name, caption)
+            graph.add("send_reply_document", send_reply, "create_and_append_sheet", "build_reply_xlsx", "upload_reply_media",
+                      wait_for=("progress_message",))
+            await graph.result("send_reply_document")
+            return True
+        
+        except Exception as e:
+            print("Processing Error:", e)
+            ERRORS.inc(source="whatsapp_pipeline")
+            await reply("⚠️ Sorry, an error occurred while processing your image. Please try again.")
+            return False
         finally:
-            # Always clean up temporary images and generated excel files
-            if os.path.exists(local_image_path):
-                os.remove(local_image_path)
-            if 'excel_path' in locals() and os.path.exists(excel_path):
-                os.remove(excel_path)
-                
-    except Exception as e:
-        print("Processing Error:", e)
-        send_whatsapp_message(sender_phone, "⚠️ Sorry, an error occurred while processing your image. Please try again.")
+            await graph.close()
+            STAGE_DURATION.observe(time.perf_counter() - pipeline_start, stage="whatsapp_pipeline")
+
+image_batcher = SenderBatcher(
+    process_claimed_images,
+    window_seconds=WHATSAPP_COALESCE_WINDOW_SECONDS,
+    max_wait_seconds=WHATSAPP_COALESCE_MAX_WAIT_SECONDS,
+    max_batch=WHATSAPP_COALESCE_MAX_IMAGES,
+)
+QUEUE_DEPTH.set_function(image_batcher.pending_count, queue="whatsapp_coalescer")
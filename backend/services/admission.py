@@ -0,0 +1,252 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from services.metrics import STAGE_DURATION, EVENTS, QUEUE_DEPTH
+
+# Per-API defaults: requests per second (0 = no rate limit), burst, concurrent calls, callers allowed to queue.
+# Sheets allows 60 write requests per minute per user, and the service account is a single user.
+ADMISSION_DEFAULTS = {
+    "gemini": {"rate": 15, "burst": 30, "concurrency": 16, "queue": 64},
+    "sheets": {"rate": 1, "burst": 10, "concurrency": 4, "queue": 100},
+    "drive": {"rate": 5, "burst": 10, "concurrency": 4, "queue": 50},
+    "graph": {"rate": 50, "burst": 80, "concurrency": 32, "queue": 500},
+}
+
+# How long an interactive request may wait for a slot before it is answered with 503.
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+# After an upstream 429, no new calls to that API start for this long.
+ADMISSION_THROTTLE_SECONDS = float(os.getenv("ADMISSION_THROTTLE_SECONDS", "2"))
+
+_waits = contextvars.ContextVar("airstore_admission_waits", default=False)
+
+class AdmissionRejected(Exception):
+    """
+    An external API is at capacity. status_code is 429 when its wait queue is full and
+    503 when the wait took too long; retry_after is a hint in seconds.
+    """
+
+    def __init__(self, api: str, reason: str, retry_after: int):
+        super().__init__(f"{api} is at capacity ({reason}), retry in {retry_after}s")
+        self.api = api
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = 429 if reason == "queue_full" else 503
+
+class Limiter:
+    """
+    Token bucket plus concurrency cap for one external API, with a bounded wait queue.
+    Background callers wait as long as it takes; interactive callers are rejected when
+    the queue is full or after ADMISSION_MAX_WAIT_SECONDS.
+    """
+
+    def __init__(self, api: str, rate_per_second: float, burst: int, max_concurrency: int, max_queue: int):
+        self.api = api
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._avg_hold = 1.0
+        self.in_flight = 0
+        self.waiting = 0
+        self._stats = {"admitted": 0, "rejected": 0, "throttled": 0}
+
+    def _try_take(self, now: float) -> float:
+        """
+        Takes a slot and returns 0, or returns roughly how long to wait before trying again.
+        """
+        if self.rate:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.in_flight >= self.max_concurrency:
+            return self._avg_hold
+        if self.rate and self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        if self.rate:
+            self._tokens -= 1
+        self.in_flight += 1
+        self._stats["admitted"] += 1
+        return 0.0
+
+    def retry_after(self) -> int:
+        queued = self.waiting + 1
+        estimate = queued * self._avg_hold / self.max_concurrency
+        if self.rate:
+            estimate = max(estimate, queued / self.rate)
+        return max(1, math.ceil(estimate))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._stats["rejected"] += 1
+        EVENTS.inc(event=f"admission_rejected_{self.api}")
+        return AdmissionRejected(self.api, reason, self.retry_after())
+
+    def check(self):
+        """
+        Raises AdmissionRejected right away if an interactive caller would not even get a queue spot.
+        """
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                raise self._reject("queue_full")
+
+    def acquire(self, wait: bool):
+        with self._cond:
+            delay = self._try_take(time.monotonic())
+            if not delay:
+                return
+            if not wait and self.waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            deadline = None if wait else time.monotonic() + ADMISSION_MAX_WAIT_SECONDS
+            self.waiting += 1
+            try:
+                while delay:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject("timeout")
+                        delay = min(delay, remaining)
+                    self._cond.wait(delay)
+                    delay = self._try_take(time.monotonic())
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, wait: bool):
+        """
+        Event-loop version of acquire: polls instead of blocking the thread.
+        """
+        with self._cond:
+            delay = self._try_take(time.monotonic())
+            if not delay:
+                return
+            if not wait and self.waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            self.waiting += 1
+        deadline = None if wait else time.monotonic() + ADMISSION_MAX_WAIT_SECONDS
+        try:
+            while delay:
+                if deadline is not None and time.monotonic() >= deadline:
+                    with self._cond:
+                        raise self._reject("timeout")
+                await asyncio.sleep(min(delay, 0.05))
+                with self._cond:
+                    delay = self._try_take(time.monotonic())
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, held_seconds: float):
+        with self._cond:
+            self.in_flight -= 1
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_seconds
+            self._cond.notify()
+
+    def throttle(self, seconds: float):
+        """
+        Upstream answered 429: hold back new calls for a while and empty the bucket.
+        """
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+            self._stats["throttled"] += 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rate_per_second": self.rate,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+            }
+
+def _env(api: str, key: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{api.upper()}_{key}", str(default)))
+
+_limiters = {
+    api: Limiter(
+        api,
+        _env(api, "RATE_PER_SECOND", defaults["rate"]),
+        int(_env(api, "BURST", defaults["burst"])),
+        int(_env(api, "MAX_CONCURRENCY", defaults["concurrency"])),
+        int(_env(api, "MAX_QUEUE", defaults["queue"])),
+    )
+    for api, defaults in ADMISSION_DEFAULTS.items()
+}
+
+for _api, _limiter in _limiters.items():
+    QUEUE_DEPTH.set_function(lambda limiter=_limiter: limiter.waiting, queue=f"admission_{_api}")
+
+def _is_upstream_throttle(e: Exception) -> bool:
+    # google.api_core exceptions carry .code, googleapiclient HttpError carries .resp.status
+    return getattr(e, "code", None) == 429 or getattr(getattr(e, "resp", None), "status", None) == 429
+
+@contextmanager
+def waiting_admission():
+    """
+    Calls made inside wait for a slot instead of being rejected (webhook and job work).
+    """
+    token = _waits.set(True)
+    try:
+        yield
+    finally:
+        _waits.reset(token)
+
+def check_capacity(api: str):
+    _limiters[api].check()
+
+def has_spare_capacity(api: str) -> bool:
+    """
+    True when nobody is queued for `api` and a call could start right away; used to send
+    optional work (such as hedged duplicates) only when it does not delay anyone else.
+    """
+    limiter = _limiters[api]
+    with limiter._cond:
+        return not limiter.waiting and limiter.in_flight < limiter.max_concurrency and time.monotonic() >= limiter._blocked_until
+
+@contextmanager
+def admit(api: str, wait: bool | None = None):
+    """
+    Holds one slot of `api` for the duration of a blocking call. Raises AdmissionRejected
+    for interactive callers when the API is saturated.
+    """
+    limiter = _limiters[api]
+    start = time.perf_counter()
+    limiter.acquire(_waits.get() if wait is None else wait)
+    admitted = time.perf_counter()
+    STAGE_DURATION.observe(admitted - start, stage=f"admission_wait_{api}")
+    try:
+        yield
+    except Exception as e:
+        if _is_upstream_throttle(e):
+            limiter.throttle(ADMISSION_THROTTLE_SECONDS)
+        raise
+    finally:
+        limiter.release(time.perf_counter() - admitted)
+
+@asynccontextmanager
+async def admit_async(api: str, wait: bool | None = None):
+    limiter = _limiters[api]
+    start = time.perf_counter()
+    await limiter.acquire_async(_waits.get() if wait is None else wait)
+    admitted = time.perf_counter()
+    STAGE_DURATION.observe(admitted - start, stage=f"admission_wait_{api}")
+    try:
+        yield
+    finally:
+        limiter.release(time.perf_counter() - admitted)
+
+def throttle(api: str, seconds: float):
+    _limiters[api].throttle(seconds)
+
+def get_admission_stats() -> dict:
+    return {api: limiter.stats() for api, limiter in _limiters.items()}
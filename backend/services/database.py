@@ -0,0 +1,104 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.getenv("RECORDS_DB_PATH", "records.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("DB_MAINTENANCE_INTERVAL_SECONDS", os.getenv("RECORDS_PURGE_INTERVAL_SECONDS", "600")))
+
+class ConnectionPool:
+    """
+    Small pool of SQLite connections in WAL mode. WAL lets readers proceed while a
+    writer commits, so handlers running on different worker threads do not serialize
+    on the file lock. A connection is used by one thread at a time.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields a pooled connection and commits on success / rolls back on error.
+        Keep the block short: never hold it across an external API call.
+        """
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._idle.put_nowait(conn)
+        finally:
+            self._slots.release()
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def get_connection():
+    """
+    Context manager yielding a connection to records.db from the process-wide pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+    return _pool.connection()
+
+_maintenance_tasks: dict[str, callable] = {}
+_maintenance_thread: threading.Thread | None = None
+_maintenance_stop = threading.Event()
+
+def register_maintenance_task(name: str, fn):
+    """
+    Registers a cleanup function (e.g. a TTL purge) run periodically by the maintenance thread.
+    """
+    _maintenance_tasks[name] = fn
+
+def run_maintenance():
+    for name, fn in list(_maintenance_tasks.items()):
+        start = time.monotonic()
+        try:
+            result = fn()
+            if result and (not isinstance(result, dict) or any(result.values())):
+                print(f"DB maintenance {name}: {result} ({time.monotonic() - start:.2f}s)")
+        except Exception as e:
+            print(f"DB maintenance {name} failed:", e)
+
+def _maintenance_loop():
+    while not _maintenance_stop.wait(DB_MAINTENANCE_INTERVAL_SECONDS):
+        run_maintenance()
+
+def start_maintenance_thread():
+    """
+    Starts the background maintenance loop once per process.
+    """
+    global _maintenance_thread
+    if _maintenance_thread and _maintenance_thread.is_alive():
+        return
+    _maintenance_stop.clear()
+    _maintenance_thread = threading.Thread(target=_maintenance_loop, name="db-maintenance", daemon=True)
+    _maintenance_thread.start()
+
+def stop_maintenance_thread():
+    _maintenance_stop.set()
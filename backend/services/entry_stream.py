@@ -0,0 +1,63 @@
+import json
+
+class EntryStreamParser:
+    """
+    Incremental parser for a streamed LedgerExtraction JSON document. feed() takes the
+    next chunk of text and returns the objects of the top-level "entries" array that
+    were completed by it, so rows can be shown before the whole response has arrived.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key = None
+        self._in_entries = False
+        self._entry_start = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = buffer[self._string_start + 1:i]
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                self._depth += 1
+                if c == "[" and self._depth == 2 and self._last_key == "entries":
+                    self._in_entries = True
+                elif c == "{" and self._in_entries and self._depth == 3:
+                    self._entry_start = i
+            elif c in "}]":
+                if c == "}" and self._in_entries and self._depth == 3 and self._entry_start is not None:
+                    try:
+                        completed.append(json.loads(buffer[self._entry_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._entry_start = None
+                elif c == "]" and self._in_entries and self._depth == 2:
+                    self._in_entries = False
+                self._depth -= 1
+            elif c == ",":
+                self._last_key = None
+        self._pos = len(buffer)
+        return completed
+
+    def text(self) -> str:
+        return self._buffer
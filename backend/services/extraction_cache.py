@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# The persistent cache lives next to records.db so it survives restarts.
+CACHE_DB_PATH = os.getenv("EXTRACTION_CACHE_DB", "extraction_cache.db")
+CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "20000"))
+CACHE_LRU_SIZE = int(os.getenv("EXTRACTION_CACHE_LRU_SIZE", "256"))
+CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "1") != "0"
+
+_lock = threading.Lock()
+_lru: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_initialized = False
+
+def make_cache_key(image_bytes: bytes, model_name: str, prompt_version: str) -> str:
+    """
+    Content-addressed key: the same image sent to the same model with the same
+    prompt/schema always maps to the same extraction.
+    """
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    digest.update(b"\0" + model_name.encode("utf-8"))
+    digest.update(b"\0" + prompt_version.encode("utf-8"))
+    return digest.hexdigest()
+
+def _connect():
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def init_cache():
+    global _initialized
+    if _initialized:
+        return
+    conn = _connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            cache_key TEXT PRIMARY KEY,
+            data TEXT,
+            created_at REAL,
+            last_access REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_access ON extraction_cache (last_access)")
+    conn.commit()
+    conn.close()
+    _initialized = True
+
+def _lru_put(key: str, created_at: float, data: dict):
+    _lru[key] = (created_at, data)
+    _lru.move_to_end(key)
+    while len(_lru) > CACHE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+def get_cached_extraction(key: str):
+    """
+    Returns the cached extraction for a key, or None. Checks the in-process LRU first,
+    then the SQLite store.
+    """
+    if not CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    with _lock:
+        hot = _lru.get(key)
+        if hot and now - hot[0] < CACHE_TTL_SECONDS:
+            _lru.move_to_end(key)
+            _stats["lru_hits"] += 1
+            return json.loads(json.dumps(hot[1]))
+        if hot:
+            del _lru[key]
+
+    init_cache()
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT data, created_at FROM extraction_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row and now - row[1] < CACHE_TTL_SECONDS:
+            conn.execute("UPDATE extraction_cache SET last_access = ? WHERE cache_key = ?", (now, key))
+            conn.commit()
+        elif row:
+            conn.execute("DELETE FROM extraction_cache WHERE cache_key = ?", (key,))
+            conn.commit()
+            row = None
+    finally:
+        conn.close()
+
+    with _lock:
+        if not row:
+            _stats["misses"] += 1
+            return None
+        data = json.loads(row[0])
+        _lru_put(key, row[1], data)
+        _stats["db_hits"] += 1
+    return json.loads(row[0])
+
+def store_extraction(key: str, data: dict):
+    """
+    Saves an extraction in both tiers and evicts expired / least recently used rows
+    once the store grows past CACHE_MAX_ENTRIES.
+    """
+    if not CACHE_ENABLED:
+        return
+
+    now = time.time()
+    init_cache()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO extraction_cache (cache_key, data, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(data), now, now)
+        )
+        evicted = conn.execute(
+            "DELETE FROM extraction_cache WHERE created_at < ?", (now - CACHE_TTL_SECONDS,)
+        ).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        if count > CACHE_MAX_ENTRIES:
+            evicted += conn.execute("""
+                DELETE FROM extraction_cache WHERE cache_key IN (
+                    SELECT cache_key FROM extraction_cache ORDER BY last_access ASC LIMIT ?
+                )
+            """, (count - CACHE_MAX_ENTRIES,)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+
+    with _lock:
+        _lru_put(key, now, json.loads(json.dumps(data)))
+        _stats["stores"] += 1
+        _stats["evictions"] += evicted
+
+def get_cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["lru_size"] = len(_lru)
+    lookups = stats["lru_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["lru_hits"] + stats["db_hits"]) / lookups, 4) if lookups else 0.0
+    stats["enabled"] = CACHE_ENABLED
+    return stats
@@ -1,8 +1,58 @@
+import io
 import os
 import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import typing_extensions as typing
-import google.generativeai as genai
 from pydantic import BaseModel, Field
+from services.extraction_cache import make_cache_key, get_cached_extraction, store_extraction
+from services.entry_stream import EntryStreamParser
+from services.image_preprocessing import preprocess_image_in_pool, preprocess_signature
+from services.page_index import page_hash, find_similar_page, format_page_hash, PAGE_DEDUP_MODE
+from services.tiled_extraction import split_into_tiles, merge_tile_extractions, tiling_signature, EXTRACTION_TILES, TILE_PROMPT_SUFFIX
+from services.admission import admit, has_spare_capacity, AdmissionRejected
+from services.hedging import hedged_call, submit_background, is_transient, LatencyWindow, DeadlineExceeded
+from services.metrics import observe_call, observe_stage, EVENTS, RETRIES, EXTRACTION_TIERS, EXTRACTION_ESCALATIONS
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Tiered mode tries GEMINI_FAST_MODEL first and only escalates to GEMINI_MODEL when the
+# fast result looks unreliable (invalid JSON, no entries, non-numeric amounts, low confidence).
+GEMINI_TIERED = os.getenv("GEMINI_TIERED", "0") != "0"
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+GEMINI_MIN_CONFIDENCE = float(os.getenv("GEMINI_MIN_CONFIDENCE", "0.7"))
+
+# Inline request payloads are capped at 20 MB in total, so leave headroom for the prompt.
+GEMINI_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(15 * 1024 * 1024)))
+
+# Every generate_content call (per tier) and Files API call gives up after this long.
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "60"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "3"))
+# A generate_content call still unanswered after the model's recent p95 latency gets a
+# duplicate request, if the Gemini limiter has a free slot; the first answer wins.
+# GEMINI_HEDGE_AFTER_SECONDS is used until 20 latencies have been seen.
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "1") != "0"
+GEMINI_HEDGE_AFTER_SECONDS = float(os.getenv("GEMINI_HEDGE_AFTER_SECONDS", "10"))
+GEMINI_HEDGE_MIN_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_SECONDS", "1"))
+
+# Strips of tall pages extracted at once, across all requests (see tiled_extraction).
+EXTRACTION_TILE_WORKERS = int(os.getenv("EXTRACTION_TILE_WORKERS", "16"))
+
+# Bump whenever EXTRACTION_PROMPT or the response schema changes so cached extractions are not reused.
+PROMPT_VERSION = "ledger-v2"
+
+EXTRACTION_PROMPT = (
+    "You are an expert data entry assistant. "
+    "Read the attached handwritten log/ledger. The writing might be in English, Hindi, or Marathi. "
+    "Extract the Date, Name/Description, Amount/Quantity, and Status. "
+    "If the handwritten text is in Hindi or Marathi, please accurately translate the meaning to English for the final JSON. "
+    "If the image is not a ledger or list of records, set is_valid_ledger to false and provide an error message. "
+    "Set confidence between 0 and 1 to how sure you are that every entry was read correctly; "
+    "lower it for smudged, cut-off or illegible writing."
+)
 
 class HandWrittenEntry(BaseModel):
     date: str = Field(description="The date of the entry, if available. Use N/A if missing.")
@@ -14,43 +64,445 @@ class LedgerExtraction(BaseModel):
     is_valid_ledger: bool = Field(description="True if the image contains a handwritten ledger or list of records. False if it's a random image like a dog or landscape.")
     error_message: str = Field(description="If is_valid_ledger is false, explain why. Otherwise, leave empty.")
     entries: list[HandWrittenEntry] = Field(description="The list of extracted entries.")
+    confidence: float = Field(description="Between 0 and 1: how sure you are that all entries were read correctly.")
+
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": LedgerExtraction,
+    "temperature": 0.1,
+}
+
+_genai = None
+_models = {}
+_latencies: dict[str, LatencyWindow] = {}
+_models_lock = threading.RLock()
+_tile_pool = None
 
 def init_gemini():
+    """
+    Checks that GEMINI_API_KEY is set. The SDK itself is only imported and configured
+    on first use (see _sdk), so this is cheap enough to run at startup.
+    """
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key or api_key == "":
         raise ValueError("GEMINI_API_KEY is missing! Please paste your key inside the d:\\AirStore\\backend\\.env file and restart the server.")
-    genai.configure(api_key=api_key)
 
-def extract_ledger_data(image_path: str) -> dict:
+def _sdk():
+    """
+    google.generativeai, imported and configured on first use: the import alone takes
+    about half a second, which would otherwise be paid by every cold start.
+    """
+    global _genai
+    with _models_lock:
+        if _genai is None:
+            init_gemini()
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _genai = genai
+        return _genai
+
+def get_model(model_name: str):
+    """
+    Returns the shared GenerativeModel handle for model_name, creating it on first use.
+    """
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = _sdk().GenerativeModel(model_name)
+        return model
+
+def warm_up():
+    """
+    Imports the SDK and creates the model handles ahead of the first extraction.
+    """
+    for _, model_name in model_tiers():
+        get_model(model_name)
+
+def _latency_window(model_name: str) -> LatencyWindow:
+    with _models_lock:
+        window = _latencies.get(model_name)
+        if window is None:
+            window = _latencies[model_name] = LatencyWindow(
+                GEMINI_HEDGE_AFTER_SECONDS, GEMINI_HEDGE_MIN_SECONDS, GEMINI_DEADLINE_SECONDS / 2
+            )
+        return window
+
+def get_latency_stats() -> dict:
+    with _models_lock:
+        windows = dict(_latencies)
+    return {
+        "deadline_seconds": GEMINI_DEADLINE_SECONDS,
+        "hedge": GEMINI_HEDGE,
+        "latency": {name: window.stats() for name, window in windows.items()},
+    }
+
+def _remaining(deadline: float) -> float:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Gemini deadline passed while waiting for a slot")
+    return remaining
+
+def _generate(model_name: str, tier: str, contents: list) -> str:
+    """
+    One generate_content call under GEMINI_DEADLINE_SECONDS, retried on transient errors
+    and hedged once the model's recent p95 has passed. Returns the response text.
+    """
+    window = _latency_window(model_name)
+
+    def attempt(deadline: float) -> str:
+        with observe_call("gemini", f"generate_content_{tier}"):
+            timeout = _remaining(deadline)
+            start = time.perf_counter()
+            response = get_model(model_name).generate_content(
+                contents, generation_config=GENERATION_CONFIG, request_options={"timeout": timeout}
+            )
+            text = response.text
+        window.add(time.perf_counter() - start)
+        return text
+
+    return hedged_call(
+        attempt, "gemini", f"generate_content_{tier}", GEMINI_DEADLINE_SECONDS,
+        hedge_after=window.hedge_after() if GEMINI_HEDGE else None,
+        may_hedge=lambda: has_spare_capacity("gemini"),
+        max_attempts=GEMINI_MAX_ATTEMPTS,
+        admit=lambda: admit("gemini"),
+    )
+
+def model_tiers() -> list[tuple[str, str]]:
+    """
+    (tier, model) pairs tried in order for one extraction.
+    """
+    if GEMINI_TIERED and GEMINI_FAST_MODEL != GEMINI_MODEL:
+        return [("fast", GEMINI_FAST_MODEL), ("strong", GEMINI_MODEL)]
+    return [("strong", GEMINI_MODEL)]
+
+def assess_extraction(text: str) -> tuple[dict | None, str]:
+    """
+    Parses a Gemini response text and returns (data, reason); reason is empty when the
+    result looks reliable, otherwise it names why a stronger model should retry.
+    """
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return None, "invalid_json"
+    if not isinstance(data, dict):
+        return None, "invalid_json"
+
+    entries = data.get("entries") or []
+    if not entries:
+        return data, "empty_entries"
+    for entry in entries:
+        try:
+            float(str(entry.get("amount", "")).replace(",", ""))
+        except (ValueError, AttributeError):
+            return data, "non_numeric_amount"
+
+    confidence = data.get("confidence")
+    if isinstance(confidence, (int, float)) and confidence < GEMINI_MIN_CONFIDENCE:
+        return data, "low_confidence"
+    return data, ""
+
+def _generate_tiered(contents: list) -> dict:
+    """
+    Runs the extraction on each tier in turn until one gives a reliable result.
+    The last tier's answer is used as-is; if it fails outright, an earlier usable one is kept.
+    """
+    tiers = model_tiers()
+    fallback = None
+    for index, (tier, model_name) in enumerate(tiers):
+        last = index == len(tiers) - 1
+        try:
+            data, reason = assess_extraction(_generate(model_name, tier, contents))
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            if last and fallback is None:
+                raise
+            data, reason = None, "error"
+            print(f"Gemini {model_name} failed: {e}")
+
+        if data is not None and (not reason or last):
+            EXTRACTION_TIERS.inc(tier=tier, model=model_name)
+            data["model_tier"] = tier
+            return data
+        if last:
+            break
+        if data is not None:
+            fallback = (tier, model_name, data)
+        EXTRACTION_ESCALATIONS.inc(reason=reason)
+        print(f"Escalating extraction from {model_name}: {reason}")
+
+    if fallback is None:
+        raise ValueError("Gemini returned invalid JSON")
+    tier, model_name, data = fallback
+    EXTRACTION_TIERS.inc(tier=tier, model=model_name)
+    data["model_tier"] = tier
+    return data
+
+def _check_page(image_bytes: bytes, mime_type: str) -> tuple[int | None, dict | None]:
+    """
+    The page hash and the earlier page it nearly duplicates, if any (see page_index).
+    """
+    if PAGE_DEDUP_MODE == "off":
+        return None, None
+    with observe_stage("page_hash"):
+        value = page_hash(image_bytes, mime_type)
+    if value is None:
+        return None, None
+    with observe_stage("page_lookup"):
+        match = find_similar_page(value)
+    if match:
+        EVENTS.inc(event="page_duplicate")
+    return value, match
+
+def _finish_page(value: int | None, match: dict | None, data: dict) -> dict:
     """
-    Extracts structured data from a handwritten ledger image using Gemini 2.5 Flash.
+    Marks a near-duplicate with `duplicate_of`, or gives a new valid page its `page_hash`.
+    The page is only remembered once its rows are in Sheets (page_index.remember_sent_pages),
+    so a failed write or an upload never confirmed does not turn the retry into a duplicate.
+    """
+    if match:
+        return {**data, "duplicate_of": {"page_id": match["page_id"], "distance": match["distance"], "first_seen": match["first_seen"]}}
+    if value is not None and data.get("is_valid_ledger"):
+        return {**data, "page_hash": format_page_hash(value)}
+    return data
+
+def _cache_key(image_bytes: bytes, preprocess: bool, tiled: bool) -> str:
+    """
+    Extraction cache key. Whole-page extractions, from /upload, WhatsApp and /upload/stream
+    alike, share one entry per image; only tiled ones add the tiling settings.
+    """
+    variant = f"{PROMPT_VERSION}|{preprocess_signature() if preprocess else 'raw'}"
+    if tiled:
+        variant += f"|{tiling_signature()}"
+    return make_cache_key(image_bytes, ">".join(name for _, name in model_tiers()), variant)
+
+def extract_ledger_data_from_bytes(image_bytes: bytes, mime_type: str = "image/jpeg", preprocess: bool = True) -> dict:
+    """
+    Extracts structured data from a handwritten ledger image using Gemini 2.5 Flash
+    (or the fast-then-strong model tiers when GEMINI_TIERED is set).
     Supports English, Hindi, and Marathi handwriting.
+    Results are cached by image content, so a resent photo skips the Gemini round trip.
+    A photo of a page seen before carries `duplicate_of`; with PAGE_DEDUP_MODE=reuse it is
+    answered with the earlier extraction instead of calling Gemini.
+    On a cache miss the image is downscaled/cropped/deskewed first (see image_preprocessing).
+    With EXTRACTION_TILES set, tall pages are then cut into overlapping strips that are
+    extracted in parallel and merged (see tiled_extraction).
+    Images up to GEMINI_INLINE_MAX_BYTES are sent inline with the prompt; only larger
+    ones go through the Files API upload/delete round trips.
     """
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    
-    # Upload the file to the Gemini API (better for images)
-    sample_file = genai.upload_file(path=image_path)
+    # The key uses the original bytes, so a cache hit skips preprocessing too.
+    cache_key = _cache_key(image_bytes, preprocess, tiled=EXTRACTION_TILES != "off")
+
+    cached = get_cached_extraction(cache_key)
+    # An exact resend is a duplicate too, so the page index is consulted on cache hits as well.
+    page, match = _check_page(image_bytes, mime_type)
+    if cached is not None:
+        EVENTS.inc(event="extraction_cache_hit")
+        return _finish_page(page, match, cached)
+    EVENTS.inc(event="extraction_cache_miss")
+    if match and PAGE_DEDUP_MODE == "reuse":
+        return _finish_page(page, match, match["data"])
+
+    if preprocess:
+        with observe_stage("preprocess"):
+            image_bytes, mime_type = preprocess_image_in_pool(image_bytes, mime_type)
+
+    tiles = []
+    if EXTRACTION_TILES != "off":
+        with observe_stage("split_tiles"):
+            tiles = split_into_tiles(image_bytes, mime_type)
+    if tiles:
+        extracted_data = _extract_tiles(tiles)
+    else:
+        with _request_contents(image_bytes, mime_type) as contents:
+            extracted_data = _generate_tiered(contents)
     
-    prompt = (
-        "You are an expert data entry assistant. "
-        "Read the attached handwritten log/ledger. The writing might be in English, Hindi, or Marathi. "
-        "Extract the Date, Name/Description, Amount/Quantity, and Status. "
-        "If the handwritten text is in Hindi or Marathi, please accurately translate the meaning to English for the final JSON. "
-        "If the image is not a ledger or list of records, set is_valid_ledger to false and provide an error message."
+    store_extraction(cache_key, extracted_data)
+    return _finish_page(page, match, extracted_data)
+
+def _tile_executor() -> ThreadPoolExecutor:
+    global _tile_pool
+    with _models_lock:
+        if _tile_pool is None:
+            _tile_pool = ThreadPoolExecutor(max_workers=EXTRACTION_TILE_WORKERS, thread_name_prefix="extract-tile")
+        return _tile_pool
+
+def _extract_tiles(tiles: list[bytes]) -> dict:
+    """
+    Extracts the strips of a tall page concurrently, each like a page of its own, and
+    merges their entries with the rows read twice in the overlaps removed.
+    """
+    def extract_tile(tile: bytes) -> dict:
+        with _request_contents(tile, "image/jpeg", EXTRACTION_PROMPT + TILE_PROMPT_SUFFIX) as contents:
+            return _generate_tiered(contents)
+
+    # A context copy per tile keeps the caller's admission mode and trace.
+    futures = [_tile_executor().submit(contextvars.copy_context().run, extract_tile, tile) for tile in tiles]
+    try:
+        with observe_stage("extract_tiles"):
+            results = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    EVENTS.inc(event="tiled_extraction")
+    return merge_tile_extractions(results)
+
+@contextmanager
+def _request_contents(image_bytes: bytes, mime_type: str, prompt: str = EXTRACTION_PROMPT):
+    """
+    Yields the prompt + image parts for generate_content. Images up to GEMINI_INLINE_MAX_BYTES
+    are sent inline; larger ones are uploaded through the Files API and deleted afterwards.
+    """
+    if len(image_bytes) <= GEMINI_INLINE_MAX_BYTES:
+        # Requesting structured output native to the Gemini API
+        yield [prompt, {"mime_type": mime_type, "data": image_bytes}]
+        return
+
+    # Too large for an inline request: upload through the Files API instead
+    sample_file = _upload_file(image_bytes, mime_type)
+    try:
+        yield [prompt, sample_file]
+    finally:
+        # Clean up the uploaded file from Google's servers
+        _delete_file(sample_file.name)
+
+def _upload_file(image_bytes: bytes, mime_type: str):
+    """
+    Files API upload under GEMINI_DEADLINE_SECONDS, retried and hedged like generate_content.
+    An upload given up on that still lands later is deleted as soon as it does.
+    """
+    window = _latency_window("files/upload")
+
+    def attempt(deadline: float):
+        with observe_call("gemini", "upload_file"):
+            _remaining(deadline)
+            start = time.perf_counter()
+            # upload_file takes no timeout; an abandoned upload ends at the client's own.
+            uploaded = _sdk().upload_file(path=io.BytesIO(image_bytes), mime_type=mime_type)
+        window.add(time.perf_counter() - start)
+        return uploaded
+
+    return hedged_call(
+        attempt, "gemini", "upload_file", GEMINI_DEADLINE_SECONDS,
+        hedge_after=window.hedge_after() if GEMINI_HEDGE else None,
+        may_hedge=lambda: has_spare_capacity("gemini"),
+        max_attempts=GEMINI_MAX_ATTEMPTS,
+        on_abandoned=lambda uploaded: _delete_file(uploaded.name),
+        admit=lambda: admit("gemini"),
     )
-    
-    # Requesting structured output native to the Gemini API
-    response = model.generate_content(
-        [prompt, sample_file],
-        generation_config=genai.GenerationConfig(
-            response_mime_type="application/json",
-            response_schema=LedgerExtraction,
-            temperature=0.1
+
+def _delete_file(name: str):
+    """
+    Deletes an uploaded file in the background, so a slow delete never holds up (or hides
+    the error of) the extraction that used it.
+    """
+    submit_background(_delete_file_now, name)
+
+def _delete_file_now(name: str):
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        try:
+            with observe_call("gemini", "delete_file"):
+                _sdk().delete_file(name)
+            return
+        except Exception as e:
+            if attempt + 1 < GEMINI_MAX_ATTEMPTS and is_transient(e):
+                RETRIES.inc(api="gemini", operation="delete_file")
+                time.sleep(2 ** attempt)
+                continue
+            # Files the API keeps expire on their own after 48 hours.
+            EVENTS.inc(event="gemini_file_orphaned")
+            print(f"Could not delete Gemini file {name}: {e}")
+            return
+
+def _stream_tier(model_name: str, tier: str, contents: list):
+    """
+    Streams one generate_content call, yielding each entry as soon as its JSON object closes.
+    Returns the full response text.
+    """
+    parser = EntryStreamParser()
+    with admit("gemini"), observe_call("gemini", f"generate_content_stream_{tier}"):
+        # Streams are not hedged (rows already sent cannot be taken back); the deadline
+        # still bounds the call.
+        response = get_model(model_name).generate_content(
+            contents, generation_config=GENERATION_CONFIG, stream=True,
+            request_options={"timeout": GEMINI_DEADLINE_SECONDS},
         )
-    )
-    
-    # Clean up the uploaded file from Google's servers
-    genai.delete_file(sample_file.name)
-    
-    # The response should strictly be the JSON string matching our schema
-    return json.loads(response.text)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text (e.g. only a finish reason)
+                continue
+            for entry in parser.feed(text):
+                yield "entry", entry
+    return parser.text()
+
+def stream_ledger_extraction(image_bytes: bytes, mime_type: str = "image/jpeg", preprocess: bool = True):
+    """
+    Streaming version of extract_ledger_data_from_bytes, with the same cache, preprocessing
+    and model tiers. Yields ("entry", entry) for every row as soon as Gemini has written it,
+    ("restart", {"reason": ...}) when rows already sent are being replaced by a stronger
+    model's answer, and finally ("done", extraction).
+    """
+    # Streams always read the whole page
+    cache_key = _cache_key(image_bytes, preprocess, tiled=False)
+
+    cached = get_cached_extraction(cache_key)
+    page, match = _check_page(image_bytes, mime_type)
+    if cached is not None:
+        EVENTS.inc(event="extraction_cache_hit")
+    else:
+        EVENTS.inc(event="extraction_cache_miss")
+        if match and PAGE_DEDUP_MODE == "reuse":
+            cached = match["data"]
+    if cached is not None:
+        for entry in cached.get("entries", []):
+            yield "entry", entry
+        yield "done", _finish_page(page, match, cached)
+        return
+
+    if preprocess:
+        with observe_stage("preprocess"):
+            image_bytes, mime_type = preprocess_image_in_pool(image_bytes, mime_type)
+
+    with _request_contents(image_bytes, mime_type) as contents:
+        tiers = model_tiers()
+        fallback = None
+        for index, (tier, model_name) in enumerate(tiers):
+            last = index == len(tiers) - 1
+            try:
+                data, reason = assess_extraction((yield from _stream_tier(model_name, tier, contents)))
+            except AdmissionRejected:
+                raise
+            except Exception as e:
+                if last and fallback is None:
+                    raise
+                data, reason = None, "error"
+                print(f"Gemini {model_name} failed: {e}")
+
+            if data is not None and (not reason or last):
+                break
+            if last:
+                if fallback is None:
+                    break
+                # The strong tier failed: go back to the usable fast answer.
+                tier, model_name, data = fallback
+                yield "restart", {"reason": "error"}
+                for entry in data.get("entries", []):
+                    yield "entry", entry
+                break
+            if data is not None:
+                fallback = (tier, model_name, data)
+            EXTRACTION_ESCALATIONS.inc(reason=reason)
+            print(f"Escalating extraction from {model_name}: {reason}")
+            yield "restart", {"reason": reason}
+
+    if data is None:
+        raise ValueError("Gemini returned invalid JSON")
+    EXTRACTION_TIERS.inc(tier=tier, model=model_name)
+    data["model_tier"] = tier
+    store_extraction(cache_key, data)
+    yield "done", _finish_page(page, match, data)
+
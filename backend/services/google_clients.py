@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+# Only for moving rollover spreadsheets (created by this service account) into a folder
+DRIVE_FILE_SCOPES = ['https://www.googleapis.com/auth/drive.file']
+
+# Idle clients kept per API. Busy clients are never shared, since httplib2 is not thread-safe.
+GOOGLE_CLIENT_POOL_SIZE = int(os.getenv("GOOGLE_CLIENT_POOL_SIZE", "8"))
+
+_creds_lock = threading.Lock()
+_credentials: dict[tuple[str, ...], object] = {}
+
+def _resolve_credentials_file() -> str:
+    creds_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not creds_file:
+        raise ValueError("Neither GOOGLE_CREDENTIALS_JSON nor GOOGLE_APPLICATION_CREDENTIALS is set in .env")
+
+    # If it's just the filename, resolve it explicitly to the backend folder
+    if not os.path.isabs(creds_file):
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        creds_file = os.path.join(base_dir, creds_file)
+
+    if not os.path.exists(creds_file):
+        raise ValueError(f"Google Credentials file NOT found at: {creds_file}.")
+    return creds_file
+
+def get_credentials(scopes: list[str]):
+    """
+    Parses the service account once per scope set. The returned Credentials object caches
+    its OAuth token and is refreshed in place by the authorized HTTP transport when it expires.
+    """
+    from google.oauth2 import service_account
+    key = tuple(sorted(scopes))
+    with _creds_lock:
+        creds = _credentials.get(key)
+        if creds:
+            return creds
+
+        # 1. First, check if there's a raw JSON string in the environment (Render deployment)
+        creds_json_string = os.getenv("GOOGLE_CREDENTIALS_JSON")
+        if creds_json_string:
+            try:
+                creds_dict = json.loads(creds_json_string)
+                creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=scopes)
+            except Exception as e:
+                raise ValueError(f"Failed to parse GOOGLE_CREDENTIALS_JSON: {e}")
+        else:
+            # 2. Fallback to local file-based credentials
+            creds = service_account.Credentials.from_service_account_file(
+                _resolve_credentials_file(), scopes=scopes)
+
+        _credentials[key] = creds
+        return creds
+
+class ClientPool:
+    """
+    Hands out googleapiclient Resources for one API. Each Resource owns its own httplib2
+    connection, is used by one thread at a time and goes back to the pool afterwards.
+    Clients are built from the discovery document bundled with googleapiclient, so
+    building one never hits the network.
+    """
+
+    def __init__(self, api: str, version: str, scopes: list[str], max_idle: int):
+        self.api = api
+        self.version = version
+        self.scopes = scopes
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self._discovery_doc = None
+        self._stats = {"created": 0, "checkouts": 0, "reused": 0, "discarded": 0, "in_use": 0}
+
+    def _build(self):
+        # googleapiclient is imported on first use to keep it out of the cold start.
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+        if self._discovery_doc is None:
+            self._discovery_doc = get_static_doc(self.api, self.version)
+            if self._discovery_doc is None:
+                raise ValueError(f"No bundled discovery document for {self.api} {self.version}")
+        return build_from_document(self._discovery_doc, credentials=get_credentials(self.scopes))
+
+    @contextmanager
+    def client(self):
+        with self._lock:
+            service = self._idle.pop() if self._idle else None
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            if service is not None:
+                self._stats["reused"] += 1
+
+        healthy = True
+        try:
+            if service is None:
+                service = self._build()
+                with self._lock:
+                    self._stats["created"] += 1
+            yield service
+        except (ConnectionError, OSError):
+            # A broken socket should not be handed to the next caller.
+            healthy = False
+            raise
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+                if service is not None:
+                    if healthy and len(self._idle) < self.max_idle:
+                        self._idle.append(service)
+                    else:
+                        self._stats["discarded"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats["reuse_rate"] = round(stats["reused"] / stats["checkouts"], 4) if stats["checkouts"] else 0.0
+        return stats
+
+_sheets_pool = ClientPool("sheets", "v4", SHEETS_SCOPES, GOOGLE_CLIENT_POOL_SIZE)
+_drive_pool = ClientPool("drive", "v3", DRIVE_SCOPES, GOOGLE_CLIENT_POOL_SIZE)
+# Rollovers are rare: one idle client is plenty
+_drive_file_pool = ClientPool("drive", "v3", DRIVE_FILE_SCOPES, 1)
+
+def sheets_client():
+    """
+    Context manager yielding a Sheets v4 client reserved for the calling thread.
+    """
+    return _sheets_pool.client()
+
+def drive_client():
+    """
+    Context manager yielding a Drive v3 client reserved for the calling thread.
+    """
+    return _drive_pool.client()
+
+def drive_file_client():
+    """
+    Context manager yielding a Drive v3 client with the drive.file scope, which can
+    change the files this service account created.
+    """
+    return _drive_file_pool.client()
+
+def warm_up():
+    """
+    Builds one Sheets and one Drive client ahead of the first confirm/reply.
+    """
+    with sheets_client(), drive_client():
+        pass
+
+def get_pool_stats() -> dict:
+    return {"sheets": _sheets_pool.stats(), "drive": _drive_pool.stats()}
@@ -0,0 +1,190 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from contextlib import nullcontext
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from services.metrics import EVENTS, RETRIES
+
+# Threads running hedged attempts. An abandoned attempt keeps its thread until its own
+# timeout ends it, so this should cover a few attempts per concurrent call.
+HEDGE_POOL_WORKERS = int(os.getenv("HEDGE_POOL_WORKERS", "64"))
+# Base of the exponential backoff between retries, in seconds (with full jitter).
+HEDGE_RETRY_BACKOFF_SECONDS = float(os.getenv("HEDGE_RETRY_BACKOFF_SECONDS", "0.5"))
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class DeadlineExceeded(TimeoutError):
+    """
+    No attempt of a hedged call answered before its deadline.
+    """
+
+def is_transient(e: Exception) -> bool:
+    """
+    Timeouts, connection errors and retryable HTTP statuses; google.api_core exceptions
+    carry the status as .code.
+    """
+    return isinstance(e, (TimeoutError, ConnectionError)) or getattr(e, "code", None) in TRANSIENT_STATUS_CODES
+
+class LatencyWindow:
+    """
+    The last `size` latencies of one operation. hedge_after() is their p95 once there are
+    at least `min_samples`, and `default` before that, kept between `floor` and `ceiling`.
+    """
+
+    def __init__(self, default: float, floor: float, ceiling: float, quantile: float = 0.95, size: int = 200, min_samples: int = 20):
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def _quantile(self, ordered: list[float], q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_after(self) -> float:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                value = self.default
+            else:
+                value = self._quantile(sorted(self._samples), self.quantile)
+        return min(self.ceiling, max(self.floor, value))
+
+    def stats(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._samples)
+        return {
+            "samples": len(ordered),
+            "p50": self._quantile(ordered, 0.5) if ordered else None,
+            "p95": self._quantile(ordered, 0.95) if ordered else None,
+            "hedge_after": self.hedge_after(),
+        }
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_POOL_WORKERS, thread_name_prefix="hedged-call")
+        return _executor
+
+def submit_background(fn, *args):
+    """
+    Runs fn(*args) on the hedging pool without waiting for it, e.g. cleanup after a call.
+    """
+    return _pool().submit(contextvars.copy_context().run, fn, *args)
+
+def hedged_call(attempt, api: str, operation: str, deadline_seconds: float, hedge_after: float | None = None,
+                may_hedge=None, max_attempts: int = 3, on_abandoned=None, admit=None):
+    """
+    Calls attempt(deadline), where deadline is a time.monotonic() value the attempt must
+    pass on as its own timeout, and returns the first successful result.
+
+    With admit (a callable returning a context manager, such as an admission slot), every
+    attempt runs inside its own admit(), and the deadline only starts once the first attempt
+    has been admitted: time spent queued for capacity does not count against it.
+
+    - If nothing has answered after hedge_after seconds (and may_hedge() agrees), a
+      duplicate attempt is started and whichever answers first wins.
+    - Transient failures (see is_transient) are retried with backoff while time and
+      attempts remain; anything else is raised once no other attempt is in flight.
+    - Raises DeadlineExceeded when deadline_seconds pass without an answer.
+
+    Attempts still running when the call returns are abandoned: those that have not started
+    are cancelled, the others end at their own timeout and their results are dropped.
+    on_abandoned(result) runs for each of those that still succeeds, to release what it holds.
+    """
+    pending = {}
+    errors = []
+    launched = 0
+    hedged = hedge_after is None
+    clock = {}
+    admitted = threading.Event()
+
+    def run():
+        try:
+            with admit() if admit is not None else nullcontext():
+                # The first attempt admitted starts the clock for all of them
+                started = clock.setdefault("start", time.monotonic())
+                admitted.set()
+                return attempt(started + deadline_seconds)
+        finally:
+            # Also when admission itself failed, so the caller stops waiting
+            admitted.set()
+
+    def launch(kind: str):
+        nonlocal launched
+        launched += 1
+        # A context copy per attempt: the same Context cannot be entered by two threads.
+        context = contextvars.copy_context()
+        pending[_pool().submit(context.run, run)] = kind
+
+    launch("primary")
+    admitted.wait()
+    start = clock.get("start", time.monotonic())
+    deadline = start + deadline_seconds
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if not pending:
+                if not errors or launched >= max_attempts or not is_transient(errors[-1]):
+                    break
+                # Full jitter, never past the deadline
+                time.sleep(min(random.uniform(0, HEDGE_RETRY_BACKOFF_SECONDS * 2 ** (launched - 1)), deadline - now))
+                if time.monotonic() >= deadline:
+                    break
+                RETRIES.inc(api=api, operation=operation)
+                launch("retry")
+                continue
+
+            wake = deadline if hedged else min(deadline, start + hedge_after)
+            done, _ = wait(pending, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Even a permanent failure waits for attempts still in flight.
+                    print(f"{api} {operation} {kind} attempt failed: {e}")
+                    errors.append(e)
+                    continue
+                if kind == "hedge":
+                    EVENTS.inc(event=f"{api}_hedge_won")
+                return result
+
+            if not hedged and time.monotonic() >= start + hedge_after:
+                hedged = True
+                if launched < max_attempts and (may_hedge is None or may_hedge()):
+                    EVENTS.inc(event=f"{api}_hedge_sent")
+                    launch("hedge")
+                else:
+                    EVENTS.inc(event=f"{api}_hedge_skipped")
+
+        if errors and not pending and time.monotonic() < deadline:
+            raise errors[-1]
+        EVENTS.inc(event=f"{api}_deadline_exceeded")
+        raise DeadlineExceeded(f"{api} {operation}: no answer within {deadline_seconds:.0f}s after {launched} attempt(s)")
+    finally:
+        for future in pending:
+            if not future.cancel() and on_abandoned is not None:
+                future.add_done_callback(lambda f: _release_abandoned(f, on_abandoned))
+
+def _release_abandoned(future, on_abandoned):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        on_abandoned(future.result())
+    except Exception as e:
+        print(f"Releasing an abandoned result failed: {e}")
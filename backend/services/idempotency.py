@@ -0,0 +1,74 @@
+import os
+import time
+import sqlite3
+from services.database import get_connection, register_maintenance_task
+
+# Meta retries webhook deliveries for up to a few days; remember message ids a bit longer.
+WHATSAPP_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("WHATSAPP_IDEMPOTENCY_TTL_SECONDS", str(7 * 24 * 3600)))
+# A claim whose pipeline never finished (the worker died) can be taken again after this long.
+WHATSAPP_CLAIM_LEASE_SECONDS = int(os.getenv("WHATSAPP_CLAIM_LEASE_SECONDS", "900"))
+
+def init_idempotency_store():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_messages (
+                message_id TEXT PRIMARY KEY,
+                received_at REAL,
+                done INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(processed_messages)")}
+        if "done" not in columns:
+            try:
+                # Ids recorded before claims could be released were all handled
+                conn.execute("ALTER TABLE processed_messages ADD COLUMN done INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError as e:
+                # Another worker process added it first
+                if "duplicate column" not in str(e):
+                    raise
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_messages_received_at ON processed_messages (received_at)")
+    register_maintenance_task("processed_messages", purge_processed_messages)
+
+def claim_messages(message_ids: list[str]) -> set[str]:
+    """
+    Claims the given WhatsApp message ids for processing and returns the ones that were new.
+    Ids already handled, or claimed by an earlier delivery (or earlier in this batch) within
+    the last WHATSAPP_CLAIM_LEASE_SECONDS, are left out. Each claim must end in
+    finish_messages or release_messages.
+    """
+    now = time.time()
+    new_ids = set()
+    with get_connection() as conn:
+        for message_id in message_ids:
+            claimed = conn.execute(
+                """
+                INSERT INTO processed_messages (message_id, received_at, done) VALUES (?, ?, 0)
+                ON CONFLICT (message_id) DO UPDATE SET received_at = excluded.received_at
+                WHERE done = 0 AND received_at < ?
+                """,
+                (message_id, now, now - WHATSAPP_CLAIM_LEASE_SECONDS)
+            ).rowcount
+            if claimed:
+                new_ids.add(message_id)
+    return new_ids
+
+def finish_messages(message_ids: list[str]):
+    """
+    Marks claimed ids as handled, so later redeliveries are skipped.
+    """
+    with get_connection() as conn:
+        conn.executemany("UPDATE processed_messages SET done = 1 WHERE message_id = ?", [(i,) for i in message_ids])
+
+def release_messages(message_ids: list[str]):
+    """
+    Drops the claims of ids whose processing failed, so a redelivery is processed again.
+    """
+    with get_connection() as conn:
+        conn.executemany("DELETE FROM processed_messages WHERE message_id = ? AND done = 0", [(i,) for i in message_ids])
+
+def purge_processed_messages() -> int:
+    with get_connection() as conn:
+        return conn.execute(
+            "DELETE FROM processed_messages WHERE received_at < ?",
+            (time.time() - WHATSAPP_IDEMPOTENCY_TTL_SECONDS,)
+        ).rowcount
@@ -0,0 +1,164 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+PREPROCESS_IMAGES = os.getenv("PREPROCESS_IMAGES", "1") != "0"
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "2048"))
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "85"))
+PREPROCESS_AUTO_CROP = os.getenv("PREPROCESS_AUTO_CROP", "1") != "0"
+PREPROCESS_DESKEW = os.getenv("PREPROCESS_DESKEW", "1") != "0"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Image analysis (crop/deskew detection) runs on a small copy of the photo.
+ANALYSIS_EDGE = 600
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+def preprocess_signature() -> str:
+    """
+    Identifies the current preprocessing settings; part of the extraction cache key
+    because different settings send different bytes to Gemini.
+    """
+    if not PREPROCESS_IMAGES:
+        return "raw"
+    return f"edge{PREPROCESS_MAX_EDGE}-q{PREPROCESS_JPEG_QUALITY}-crop{int(PREPROCESS_AUTO_CROP)}-deskew{int(PREPROCESS_DESKEW)}"
+
+def _otsu_threshold(histogram: list[int]) -> int:
+    total = sum(histogram)
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg, weight_bg, best_threshold, best_variance = 0.0, 0, 127, 0.0
+    for level in range(256):
+        weight_bg += histogram[level]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += level * histogram[level]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_variance, best_threshold = variance, level
+    return best_threshold
+
+def _box():
+    from PIL import Image
+    return Image.Resampling.BOX
+
+def _analysis_copy(img):
+    from PIL import ImageOps
+    small = ImageOps.grayscale(img)
+    small.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE))
+    return small
+
+def crop_to_paper(img):
+    """
+    Crops to the bright paper region: the outermost rows/columns that are mostly
+    brighter than the Otsu threshold. Leaves the image alone if no clear page is found.
+    """
+    small = _analysis_copy(img)
+    threshold = _otsu_threshold(small.histogram())
+    mask = small.point(lambda p: 255 if p > threshold else 0)
+
+    # Resizing to a single column/row with a box filter yields per-row/per-column means.
+    row_means = list(mask.resize((1, mask.height), resample=_box()).getdata())
+    col_means = list(mask.resize((mask.width, 1), resample=_box()).getdata())
+    rows = [i for i, v in enumerate(row_means) if v > 128]
+    cols = [i for i, v in enumerate(col_means) if v > 128]
+    if not rows or not cols:
+        return img
+
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    area_ratio = ((bottom - top) * (right - left)) / (mask.width * mask.height)
+    if area_ratio < 0.3 or area_ratio > 0.97:
+        return img
+
+    scale_x, scale_y = img.width / mask.width, img.height / mask.height
+    return img.crop((int(left * scale_x), int(top * scale_y), int(right * scale_x), int(bottom * scale_y)))
+
+def _deskew(img):
+    """
+    Finds the rotation that makes the ink's horizontal projection profile sharpest
+    (text lines aligned with rows) and rotates the photo by it.
+    """
+    from PIL import Image
+    small = _analysis_copy(img)
+    threshold = _otsu_threshold(small.histogram())
+    ink = small.point(lambda p: 255 if p <= threshold else 0)
+
+    def score(angle: float) -> float:
+        rotated = ink.rotate(angle, resample=Image.Resampling.BILINEAR, fillcolor=0)
+        profile = list(rotated.resize((1, rotated.height), resample=_box()).getdata())
+        mean = sum(profile) / len(profile)
+        return sum((v - mean) ** 2 for v in profile)
+
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    best_angle = max((i * DESKEW_STEP for i in range(-steps, steps + 1)), key=score)
+    if abs(best_angle) < DESKEW_STEP:
+        return img
+    return img.rotate(best_angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+
+def preprocess_image(image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    """
+    Downscales to PREPROCESS_MAX_EDGE, optionally crops to the page and deskews,
+    then recompresses as JPEG. Returns (bytes, mime_type); non-images and images
+    that would not get smaller are returned unchanged.
+    """
+    if not mime_type.startswith("image/"):
+        return image_bytes, mime_type
+
+    from PIL import Image, ImageOps
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception as e:
+        print(f"Image preprocessing skipped: {e}")
+        return image_bytes, mime_type
+
+    original_size = img.size
+    img.thumbnail((PREPROCESS_MAX_EDGE, PREPROCESS_MAX_EDGE), Image.Resampling.LANCZOS)
+    if PREPROCESS_AUTO_CROP:
+        img = crop_to_paper(img)
+    if PREPROCESS_DESKEW:
+        img = _deskew(img)
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=PREPROCESS_JPEG_QUALITY, optimize=True)
+    processed = out.getvalue()
+    if img.size == original_size and len(processed) >= len(image_bytes):
+        return image_bytes, mime_type
+    return processed, "image/jpeg"
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process is multi-threaded.
+            _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def preprocess_image_in_pool(image_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
+    """
+    Runs preprocess_image in the worker process pool so the CPU-heavy work does not hold
+    the GIL of the API process. Blocks the calling (worker) thread until done.
+    """
+    if not PREPROCESS_IMAGES:
+        return image_bytes, mime_type
+    try:
+        return _get_pool().submit(preprocess_image, image_bytes, mime_type).result()
+    except Exception as e:
+        print(f"Image preprocessing failed, sending original image: {e}")
+        return image_bytes, mime_type
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
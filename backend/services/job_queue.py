@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from services.database import get_connection, register_maintenance_task
+from services.metrics import QUEUE_DEPTH
+
+# Upper bound on concurrent extractions and on jobs waiting for a worker (per process).
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "8"))
+EXTRACTION_QUEUE_MAX = int(os.getenv("EXTRACTION_QUEUE_MAX", "200"))
+# Finished jobs are kept around this long so clients can still poll the result.
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+# How often an event stream checks the database for a job run by another worker process.
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+class JobQueueFull(Exception):
+    pass
+
+_executor = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix="extraction")
+_lock = threading.Lock()
+# Jobs queued or running in this process. Job state itself lives in the shared `jobs`
+# table, so any worker process can answer a poll.
+_in_flight: set[str] = set()
+_listeners: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+def init_job_queue():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at)")
+    register_maintenance_task("jobs", purge_expired_jobs)
+
+def _row_to_job(row) -> dict:
+    job_id, status, result, error, created_at, updated_at = row
+    return {
+        "job_id": job_id,
+        "status": status,
+        "result": json.loads(result) if result is not None else None,
+        "error": error,
+        "created_at": created_at,
+        "updated_at": updated_at,
+    }
+
+def _update(job_id: str, status: str, result=None, error: str | None = None):
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+            (status, json.dumps(result) if result is not None else None, error, now, job_id)
+        )
+    with _lock:
+        listeners = list(_listeners.get(job_id, []))
+    if not listeners:
+        return
+
+    snapshot = get_job(job_id)
+    # Wake up any SSE streams waiting on this job from their own event loop.
+    for loop, queue in listeners:
+        loop.call_soon_threadsafe(queue.put_nowait, snapshot)
+
+def _run(job_id: str, fn, args):
+    try:
+        _update(job_id, "running")
+        result = fn(*args)
+        _update(job_id, "done", result=result)
+    except Exception as e:
+        print(f"Job {job_id} failed:", e)
+        _update(job_id, "failed", error=str(e))
+    finally:
+        # Frees the slot even when the job state could not be written
+        with _lock:
+            _in_flight.discard(job_id)
+
+def submit_job(fn, *args) -> str:
+    """
+    Queues fn(*args) on the bounded worker pool and returns a job id immediately.
+    Raises JobQueueFull when EXTRACTION_QUEUE_MAX jobs are already in flight.
+    """
+    job_id = uuid.uuid4().hex
+    with _lock:
+        if len(_in_flight) >= EXTRACTION_QUEUE_MAX:
+            raise JobQueueFull(f"{len(_in_flight)} extraction jobs already in flight")
+        _in_flight.add(job_id)
+
+    now = time.time()
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, created_at, updated_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, now, now)
+            )
+    except Exception:
+        with _lock:
+            _in_flight.discard(job_id)
+        raise
+
+    # Carry the caller's context (e.g. its trace id) into the worker thread
+    context = contextvars.copy_context()
+    _executor.submit(context.run, _run, job_id, fn, args)
+    return job_id
+
+def in_flight_count() -> int:
+    with _lock:
+        return len(_in_flight)
+
+QUEUE_DEPTH.set_function(in_flight_count, queue="extraction_jobs")
+
+def get_job(job_id: str) -> dict | None:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT job_id, status, result, error, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+    return _row_to_job(row) if row else None
+
+def purge_expired_jobs() -> int:
+    # Queued jobs can wait longer than the TTL behind a full pool, so only finished ones go
+    with get_connection() as conn:
+        return conn.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' for _ in TERMINAL_STATUSES)}) AND updated_at < ?",
+            (*TERMINAL_STATUSES, time.time() - JOB_TTL_SECONDS)
+        ).rowcount
+
+async def watch_job(job_id: str, heartbeat_seconds: float = 15.0):
+    """
+    Async generator yielding job snapshots as the job changes state, ending once it
+    reaches a terminal status. Yields None as a keep-alive when nothing has changed.
+    Changes made in this process are pushed; those of a job run by another worker
+    process are picked up from the database every JOB_POLL_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    with _lock:
+        _listeners.setdefault(job_id, []).append((loop, queue))
+
+    try:
+        current = await asyncio.to_thread(get_job, job_id)
+        if not current:
+            return
+        yield current
+        quiet = 0.0
+        while current["status"] not in TERMINAL_STATUSES:
+            try:
+                current = await asyncio.wait_for(queue.get(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                latest = await asyncio.to_thread(get_job, job_id)
+                if latest is None:
+                    return
+                if latest["updated_at"] == current["updated_at"]:
+                    quiet += JOB_POLL_SECONDS
+                    if quiet >= heartbeat_seconds:
+                        quiet = 0.0
+                        yield None
+                    continue
+                current = latest
+            quiet = 0.0
+            yield current
+    finally:
+        with _lock:
+            listeners = _listeners.get(job_id, [])
+            if (loop, queue) in listeners:
+                listeners.remove((loop, queue))
+            if not listeners:
+                _listeners.pop(job_id, None)
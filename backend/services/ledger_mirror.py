@@ -0,0 +1,151 @@
+import datetime
+from services.database import get_connection
+
+# Ledger dates are handwritten, mostly day-first (Indian convention).
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y",
+                "%d %b %Y", "%d %B %Y", "%d-%b-%Y", "%b %d %Y", "%B %d %Y")
+YEARLESS_DATE_FORMATS = ("%d/%m", "%d-%m", "%d.%m", "%d %b", "%d %B")
+
+def init_ledger_mirror():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ledger_rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spreadsheet_id TEXT,
+                tab_name TEXT,
+                sheet_gid INTEGER,
+                source TEXT,
+                entry_date TEXT,
+                entry_day TEXT,
+                name TEXT,
+                name_norm TEXT,
+                amount REAL,
+                amount_text TEXT,
+                status TEXT,
+                synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_rows_entry_day ON ledger_rows (entry_day)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_rows_name_day ON ledger_rows (name_norm, entry_day)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_rows_source ON ledger_rows (source, id)")
+
+def normalize_name(name: str) -> str:
+    return " ".join(str(name).lower().split())
+
+def parse_entry_day(value: str, fallback: datetime.date) -> str | None:
+    """
+    Best-effort ISO date (YYYY-MM-DD) for a handwritten date. Dates without a year take
+    the year of `fallback` (the sync date); unparseable ones ("N/A") give None.
+    """
+    text = " ".join(str(value).replace(",", " ").split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    for fmt in YEARLESS_DATE_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(f"{text} {fallback.year}", f"{fmt} %Y").date()
+            return parsed.isoformat()
+        except ValueError:
+            pass
+    return None
+
+def parse_amount(value: str) -> float | None:
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+def mirror_rows(spreadsheet_id: str, tab_name: str, sheet_gid: int, values: list[list[str]], source: str = ""):
+    """
+    Copies rows just written to Google Sheets ([date, name, amount, status] each) into the local mirror.
+    """
+    today = datetime.date.today()
+    params = [
+        (spreadsheet_id, tab_name, sheet_gid, source, str(date), parse_entry_day(date, today),
+         str(name), normalize_name(name), parse_amount(amount), str(amount), str(status))
+        for date, name, amount, status in (list(row) + [""] * (4 - len(row)) for row in values)
+    ]
+    with get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO ledger_rows (spreadsheet_id, tab_name, sheet_gid, source, entry_date, entry_day,
+                                     name, name_norm, amount, amount_text, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, params)
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _filters(name: str = "", query: str = "", status: str = "", date_from: str = "", date_to: str = "", source: str = "") -> tuple[str, list]:
+    clauses, params = [], []
+    if name:
+        clauses.append("name_norm = ?")
+        params.append(normalize_name(name))
+    if query:
+        clauses.append("name_norm LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(normalize_name(query))}%")
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    # Rows without a parseable date have a NULL entry_day and never match a date range
+    if date_from:
+        clauses.append("entry_day >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("entry_day <= ?")
+        params.append(date_to)
+    if source:
+        clauses.append("source = ?")
+        params.append(source)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+ROW_COLUMNS = ("id", "entry_date", "entry_day", "name", "amount", "amount_text", "status", "tab_name", "sheet_gid", "source", "synced_at")
+
+def search_rows(limit: int = 50, before_id: int | None = None, **filters) -> list[dict]:
+    """
+    Newest-first matching rows. Pass the last id of a page as before_id to get the next page.
+    """
+    where, params = _filters(**filters)
+    if before_id is not None:
+        where += (" AND " if where else " WHERE ") + "id < ?"
+        params.append(before_id)
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(ROW_COLUMNS)} FROM ledger_rows{where} ORDER BY id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+    return [dict(zip(ROW_COLUMNS, row)) for row in rows]
+
+def summarize_rows(group_by: str = "", **filters) -> dict:
+    """
+    Totals over matching rows, optionally grouped by "name", "day" or "month".
+    """
+    where, params = _filters(**filters)
+    with get_connection() as conn:
+        total = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM ledger_rows{where}", params
+        ).fetchone()
+        groups = []
+        group_expr = {"name": "name_norm", "day": "entry_day", "month": "substr(entry_day, 1, 7)"}.get(group_by)
+        if group_expr:
+            groups = [
+                {"key": key, "count": count, "total_amount": amount}
+                for key, count, amount in conn.execute(
+                    f"SELECT {group_expr}, COUNT(*), COALESCE(SUM(amount), 0) FROM ledger_rows{where} "
+                    f"GROUP BY 1 ORDER BY 3 DESC",
+                    params
+                )
+            ]
+    return {"count": total[0], "total_amount": total[1], "group_by": group_by or None, "groups": groups}
+
+def recent_rows(source: str, limit: int) -> list[list[str]]:
+    """
+    The latest `limit` rows for a source, oldest first, in sheet row format.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT entry_date, name, amount_text, status FROM ledger_rows WHERE source = ? ORDER BY id DESC LIMIT ?",
+            (source, limit)
+        ).fetchall()
+    return [list(row) for row in reversed(rows)]
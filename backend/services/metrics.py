@@ -0,0 +1,180 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Record per-stage spans grouped by trace id (one image, upload or record) for /traces.
+TRACE_SPANS = os.getenv("TRACE_SPANS", "0") != "0"
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "500"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_lock = threading.Lock()
+_current_trace: contextvars.ContextVar[str | None] = contextvars.ContextVar("airstore_trace_id", default=None)
+_traces: "OrderedDict[str, dict]" = OrderedDict()
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class Gauge:
+    """
+    Gauge read from a callback at scrape time (e.g. a queue's current depth).
+    """
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._callbacks: dict[tuple, callable] = {}
+
+    def set_function(self, fn, **labels):
+        self._callbacks[_label_key(labels)] = fn
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for key, fn in list(self._callbacks.items()):
+            try:
+                lines.append(f"{self.name}{_format_labels(key)} {float(fn())}")
+            except Exception as e:
+                print(f"Gauge {self.name} failed:", e)
+        return lines
+
+STAGE_DURATION = Histogram("airstore_stage_duration_seconds", "Duration of pipeline stages.")
+EXTERNAL_CALL_DURATION = Histogram("airstore_external_call_duration_seconds", "Duration of calls to external APIs.")
+ERRORS = Counter("airstore_errors_total", "Failed pipeline stages and external calls.")
+RETRIES = Counter("airstore_retries_total", "Retried external API calls.")
+EVENTS = Counter("airstore_events_total", "Notable pipeline events (cache hits, duplicates, ...).")
+EXTRACTION_TIERS = Counter("airstore_extraction_tier_total", "Extractions by the model tier that served them.")
+EXTRACTION_ESCALATIONS = Counter("airstore_extraction_escalations_total", "Extractions retried on a stronger model, by reason.")
+QUEUE_DEPTH = Gauge("airstore_queue_depth", "Items waiting or in flight per internal queue.")
+
+_METRICS = (STAGE_DURATION, EXTERNAL_CALL_DURATION, ERRORS, RETRIES, EVENTS, EXTRACTION_TIERS, EXTRACTION_ESCALATIONS, QUEUE_DEPTH)
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def start_trace(kind: str, **attributes) -> str | None:
+    """
+    Starts a trace for one image/upload/record in the current context; stages observed
+    from here on (including in worker threads started via run_in_threadpool) attach to it.
+    """
+    if not TRACE_SPANS:
+        return None
+    trace_id = uuid.uuid4().hex
+    with _lock:
+        _traces[trace_id] = {"trace_id": trace_id, "kind": kind, "attributes": attributes, "started_at": time.time(), "spans": []}
+        while len(_traces) > TRACE_MAX_TRACES:
+            _traces.popitem(last=False)
+    _current_trace.set(trace_id)
+    return trace_id
+
+def current_trace_id() -> str | None:
+    return _current_trace.get()
+
+def _record_span(name: str, start: float, duration: float, error: str = ""):
+    trace_id = _current_trace.get()
+    if not trace_id:
+        return
+    with _lock:
+        trace = _traces.get(trace_id)
+        if trace is not None:
+            trace["spans"].append({"name": name, "start": round(start, 6), "duration": round(duration, 6), "error": error})
+
+def get_trace(trace_id: str) -> dict | None:
+    with _lock:
+        trace = _traces.get(trace_id)
+        return {**trace, "spans": list(trace["spans"])} if trace else None
+
+def recent_traces(limit: int = 50) -> list[dict]:
+    with _lock:
+        traces = list(_traces.values())[-limit:]
+    return [{k: t[k] for k in ("trace_id", "kind", "attributes", "started_at")} | {"span_count": len(t["spans"])} for t in reversed(traces)]
+
+@contextmanager
+def _timed(histogram: Histogram, span_name: str, **labels):
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = ""
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        ERRORS.inc(source=span_name)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        histogram.observe(duration, **labels)
+        if TRACE_SPANS:
+            _record_span(span_name, start_wall, duration, error)
+
+def observe_stage(stage: str):
+    """
+    Context manager timing one pipeline stage; failures count towards airstore_errors_total.
+    """
+    return _timed(STAGE_DURATION, stage, stage=stage)
+
+def observe_call(api: str, operation: str):
+    """
+    Context manager timing one call to an external API (gemini, sheets, drive, graph).
+    """
+    return _timed(EXTERNAL_CALL_DURATION, f"{api}.{operation}", api=api, operation=operation)
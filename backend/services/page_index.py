@@ -0,0 +1,222 @@
+import io
+import os
+import json
+import itertools
+import threading
+from services.database import get_connection, register_maintenance_task
+from services.image_preprocessing import crop_to_paper
+
+# What happens when an upload looks like a page seen before:
+#   off   - no lookup (the default: hashing costs a decode per upload and a near match can be a different page)
+#   flag  - extract as usual, the extraction carries `duplicate_of`
+#   reuse - skip Gemini and answer with the earlier extraction (also carrying `duplicate_of`)
+PAGE_DEDUP_MODE = os.getenv("PAGE_DEDUP_MODE", "off")
+# Max differing bits (of 64) for two photos to count as the same page. Resent and re-shot
+# photos of a page typically differ by under 6 bits, different pages by well over 12;
+# noticeably rotated or reframed re-shots may not be caught.
+PAGE_DEDUP_MAX_DISTANCE = int(os.getenv("PAGE_DEDUP_MAX_DISTANCE", "7"))
+PAGE_INDEX_TTL_SECONDS = int(os.getenv("PAGE_INDEX_TTL_SECONDS", str(180 * 24 * 3600)))
+
+HASH_GRID = 8
+HASH_DECODE_EDGE = 512
+
+def page_hash(image_bytes: bytes, mime_type: str) -> int | None:
+    """
+    64-bit difference hash (dHash) of the photographed page. The photo is cropped to the
+    paper, blurred and contrast-stretched first, so resending, recompressing or re-shooting
+    the page under different light moves only a few bits. Returns None for non-images.
+    """
+    if not mime_type.startswith("image/"):
+        return None
+
+    from PIL import Image, ImageOps, ImageFilter
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # JPEGs are decoded at reduced scale, which is most of the speed-up.
+        img.draft("L", (HASH_DECODE_EDGE, HASH_DECODE_EDGE))
+        img = ImageOps.exif_transpose(img).convert("L")
+    except Exception as e:
+        print(f"Page hash skipped: {e}")
+        return None
+
+    img.thumbnail((HASH_DECODE_EDGE, HASH_DECODE_EDGE))
+    img = crop_to_paper(img)
+    img = ImageOps.autocontrast(img.filter(ImageFilter.GaussianBlur(2)), cutoff=1)
+    cells = list(img.resize((HASH_GRID + 1, HASH_GRID), resample=Image.Resampling.BOX).getdata())
+
+    bits = 0
+    for row in range(HASH_GRID):
+        for col in range(HASH_GRID):
+            left = cells[row * (HASH_GRID + 1) + col]
+            right = cells[row * (HASH_GRID + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+class MultiIndexHash:
+    """
+    Hamming-distance index over 64-bit hashes (multi-index hashing). Each hash is split
+    into 4 16-bit chunks with one table per chunk. Two hashes within distance r agree on
+    at least one chunk up to r // 4 bits, so a search only probes that many bit flips of
+    each chunk (17 buckets per chunk for r < 8) instead of scanning every hash.
+    """
+
+    def __init__(self, chunks: int = 4):
+        self.chunks = chunks
+        self.chunk_bits = 64 // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables: list[dict[int, list[int]]] = [{} for _ in range(chunks)]
+        self._hashes: dict[int, int] = {}
+        self._flips: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def _parts(self, value: int) -> list[int]:
+        return [(value >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def _flip_masks(self, radius: int) -> list[int]:
+        if radius not in self._flips:
+            masks = []
+            for r in range(radius + 1):
+                for bits in itertools.combinations(range(self.chunk_bits), r):
+                    masks.append(sum(1 << b for b in bits))
+            self._flips[radius] = masks
+        return self._flips[radius]
+
+    def add(self, item_id: int, value: int):
+        if item_id in self._hashes:
+            return
+        self._hashes[item_id] = value
+        for table, part in zip(self._tables, self._parts(value)):
+            table.setdefault(part, []).append(item_id)
+
+    def remove(self, item_id: int):
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, part in zip(self._tables, self._parts(value)):
+            bucket = table.get(part, [])
+            if item_id in bucket:
+                bucket.remove(item_id)
+            if not bucket:
+                table.pop(part, None)
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        """
+        Every (distance, item_id) within max_distance of value, nearest first.
+        """
+        masks = self._flip_masks(max_distance // self.chunks)
+        seen = set()
+        found = []
+        for table, part in zip(self._tables, self._parts(value)):
+            for mask in masks:
+                for item_id in table.get(part ^ mask, ()):
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                    distance = (self._hashes[item_id] ^ value).bit_count()
+                    if distance <= max_distance:
+                        found.append((distance, item_id))
+        return sorted(found)
+
+_index = MultiIndexHash()
+_index_lock = threading.Lock()
+_loaded_id = 0
+_stats = {"lookups": 0, "matches": 0, "stored": 0, "purged": 0}
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def init_page_index():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_hashes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                page_hash INTEGER,
+                data TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_page_hashes_created_at ON page_hashes (created_at)")
+    register_maintenance_task("page_index", purge_expired_pages)
+
+def load_page_index():
+    """
+    Adds pages stored since the last call, including those stored by other worker
+    processes. The first call loads the whole table.
+    """
+    global _loaded_id
+    with get_connection() as conn:
+        rows = conn.execute("SELECT id, page_hash FROM page_hashes WHERE id > ? ORDER BY id", (_loaded_id,)).fetchall()
+    with _index_lock:
+        for page_id, value in rows:
+            _index.add(page_id, value & ((1 << 64) - 1))
+            _loaded_id = max(_loaded_id, page_id)
+
+def find_similar_page(value: int) -> dict | None:
+    """
+    The closest stored page within PAGE_DEDUP_MAX_DISTANCE as
+    {"page_id", "distance", "first_seen", "data"}, or None.
+    """
+    load_page_index()
+    with _index_lock:
+        _stats["lookups"] += 1
+        matches = _index.search(value, PAGE_DEDUP_MAX_DISTANCE)
+
+    for distance, page_id in matches:
+        with get_connection() as conn:
+            row = conn.execute("SELECT data, created_at FROM page_hashes WHERE id = ?", (page_id,)).fetchone()
+        if row:
+            with _index_lock:
+                _stats["matches"] += 1
+            return {"page_id": page_id, "distance": distance, "first_seen": row[1], "data": json.loads(row[0])}
+    return None
+
+def remember_page(value: int, data: dict) -> int:
+    with get_connection() as conn:
+        page_id = conn.execute(
+            "INSERT INTO page_hashes (page_hash, data) VALUES (?, ?)", (_to_signed(value), json.dumps(data))
+        ).lastrowid
+    with _index_lock:
+        _index.add(page_id, value)
+        _stats["stored"] += 1
+    return page_id
+
+def format_page_hash(value: int) -> str:
+    # Hex, since JSON clients lose precision on 64-bit integers
+    return f"{value:016x}"
+
+def remember_sent_pages(extractions: list[dict]):
+    """
+    Stores the pages whose rows have just been written to Sheets, so later photos of them
+    count as duplicates. Only extractions carrying a `page_hash` (new pages) are stored,
+    without it. Never raises: the rows are already written.
+    """
+    for extraction in extractions:
+        value = extraction.get("page_hash")
+        if not value:
+            continue
+        try:
+            remember_page(int(value, 16), {k: v for k, v in extraction.items() if k != "page_hash"})
+        except Exception as e:
+            print(f"Could not store page hash {value}: {e}")
+
+def purge_expired_pages() -> int:
+    if PAGE_INDEX_TTL_SECONDS <= 0:
+        return 0
+    with get_connection() as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM page_hashes WHERE created_at < datetime('now', ?)", (f"-{PAGE_INDEX_TTL_SECONDS} seconds",)
+        )]
+        conn.executemany("DELETE FROM page_hashes WHERE id = ?", [(page_id,) for page_id in ids])
+    # Other workers drop theirs lazily: a lookup that hits a deleted row is skipped.
+    with _index_lock:
+        for page_id in ids:
+            _index.remove(page_id)
+        _stats["purged"] += len(ids)
+    return len(ids)
+
+def get_page_index_stats() -> dict:
+    with _index_lock:
+        return {**_stats, "pages": len(_index), "mode": PAGE_DEDUP_MODE, "max_distance": PAGE_DEDUP_MAX_DISTANCE}
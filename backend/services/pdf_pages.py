@@ -0,0 +1,18 @@
+import io
+
+def split_pdf_pages(pdf_bytes: bytes) -> list[bytes]:
+    """
+    Splits a multi-page PDF into one single-page PDF per page, so each page can be
+    extracted independently (Gemini accepts application/pdf inline).
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    pages = []
+    for page in reader.pages:
+        writer = PdfWriter()
+        writer.add_page(page)
+        out = io.BytesIO()
+        writer.write(out)
+        pages.append(out.getvalue())
+    return pages
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import uuid
+import base64
+import sqlite3
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from services.database import get_connection, register_maintenance_task
+
+# PENDING rows hold full extraction JSON and are abandoned if the user never confirms.
+RECORDS_PENDING_TTL_SECONDS = int(os.getenv("RECORDS_PENDING_TTL_SECONDS", str(3 * 24 * 3600)))
+# CONFIRMED rows are already in Google Sheets; 0 keeps them forever.
+RECORDS_CONFIRMED_TTL_SECONDS = int(os.getenv("RECORDS_CONFIRMED_TTL_SECONDS", str(30 * 24 * 3600)))
+# A confirm that crashed mid-sync is released back to PENDING after this long.
+RECORDS_SYNCING_TIMEOUT_SECONDS = int(os.getenv("RECORDS_SYNCING_TIMEOUT_SECONDS", "600"))
+RECORDS_PURGE_BATCH_SIZE = int(os.getenv("RECORDS_PURGE_BATCH_SIZE", "5000"))
+# Records and /records pages served from memory. Changes made by this process invalidate
+# them at once; changes made by other worker processes show up after the TTL.
+RECORDS_CACHE_SIZE = int(os.getenv("RECORDS_CACHE_SIZE", "1024"))
+RECORDS_CACHE_TTL_SECONDS = float(os.getenv("RECORDS_CACHE_TTL_SECONDS", "5"))
+RECORDS_PAGE_MAX = 200
+RECORD_STATUSES = ("PENDING", "SYNCING", "CONFIRMED")
+# updated_at keeps milliseconds: If-Modified-Since has to tell apart changes within a second
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+_cache: OrderedDict[tuple, tuple[float, int, dict | None]] = OrderedDict()
+_cache_lock = threading.Lock()
+# Bumped by every write, so cached list pages are dropped along with the records.
+_generation = 0
+
+def init_record_store():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id TEXT PRIMARY KEY,
+                data TEXT,
+                status TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(records)")}
+        if "updated_at" not in columns:
+            try:
+                conn.execute("ALTER TABLE records ADD COLUMN updated_at TIMESTAMP")
+            except sqlite3.OperationalError as e:
+                # Another worker process added it first
+                if "duplicate column" not in str(e):
+                    raise
+        # (created_at, id) is the /records keyset; these replace the created_at-only indexes
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_records_status_created_id ON records (status, created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_records_created_id ON records (created_at, id)")
+        conn.execute("DROP INDEX IF EXISTS idx_records_status_created_at")
+        conn.execute("DROP INDEX IF EXISTS idx_records_created_at")
+    register_maintenance_task("records", purge_expired_records)
+
+def _invalidate(record_id: str | None = None):
+    """
+    Drops cached list pages, and the cached record when given (all records when not).
+    """
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if record_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(("record", record_id), None)
+
+def _cached(key: tuple, load):
+    """
+    load() through the in-process LRU cache; entries expire after RECORDS_CACHE_TTL_SECONDS
+    and whenever a write happened after they were loaded.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now and (key[0] == "record" or hit[1] == _generation):
+            _cache.move_to_end(key)
+            return hit[2]
+        generation = _generation
+    value = load()
+    with _cache_lock:
+        # A write that raced with the load has already bumped the generation: keep it uncached.
+        # Misses are not cached either; the record may be created by another worker any moment.
+        if value is not None and generation == _generation:
+            _cache[key] = (now + RECORDS_CACHE_TTL_SECONDS, generation, value)
+            _cache.move_to_end(key)
+            while len(_cache) > RECORDS_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return value
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20] + '"'
+
+def _utc(timestamp: str | None) -> datetime.datetime | None:
+    # SQLite timestamps are UTC "YYYY-MM-DD HH:MM:SS[.SSS]"
+    if not timestamp:
+        return None
+    return datetime.datetime.fromisoformat(timestamp).replace(tzinfo=datetime.timezone.utc)
+
+def create_record(data: dict, status: str = "PENDING") -> str:
+    record_id = str(uuid.uuid4())
+    with get_connection() as conn:
+        conn.execute(
+            f"INSERT INTO records (id, data, status, updated_at) VALUES (?, ?, ?, {NOW})",
+            (record_id, json.dumps(data), status)
+        )
+    _invalidate(record_id)
+    return record_id
+
+def get_record_version(record_id: str) -> dict | None:
+    """
+    The record as {"data", "status", "created_at", "updated_at", "etag", "modified_at"},
+    or None. Served from the in-process cache when possible, so a poll of an unchanged
+    record does not touch the database or parse its JSON again.
+    """
+    def load():
+        with get_connection() as conn:
+            row = conn.execute(
+                "SELECT data, status, created_at, COALESCE(updated_at, created_at) FROM records WHERE id = ?", (record_id,)
+            ).fetchone()
+        if not row:
+            return None
+        data_text, status, created_at, updated_at = row
+        return {
+            "data": json.loads(data_text),
+            "status": status,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "etag": _etag(record_id, status, hashlib.sha1(data_text.encode()).hexdigest()),
+            "modified_at": _utc(updated_at),
+        }
+    return _cached(("record", record_id), load)
+
+def _encode_cursor(created_at: str, record_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}|{record_id}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|", 1)
+        return created_at, record_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def list_records(status: str = "", limit: int = 50, cursor: str = "", with_data: bool = False) -> dict:
+    """
+    One page of records, newest first, as {"records", "next_cursor", "etag", "modified_at"}.
+    modified_at is always None: a record leaving the page (confirmed out of a status filter,
+    purged) changes the list without making it any newer, so lists are validated by ETag only.
+    Keyset pagination on (created_at, id): pass the previous page's next_cursor to continue,
+    which stays fast however deep the listing goes and never skips or repeats a record.
+    Each record has its entry count; the full extraction only with with_data. Raises
+    ValueError for a malformed cursor.
+    """
+    limit = max(1, min(limit, RECORDS_PAGE_MAX))
+    after = _decode_cursor(cursor) if cursor else None
+
+    def load():
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if after:
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = "id, status, created_at, COALESCE(updated_at, created_at), json_array_length(data, '$.entries')"
+        if with_data:
+            columns += ", data"
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {columns} FROM records {where} ORDER BY created_at DESC, id DESC LIMIT ?", params + [limit + 1]
+            ).fetchall()
+
+        records = []
+        for row in rows[:limit]:
+            record = {"record_id": row[0], "status": row[1], "created_at": row[2], "updated_at": row[3], "entry_count": row[4] or 0}
+            if with_data:
+                record["data"] = json.loads(row[5])
+            records.append(record)
+        last = rows[limit - 1] if len(rows) > limit else None
+        next_cursor = _encode_cursor(last[2], last[0]) if last else None
+        return {
+            "records": records,
+            "next_cursor": next_cursor,
+            "etag": _etag(status, cursor, limit, with_data, next_cursor, *((r["record_id"], r["status"], r["updated_at"]) for r in records)),
+            "modified_at": None,
+        }
+    return _cached(("list", status, cursor, limit, with_data), load)
+
+def claim_for_confirm(record_id: str) -> str | None:
+    """
+    Atomically moves a PENDING record to SYNCING so only one confirm can write it to Sheets.
+    Returns "CLAIMED" on success, otherwise the record's current status (None if missing).
+    """
+    with get_connection() as conn:
+        claimed = conn.execute(
+            f"UPDATE records SET status = 'SYNCING', updated_at = {NOW} WHERE id = ? AND status = 'PENDING'",
+            (record_id,)
+        ).rowcount
+        if not claimed:
+            row = conn.execute("SELECT status FROM records WHERE id = ?", (record_id,)).fetchone()
+    if claimed:
+        _invalidate(record_id)
+        return "CLAIMED"
+    return row[0] if row else None
+
+def release_claim(record_id: str):
+    with get_connection() as conn:
+        conn.execute(
+            f"UPDATE records SET status = 'PENDING', updated_at = {NOW} WHERE id = ? AND status = 'SYNCING'",
+            (record_id,)
+        )
+    _invalidate(record_id)
+
+def mark_confirmed(record_id: str, data: dict):
+    with get_connection() as conn:
+        conn.execute(
+            f"UPDATE records SET status = 'CONFIRMED', data = ?, updated_at = {NOW} WHERE id = ?",
+            (json.dumps(data), record_id)
+        )
+    _invalidate(record_id)
+
+def _delete_in_batches(where: str, params: tuple) -> int:
+    # Small batches keep each write transaction short so request handlers are never blocked for long.
+    deleted = 0
+    while True:
+        with get_connection() as conn:
+            count = conn.execute(
+                f"DELETE FROM records WHERE id IN (SELECT id FROM records WHERE {where} LIMIT ?)",
+                params + (RECORDS_PURGE_BATCH_SIZE,)
+            ).rowcount
+        deleted += count
+        if count < RECORDS_PURGE_BATCH_SIZE:
+            return deleted
+
+def purge_expired_records() -> dict:
+    """
+    Deletes stale PENDING and old CONFIRMED rows and releases stuck SYNCING claims.
+    """
+    result = {"pending": 0, "confirmed": 0, "released": 0}
+    result["pending"] = _delete_in_batches(
+        "status = 'PENDING' AND created_at < datetime('now', ?)",
+        (f"-{RECORDS_PENDING_TTL_SECONDS} seconds",)
+    )
+    if RECORDS_CONFIRMED_TTL_SECONDS > 0:
+        result["confirmed"] = _delete_in_batches(
+            "status = 'CONFIRMED' AND created_at < datetime('now', ?)",
+            (f"-{RECORDS_CONFIRMED_TTL_SECONDS} seconds",)
+        )
+    with get_connection() as conn:
+        result["released"] = conn.execute(
+            f"UPDATE records SET status = 'PENDING', updated_at = {NOW} "
+            "WHERE status = 'SYNCING' AND updated_at < datetime('now', ?)",
+            (f"-{RECORDS_SYNCING_TIMEOUT_SECONDS} seconds",)
+        ).rowcount
+    if any(result.values()):
+        _invalidate()
+    return result
@@ -0,0 +1,62 @@
+import time
+import asyncio
+
+class SenderBatcher:
+    """
+    Per-sender debounce window. Items added for a sender are held until no new item has
+    arrived for `window_seconds` (or `max_wait_seconds` after the first one, or
+    `max_batch` items), then handed to `handler(sender, items)` as one batch.
+    Must be used from the event loop.
+    """
+
+    def __init__(self, handler, window_seconds: float, max_wait_seconds: float, max_batch: int):
+        self.handler = handler
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.max_batch = max_batch
+        self._pending: dict[str, list] = {}
+        self._first_seen: dict[str, float] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, sender: str, item):
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(sender, [])
+        pending.append(item)
+        first_seen = self._first_seen.setdefault(sender, time.monotonic())
+
+        timer = self._timers.pop(sender, None)
+        if timer:
+            timer.cancel()
+
+        if len(pending) >= self.max_batch:
+            self._flush(sender)
+            return
+        remaining = self.max_wait_seconds - (time.monotonic() - first_seen)
+        self._timers[sender] = loop.call_later(max(0.0, min(self.window_seconds, remaining)), self._flush, sender)
+
+    def pending_count(self) -> int:
+        return sum(len(items) for items in self._pending.values())
+
+    def _flush(self, sender: str):
+        self._timers.pop(sender, None)
+        self._first_seen.pop(sender, None)
+        items = self._pending.pop(sender, [])
+        if not items:
+            return
+        # Keep a reference so the task is not garbage collected mid-flight.
+        task = asyncio.get_running_loop().create_task(self.handler(sender, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """
+        Flushes every open window immediately and waits for all batches to finish.
+        """
+        for sender in list(self._pending):
+            timer = self._timers.pop(sender, None)
+            if timer:
+                timer.cancel()
+            self._flush(sender)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
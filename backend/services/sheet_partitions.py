@@ -0,0 +1,109 @@
+import sqlite3
+from services.database import get_connection
+
+def init_sheet_partitions():
+    with get_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_spreadsheets (
+                base_id TEXT,
+                seq INTEGER,
+                spreadsheet_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (base_id, seq)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_partitions (
+                spreadsheet_id TEXT,
+                partition_key TEXT,
+                part INTEGER,
+                tab_name TEXT,
+                sheet_gid INTEGER,
+                row_count INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (spreadsheet_id, partition_key, part)
+            )
+        """)
+
+def current_spreadsheet(base_id: str) -> str:
+    """
+    The spreadsheet new rows go to: the latest rollover of base_id, or base_id itself.
+    """
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT spreadsheet_id FROM sheet_spreadsheets WHERE base_id = ? ORDER BY seq DESC LIMIT 1",
+            (base_id,)
+        ).fetchone()
+    return row[0] if row else base_id
+
+def add_spreadsheet(base_id: str, spreadsheet_id: str) -> bool:
+    """
+    Records a rollover spreadsheet as the new current one. Returns False if another
+    worker rolled over first.
+    """
+    with get_connection() as conn:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sheet_spreadsheets WHERE base_id = ?", (base_id,)).fetchone()[0]
+        try:
+            conn.execute(
+                "INSERT INTO sheet_spreadsheets (base_id, seq, spreadsheet_id) VALUES (?, ?, ?)",
+                (base_id, seq + 1, spreadsheet_id)
+            )
+        except sqlite3.IntegrityError:
+            return False
+    return True
+
+def spreadsheet_rows(spreadsheet_id: str) -> int:
+    """
+    Rows (headers included) written to partition tabs of this spreadsheet.
+    """
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(row_count), 0) FROM sheet_partitions WHERE spreadsheet_id = ?",
+            (spreadsheet_id,)
+        ).fetchone()[0]
+
+PARTITION_COLUMNS = ("spreadsheet_id", "partition_key", "part", "tab_name", "sheet_gid", "row_count")
+
+def latest_partition(spreadsheet_id: str, partition_key: str) -> dict | None:
+    with get_connection() as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(PARTITION_COLUMNS)} FROM sheet_partitions "
+            "WHERE spreadsheet_id = ? AND partition_key = ? ORDER BY part DESC LIMIT 1",
+            (spreadsheet_id, partition_key)
+        ).fetchone()
+    return dict(zip(PARTITION_COLUMNS, row)) if row else None
+
+def add_partition(spreadsheet_id: str, partition_key: str, part: int, tab_name: str, sheet_gid: int, row_count: int):
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sheet_partitions (spreadsheet_id, partition_key, part, tab_name, sheet_gid, row_count) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (spreadsheet_id, partition_key, part, tab_name, sheet_gid, row_count)
+        )
+
+def reserve_rows(partition: dict, count: int):
+    """
+    Counts rows against a partition before they are appended, so concurrent writers see the
+    tab filling up. Release them again if the append fails.
+    """
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE sheet_partitions SET row_count = row_count + ? WHERE spreadsheet_id = ? AND partition_key = ? AND part = ?",
+            (count, partition["spreadsheet_id"], partition["partition_key"], partition["part"])
+        )
+
+def release_rows(partition: dict, count: int):
+    reserve_rows(partition, -count)
+
+def list_partitions(base_id: str) -> list[dict]:
+    """
+    Every partition tab written for base_id and its rollovers, newest first.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join('p.' + c for c in PARTITION_COLUMNS)} FROM sheet_partitions p "
+            "WHERE p.spreadsheet_id = ? OR p.spreadsheet_id IN (SELECT spreadsheet_id FROM sheet_spreadsheets WHERE base_id = ?) "
+            "ORDER BY p.created_at DESC, p.part DESC",
+            (base_id, base_id)
+        ).fetchall()
+    return [dict(zip(PARTITION_COLUMNS, row)) for row in rows]
@@ -1,125 +1,406 @@
+import io
 import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-
-import json
+import math
+import random
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from services.google_clients import sheets_client, drive_client, drive_file_client
+from services.ledger_mirror import mirror_rows, DATE_FORMATS
+from services.sheet_partitions import current_spreadsheet, add_spreadsheet, spreadsheet_rows, latest_partition, add_partition, reserve_rows, release_rows
+from services.admission import admit, waiting_admission
+from services.metrics import observe_call, QUEUE_DEPTH, EVENTS
 
-def get_sheets_service():
-    # 1. First, check if there's a raw JSON string in the environment (Render deployment)
-    creds_json_string = os.getenv("GOOGLE_CREDENTIALS_JSON")
-    
-    if creds_json_string:
-        try:
-            creds_dict = json.loads(creds_json_string)
-            creds = service_account.Credentials.from_service_account_info(
-                creds_dict, scopes=SCOPES)
-            return build('sheets', 'v4', credentials=creds)
-        except Exception as e:
-            raise ValueError(f"Failed to parse GOOGLE_CREDENTIALS_JSON: {e}")
-
-    # 2. Fallback to local file-based credentials
-    creds_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    if not creds_file:
-        raise ValueError("Neither GOOGLE_CREDENTIALS_JSON nor GOOGLE_APPLICATION_CREDENTIALS is set in .env")
-
-    # If it's just the filename, resolve it explicitly to the backend folder
-    if not os.path.isabs(creds_file):
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        creds_file = os.path.join(base_dir, creds_file)
-
-    if not os.path.exists(creds_file):
-        raise ValueError(f"Google Credentials file NOT found at: {creds_file}.")
-    
-    creds = service_account.Credentials.from_service_account_file(
-        creds_file, scopes=SCOPES)
-    service = build('sheets', 'v4', credentials=creds)
-    
-    return service
-
-def get_drive_service():
-    """Initializes Google Drive API to download the spreadsheet."""
-    creds_json_string = os.getenv("GOOGLE_CREDENTIALS_JSON")
-    DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-    
-    if creds_json_string:
-        creds_dict = json.loads(creds_json_string)
-        creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=DRIVE_SCOPES)
-        return build('drive', 'v3', credentials=creds)
-
-    creds_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    if not os.path.isabs(creds_file):
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        creds_file = os.path.join(base_dir, creds_file)
-        
-    creds = service_account.Credentials.from_service_account_file(creds_file, scopes=DRIVE_SCOPES)
-    return build('drive', 'v3', credentials=creds)
 def append_to_sheet(spreadsheet_id: str, range_name: str, values: list[list[str]]):
     """
     Appends rows to the specified Google Sheet.
     values = [['Date', 'Name', 'Amount', 'Status'], ['10/12', 'Coffee', '5', 'Purchased']]
     """
-    service = get_sheets_service()
     body = {
         'values': values
     }
-    result = service.spreadsheets().values().append(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption="USER_ENTERED",
-        body=body
-    ).execute()
+    with admit("sheets"), sheets_client() as service, observe_call("sheets", "values_append"):
+        result = service.spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range=range_name,
+            valueInputOption="USER_ENTERED",
+            body=body
+        ).execute()
     return result
 
-def create_and_append_sheet(spreadsheet_id: str, new_sheet_name: str, values: list[list[str]]) -> int:
+HEADER_ROW = ["Date", "Description/Name", "Amount", "Status"]
+
+# Confirms arriving within this window are merged into one batchUpdate (0 disables coalescing).
+SHEETS_COALESCE_WINDOW_MS = int(os.getenv("SHEETS_COALESCE_WINDOW_MS", "0"))
+SHEETS_COALESCE_MAX_TABS = int(os.getenv("SHEETS_COALESCE_MAX_TABS", "20"))
+# Tabs created in the same minute are named "<name>_2", "<name>_3", ...; this many are tried when a name is taken.
+SHEETS_TAB_NAME_ATTEMPTS = int(os.getenv("SHEETS_TAB_NAME_ATTEMPTS", "5"))
+
+# Where uploads are written:
+#   tabs        - a new tab per upload (WebLog_/Log_ + minute timestamp)
+#   partitioned - appended to one tab per prefix and period, rolling over to a new tab after
+#                 SHEETS_PARTITION_MAX_ROWS rows and to a new spreadsheet after SHEETS_SPREADSHEET_MAX_CELLS cells
+SHEETS_LAYOUT = os.getenv("SHEETS_LAYOUT", "tabs")
+SHEETS_PARTITION_PERIOD = os.getenv("SHEETS_PARTITION_PERIOD", "month")
+SHEETS_PARTITION_MAX_ROWS = int(os.getenv("SHEETS_PARTITION_MAX_ROWS", "10000"))
+# Counts only partition tabs written by this app; Sheets allows 10M cells per spreadsheet in total.
+SHEETS_SPREADSHEET_MAX_CELLS = int(os.getenv("SHEETS_SPREADSHEET_MAX_CELLS", "2000000"))
+# Drive folder for rollover spreadsheets; share it with your account to see them. The files
+# are owned by the service account, so without a folder no rollover happens.
+SHEETS_ROLLOVER_FOLDER_ID = os.getenv("SHEETS_ROLLOVER_FOLDER_ID", "")
+SHEETS_ROLLOVER_TITLE = os.getenv("SHEETS_ROLLOVER_TITLE", "AirStore Ledger")
+PARTITION_PERIOD_FORMATS = {"day": "%Y-%b-%d", "month": "%Y-%b"}
+# Sheets date serials count days from 1899-12-30
+SHEETS_EPOCH = datetime.date(1899, 12, 30)
+DATE_CELL_FORMAT = {"numberFormat": {"type": "DATE", "pattern": "dd/mm/yyyy"}}
+CELL_FIELDS = "userEnteredValue,userEnteredFormat"
+
+def _parse_date(text: str) -> datetime.date | None:
+    text = " ".join(text.replace(",", " ").split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+def _to_cell(value) -> dict:
     """
-    Dynamically creates a new tab inside the Google Sheets file, adds headers, and appends the data.
-    Returns the newly created sheet's gid (sheetId).
+    Mirrors USER_ENTERED for the values we write: numeric strings become numbers, dates with
+    a year become real dates (read day-first, shown as dd/mm/yyyy), the rest stays text.
+    Dates without a year ("12/10") stay text rather than guessing one.
     """
-    service = get_sheets_service()
+    text = str(value)
+    try:
+        number = float(text.replace(",", ""))
+        if math.isfinite(number):
+            return {"userEnteredValue": {"numberValue": number}}
+    except ValueError:
+        pass
+    day = _parse_date(text)
+    if day is not None:
+        return {"userEnteredValue": {"numberValue": (day - SHEETS_EPOCH).days}, "userEnteredFormat": DATE_CELL_FORMAT}
+    return {"userEnteredValue": {"stringValue": text}}
 
-    # 1. Create a new sheet
-    requests = [{
-        "addSheet": {
-            "properties": {"title": new_sheet_name}
+def _new_sheet_requests(new_sheet_name: str, values: list[list[str]]) -> tuple[int, list[dict]]:
+    """
+    Builds addSheet + appendCells requests for one tab. The sheetId is chosen client-side
+    so the data rows can target the tab inside the same batchUpdate. The grid is sized to
+    the rows instead of the default 1000x26, which would count 26,000 cells against the
+    spreadsheet limit for every tab.
+    """
+    new_sheet_id = random.randint(1, 2**31 - 1)
+    rows = [{"values": [_to_cell(v) for v in row]} for row in [HEADER_ROW] + values]
+    requests = [
+        {
+            "addSheet": {
+                "properties": {
+                    "title": new_sheet_name,
+                    "sheetId": new_sheet_id,
+                    "gridProperties": {"rowCount": len(rows), "columnCount": len(HEADER_ROW), "frozenRowCount": 1}
+                }
+            }
+        },
+        {
+            "appendCells": {
+                "sheetId": new_sheet_id,
+                "rows": rows,
+                "fields": CELL_FIELDS
+            }
         }
-    }]
-    
-    body = {"requests": requests}
-    try:
+    ]
+    return new_sheet_id, requests
+
+def _create_sheets_batch(spreadsheet_id: str, tabs: list[tuple[str, list[list[str]]]]) -> list[int]:
+    """
+    Creates every (tab name, rows) pair in a single batchUpdate and returns their gids in order.
+    """
+    sheet_ids = []
+    requests = []
+    for new_sheet_name, values in tabs:
+        new_sheet_id, tab_requests = _new_sheet_requests(new_sheet_name, values)
+        sheet_ids.append(new_sheet_id)
+        requests.extend(tab_requests)
+
+    with admit("sheets"), sheets_client() as service, observe_call("sheets", "batch_update"):
         response = service.spreadsheets().batchUpdate(
             spreadsheetId=spreadsheet_id,
-            body=body
+            body={"requests": requests}
         ).execute()
-        new_sheet_id = response['replies'][0]['addSheet']['properties']['sheetId']
+
+    # Trust the ids echoed back by the API over the ones we asked for.
+    replies = [r for r in response.get("replies", []) if "addSheet" in r]
+    if len(replies) == len(sheet_ids):
+        sheet_ids = [r["addSheet"]["properties"]["sheetId"] for r in replies]
+    return sheet_ids
+
+def _is_duplicate_tab(e: Exception) -> bool:
+    return getattr(getattr(e, "resp", None), "status", None) == 400 and "already exists" in str(e)
+
+_tab_name_lock = threading.Lock()
+_tab_name_uses: OrderedDict[tuple[str, str], int] = OrderedDict()
+
+def _claim_tab_name(spreadsheet_id: str, name: str) -> str:
+    """
+    Hands out name, name_2, name_3, ... so concurrent uploads in the same minute never
+    send the same tab name. Only recent names are remembered.
+    """
+    with _tab_name_lock:
+        key = (spreadsheet_id, name)
+        uses = _tab_name_uses.pop(key, 0) + 1
+        _tab_name_uses[key] = uses
+        while len(_tab_name_uses) > 1024:
+            _tab_name_uses.popitem(last=False)
+    return name if uses == 1 else f"{name}_{uses}"
+
+class _SheetWriteCoalescer:
+    """
+    Collects create_and_append_sheet calls per spreadsheet for a short window and flushes
+    them as one batchUpdate. Each caller blocks on its own Future and gets its own gid.
+    """
+
+    def __init__(self, window_seconds: float, max_tabs: int):
+        self.window_seconds = window_seconds
+        self.max_tabs = max_tabs
+        self._lock = threading.Lock()
+        self._pending: dict[str, list[tuple[str, list[list[str]], Future]]] = {}
+        self._timers: dict[str, threading.Timer] = {}
+
+    def submit(self, spreadsheet_id: str, new_sheet_name: str, values: list[list[str]]) -> Future:
+        future = Future()
+        flush_now = None
+        with self._lock:
+            batch = self._pending.setdefault(spreadsheet_id, [])
+            batch.append((new_sheet_name, values, future))
+            if len(batch) == 1:
+                timer = threading.Timer(self.window_seconds, self._flush, args=(spreadsheet_id, batch))
+                timer.daemon = True
+                self._timers[spreadsheet_id] = timer
+                timer.start()
+            elif len(batch) >= self.max_tabs:
+                flush_now = self._pending.pop(spreadsheet_id)
+                # The next batch gets a full window of its own
+                self._timers.pop(spreadsheet_id).cancel()
+
+        if flush_now:
+            self._write(spreadsheet_id, flush_now)
+        return future
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(batch) for batch in self._pending.values())
+
+    def _flush(self, spreadsheet_id: str, batch: list):
+        with self._lock:
+            # A timer that fired while its batch was flushed early must not take the next one
+            if self._pending.get(spreadsheet_id) is not batch:
+                return
+            del self._pending[spreadsheet_id]
+            self._timers.pop(spreadsheet_id, None)
+        self._write(spreadsheet_id, batch)
+
+    def _write(self, spreadsheet_id: str, batch: list[tuple[str, list[list[str]], Future]]):
+        # Callers are already blocked on their futures: a coalesced write waits for quota, never gives up.
+        with waiting_admission():
+            self._write_batch(spreadsheet_id, batch)
+
+    def _write_batch(self, spreadsheet_id: str, batch: list[tuple[str, list[list[str]], Future]]):
+        try:
+            sheet_ids = _create_sheets_batch(spreadsheet_id, [(name, values) for name, values, _ in batch])
+            for (_, _, future), sheet_id in zip(batch, sheet_ids):
+                future.set_result(sheet_id)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            print(f"Coalesced sheet write failed, retrying {len(batch)} tabs individually: {e}")
+
+        # batchUpdate is atomic, so one bad tab (e.g. a duplicate name) fails the whole batch.
+        # Fall back to one call per tab so only the offending caller sees the error.
+        for name, values, future in batch:
+            try:
+                future.set_result(_create_sheets_batch(spreadsheet_id, [(name, values)])[0])
+            except Exception as e:
+                future.set_exception(e)
+
+_coalescer = _SheetWriteCoalescer(SHEETS_COALESCE_WINDOW_MS / 1000, SHEETS_COALESCE_MAX_TABS)
+QUEUE_DEPTH.set_function(_coalescer.pending_count, queue="sheets_coalescer")
+
+def _mirror(spreadsheet_id: str, tab_name: str, sheet_gid: int, values: list[list[str]], source: str):
+    try:
+        mirror_rows(spreadsheet_id, tab_name, sheet_gid, values, source)
     except Exception as e:
-        print(f"Error creating sheet: {e}")
-        raise
-        
-    # 2. Add header row + data rows to the new sheet
-    headers = [["Date", "Description/Name", "Amount", "Status"]]
-    full_data = headers + values
-    
-    append_to_sheet(spreadsheet_id, f"{new_sheet_name}!A:D", full_data)
-    
-    return new_sheet_id
+        # The rows are safely in Sheets; a mirror failure must not fail the write.
+        print(f"Error mirroring rows locally: {e}")
 
-import io
-from googleapiclient.http import MediaIoBaseDownload
+def _create_tab_with_rows(spreadsheet_id: str, new_sheet_name: str, values: list[list[str]], source: str) -> tuple[str, int]:
+    """
+    Creates the tab (suffixing the name if it is taken), writes the rows and mirrors them.
+    Returns (tab name, gid).
+    """
+    for attempt in range(1, SHEETS_TAB_NAME_ATTEMPTS + 1):
+        # A name can still be taken by another worker process or by hand: claim the next one and retry.
+        tab_name = _claim_tab_name(spreadsheet_id, new_sheet_name)
+        try:
+            if SHEETS_COALESCE_WINDOW_MS > 0:
+                new_sheet_id = _coalescer.submit(spreadsheet_id, tab_name, values).result()
+            else:
+                new_sheet_id = _create_sheets_batch(spreadsheet_id, [(tab_name, values)])[0]
+            break
+        except Exception as e:
+            if _is_duplicate_tab(e) and attempt < SHEETS_TAB_NAME_ATTEMPTS:
+                continue
+            print(f"Error creating sheet: {e}")
+            raise
+
+    _mirror(spreadsheet_id, tab_name, new_sheet_id, values, source)
+    return tab_name, new_sheet_id
+
+def create_and_append_sheet(spreadsheet_id: str, new_sheet_name: str, values: list[list[str]], source: str = "") -> int:
+    """
+    Dynamically creates a new tab inside the Google Sheets file, adds headers, and appends the data.
+    Tab creation, header row and data rows are sent in a single batchUpdate.
+    Written rows are also copied into the local ledger mirror, tagged with `source`.
+    Returns the newly created sheet's gid (sheetId).
+    """
+    return _create_tab_with_rows(spreadsheet_id, new_sheet_name, values, source)[1]
+
+def _append_rows(spreadsheet_id: str, sheet_gid: int, values: list[list[str]]):
+    """
+    Appends rows to a known tab by gid, so no metadata lookup or A1 range is needed.
+    """
+    rows = [{"values": [_to_cell(v) for v in row]} for row in values]
+    request = {"appendCells": {"sheetId": sheet_gid, "rows": rows, "fields": CELL_FIELDS}}
+    with admit("sheets"), sheets_client() as service, observe_call("sheets", "batch_update"):
+        service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={"requests": [request]}).execute()
+
+def _lookup_sheet_gid(spreadsheet_id: str, tab_name: str) -> int | None:
+    with admit("sheets"), sheets_client() as service, observe_call("sheets", "get"):
+        metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,title)").execute()
+    for sheet in metadata.get("sheets", []):
+        if sheet["properties"]["title"] == tab_name:
+            return sheet["properties"]["sheetId"]
+    return None
+
+def _create_spreadsheet(title: str) -> str:
+    """
+    Creates the rollover spreadsheet through the Sheets API, under the spreadsheets scope the
+    service already has; the shared Drive client is read-only.
+    """
+    with admit("sheets"), sheets_client() as service, observe_call("sheets", "create"):
+        created = service.spreadsheets().create(body={"properties": {"title": title}}, fields="spreadsheetId").execute()
+    spreadsheet_id = created["spreadsheetId"]
+    _move_to_folder(spreadsheet_id, SHEETS_ROLLOVER_FOLDER_ID)
+    return spreadsheet_id
+
+def _move_to_folder(file_id: str, folder_id: str):
+    with admit("drive"), drive_file_client() as drive_service, observe_call("drive", "update"):
+        drive_service.files().update(fileId=file_id, addParents=folder_id, fields="id", supportsAllDrives=True).execute()
+
+def _roll_over(base_id: str, spreadsheet_id: str) -> str:
+    """
+    Moves writes for `base_id` to a new spreadsheet in SHEETS_ROLLOVER_FOLDER_ID and returns
+    its id. Only a file its owner can open is used: without a folder, or when creating or
+    moving it fails, writes stay in `spreadsheet_id`, which still has room below the
+    10M-cell hard limit.
+    """
+    if not SHEETS_ROLLOVER_FOLDER_ID:
+        EVENTS.inc(event="sheets_rollover_skipped")
+        print(f"Spreadsheet {spreadsheet_id} reached SHEETS_SPREADSHEET_MAX_CELLS but SHEETS_ROLLOVER_FOLDER_ID is not set; still writing to it")
+        return spreadsheet_id
+    try:
+        new_id = _create_spreadsheet(f"{SHEETS_ROLLOVER_TITLE} {datetime.date.today():%Y-%m-%d}")
+    except Exception as e:
+        EVENTS.inc(event="sheets_rollover_failed")
+        print(f"Sheets rollover of {spreadsheet_id} failed, still writing to it: {e}")
+        return spreadsheet_id
+    if not add_spreadsheet(base_id, new_id):
+        print(f"Rollover spreadsheet {new_id} is unused: another worker rolled over first")
+        return current_spreadsheet(base_id)
+    print(f"Sheets rollover: {base_id} continues in {new_id}")
+    EVENTS.inc(event="sheets_rollover")
+    return new_id
+
+def _open_partition(spreadsheet_id: str, partition_key: str, part: int, values: list[list[str]]) -> tuple[dict, bool]:
+    """
+    Creates the tab of a new partition with the header and `values` in one batchUpdate.
+    Returns (partition, whether `values` were written). A tab that already exists, made by
+    another worker or by hand, is adopted from the map or, failing that, one metadata lookup.
+    """
+    tab_name = partition_key if part == 1 else f"{partition_key}_{part}"
+    try:
+        sheet_gid = _create_sheets_batch(spreadsheet_id, [(tab_name, values)])[0]
+        written = True
+    except Exception as e:
+        if not _is_duplicate_tab(e):
+            raise
+        known = latest_partition(spreadsheet_id, partition_key)
+        if known and known["tab_name"] == tab_name:
+            reserve_rows(known, len(values))
+            return known, False
+        sheet_gid = _lookup_sheet_gid(spreadsheet_id, tab_name)
+        if sheet_gid is None:
+            raise
+        written = False
+    add_partition(spreadsheet_id, partition_key, part, tab_name, sheet_gid, len(values) + 1)
+    return latest_partition(spreadsheet_id, partition_key), written
+
+_partition_lock = threading.Lock()
+
+def _append_partitioned(base_id: str, tab_prefix: str, values: list[list[str]], source: str) -> tuple[str, str, int]:
+    period = datetime.date.today().strftime(PARTITION_PERIOD_FORMATS.get(SHEETS_PARTITION_PERIOD, PARTITION_PERIOD_FORMATS["month"]))
+    partition_key = f"{tab_prefix}_{period}"
+    # Only choosing the target and creating tabs is serialized; appends to an existing tab run concurrently.
+    with _partition_lock:
+        spreadsheet_id = current_spreadsheet(base_id)
+        used_rows = spreadsheet_rows(spreadsheet_id)
+        if used_rows and (used_rows + len(values) + 1) * len(HEADER_ROW) > SHEETS_SPREADSHEET_MAX_CELLS:
+            spreadsheet_id = _roll_over(base_id, spreadsheet_id)
+        partition = latest_partition(spreadsheet_id, partition_key)
+        if partition is None or partition["row_count"] + len(values) > SHEETS_PARTITION_MAX_ROWS:
+            partition, written = _open_partition(spreadsheet_id, partition_key, partition["part"] + 1 if partition else 1, values)
+        else:
+            reserve_rows(partition, len(values))
+            written = False
+
+    if not written:
+        try:
+            _append_rows(spreadsheet_id, partition["sheet_gid"], values)
+        except Exception as e:
+            release_rows(partition, len(values))
+            print(f"Error appending to {partition['tab_name']}: {e}")
+            raise
+
+    _mirror(spreadsheet_id, partition["tab_name"], partition["sheet_gid"], values, source)
+    return spreadsheet_id, partition["tab_name"], partition["sheet_gid"]
+
+def write_ledger_rows(spreadsheet_id: str, tab_prefix: str, values: list[list[str]], source: str = "") -> tuple[str, str, int]:
+    """
+    Writes extracted rows according to SHEETS_LAYOUT and mirrors them locally.
+    Returns (spreadsheet id, tab name, gid). The spreadsheet differs from `spreadsheet_id`
+    once the partitioned layout has rolled over to a new file.
+    """
+    if SHEETS_LAYOUT == "partitioned":
+        return _append_partitioned(spreadsheet_id, tab_prefix, values, source)
+    new_sheet_name = f"{tab_prefix}_{datetime.datetime.now().strftime('%Y-%b-%d_%H%M')}"
+    tab_name, sheet_gid = _create_tab_with_rows(spreadsheet_id, new_sheet_name, values, source)
+    return spreadsheet_id, tab_name, sheet_gid
 
-def export_sheet_to_xlsx(spreadsheet_id: str, output_path: str):
+def export_sheet_to_xlsx_bytes(spreadsheet_id: str) -> bytes:
     """
-    Downloads the entire Google Spreadsheet (including the newly added tab) as an .xlsx file.
+    Downloads the entire Google Spreadsheet (including the newly added tab) as .xlsx bytes.
     """
-    drive_service = get_drive_service()
-    request = drive_service.files().export_media(
-        fileId=spreadsheet_id, 
-        mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    
-    with io.FileIO(output_path, 'wb') as fh:
-        downloader = MediaIoBaseDownload(fh, request)
+    buffer = io.BytesIO()
+    from googleapiclient.http import MediaIoBaseDownload
+    with admit("drive"), drive_client() as drive_service, observe_call("drive", "export"):
+        request = drive_service.files().export_media(
+            fileId=spreadsheet_id,
+            mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        downloader = MediaIoBaseDownload(buffer, request)
         done = False
         while done is False:
             status, done = downloader.next_chunk()
+    return buffer.getvalue()
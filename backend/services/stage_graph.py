@@ -0,0 +1,64 @@
+import asyncio
+from services.metrics import observe_stage
+
+class StageGraph:
+    """
+    The async stages of one pipeline run, with explicit dependencies. A stage starts as soon
+    as the stages it depends on have finished and receives their results as arguments, so
+    independent stages run concurrently. A failed dependency fails the stage too.
+
+    wait_for only orders a stage after others (e.g. WhatsApp messages after the ones sent
+    before them) without needing their results or their success. Each stage is timed with
+    observe_stage, so trace spans show how the stages overlap.
+
+    With sequential=True every stage also waits for the one added before it, which runs the
+    same pipeline step by step (the reference it is benchmarked against).
+    """
+
+    def __init__(self, sequential: bool = False):
+        self.sequential = sequential
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._last = None
+
+    def add(self, name: str, fn, *after: str, wait_for: tuple[str, ...] = ()) -> asyncio.Task:
+        """
+        Schedules `await fn(*results of after)` as stage `name` and returns its task.
+        """
+        dependencies = [self._tasks[n] for n in after]
+        ordering = [self._tasks[n] for n in wait_for if n in self._tasks]
+        if self.sequential and self._last is not None:
+            ordering.append(self._last)
+
+        async def run():
+            if ordering:
+                await asyncio.wait(ordering)
+            results = [await task for task in dependencies]
+            with observe_stage(name):
+                return await fn(*results)
+
+        # The task copies the current context: trace and admission mode carry over.
+        task = asyncio.create_task(run(), name=name)
+        self._tasks[name] = task
+        self._last = task
+        return task
+
+    async def result(self, name: str):
+        return await self._tasks[name]
+
+    async def settle(self, *names: str):
+        """
+        Waits for the named stages (those that were added) to finish, ignoring failures.
+        """
+        tasks = [self._tasks[n] for n in names if n in self._tasks]
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def close(self):
+        """
+        Cancels stages still running (after a failure or an early return) and collects every
+        outcome, so no task is left behind or logged as an unretrieved exception.
+        """
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
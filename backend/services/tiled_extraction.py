@@ -0,0 +1,154 @@
+import io
+import os
+import math
+from difflib import SequenceMatcher
+
+# Tall pages are cut into overlapping horizontal strips that are extracted in parallel:
+#   off    - never
+#   auto   - pages at least EXTRACTION_TILE_MIN_ASPECT times taller than wide
+#   always - every image page
+EXTRACTION_TILES = os.getenv("EXTRACTION_TILES", "off")
+EXTRACTION_TILE_MIN_ASPECT = float(os.getenv("EXTRACTION_TILE_MIN_ASPECT", "1.6"))
+# Target strip height as a multiple of the page width, and the most strips per page.
+EXTRACTION_TILE_HEIGHT = float(os.getenv("EXTRACTION_TILE_HEIGHT", "0.75"))
+EXTRACTION_MAX_TILES = int(os.getenv("EXTRACTION_MAX_TILES", "6"))
+# Fraction of each strip shared with the next one. It must be taller than a written row,
+# so every row is whole in at least one strip.
+EXTRACTION_TILE_OVERLAP = float(os.getenv("EXTRACTION_TILE_OVERLAP", "0.15"))
+TILE_JPEG_QUALITY = 90
+
+TILE_PROMPT_SUFFIX = (
+    " This image is one horizontal strip of a taller page, and it overlaps the strips above and below it. "
+    "Extract only the rows whose writing is fully visible; skip a row cut off at the top or bottom edge. "
+    "A strip may have no header row; still treat it as a ledger if it contains ledger rows."
+)
+
+def tiling_signature() -> str:
+    """
+    Identifies the tiling settings; part of the extraction cache key.
+    """
+    if EXTRACTION_TILES == "off":
+        return "whole"
+    return f"tiles-{EXTRACTION_TILES}-a{EXTRACTION_TILE_MIN_ASPECT}-h{EXTRACTION_TILE_HEIGHT}-n{EXTRACTION_MAX_TILES}-o{EXTRACTION_TILE_OVERLAP}"
+
+def tile_count(width: int, height: int, mode: str = None) -> int:
+    mode = mode or EXTRACTION_TILES
+    if mode == "off" or width <= 0 or (mode == "auto" and height / width < EXTRACTION_TILE_MIN_ASPECT):
+        return 1
+    return max(2, min(EXTRACTION_MAX_TILES, math.ceil(height / (width * EXTRACTION_TILE_HEIGHT))))
+
+def tile_bounds(height: int, count: int, overlap: float) -> list[tuple[int, int]]:
+    """
+    (top, bottom) pixel rows of `count` strips of equal height covering `height`, each
+    sharing `overlap` of its height with the next.
+    """
+    tile = height / (count - (count - 1) * overlap)
+    step = tile * (1 - overlap)
+    return [(round(i * step), min(height, round(i * step + tile))) for i in range(count)]
+
+def split_into_tiles(image_bytes: bytes, mime_type: str, mode: str = None) -> list[bytes]:
+    """
+    JPEG strips of the page, top to bottom. Returns [] when the page should be extracted
+    whole (not an image, not tall enough, or tiling is off).
+    """
+    if not mime_type.startswith("image/") or (mode or EXTRACTION_TILES) == "off":
+        return []
+
+    from PIL import Image, ImageOps
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("RGB")
+    except Exception as e:
+        print(f"Tiling skipped: {e}")
+        return []
+
+    count = tile_count(img.width, img.height, mode)
+    if count < 2:
+        return []
+    tiles = []
+    for top, bottom in tile_bounds(img.height, count, EXTRACTION_TILE_OVERLAP):
+        out = io.BytesIO()
+        img.crop((0, top, img.width, bottom)).save(out, format="JPEG", quality=TILE_JPEG_QUALITY)
+        tiles.append(out.getvalue())
+    return tiles
+
+def _amount(entry: dict) -> float | None:
+    try:
+        return float(str(entry.get("amount", "")).replace(",", ""))
+    except ValueError:
+        return None
+
+def _same_row(a: dict, b: dict) -> bool:
+    """
+    Whether two entries read from neighbouring strips are the same written row: equal
+    amounts, compatible dates and nearly the same name (each strip is read separately,
+    so spelling can differ a little).
+    """
+    if _amount(a) != _amount(b):
+        return False
+    date_a, date_b = str(a.get("date", "")).strip(), str(b.get("date", "")).strip()
+    if date_a != date_b and "N/A" not in (date_a, date_b):
+        return False
+    name_a = " ".join(str(a.get("name", "")).lower().split())
+    name_b = " ".join(str(b.get("name", "")).lower().split())
+    return name_a == name_b or SequenceMatcher(None, name_a, name_b).ratio() >= 0.8
+
+def _overlap_matches(upper: list[dict], lower: list[dict], window: int) -> set[int]:
+    """
+    Indexes of `lower` entries that repeat rows at the end of `upper`. Only the last and
+    first `window` rows are compared, and matches must keep their order (longest common
+    subsequence), so equal rows elsewhere on the page are never merged.
+    """
+    tail = upper[-window:] if window else []
+    head = lower[:window]
+    # lengths[i][j]: longest ordered match between tail[i:] and head[j:]
+    lengths = [[0] * (len(head) + 1) for _ in range(len(tail) + 1)]
+    for i in range(len(tail) - 1, -1, -1):
+        for j in range(len(head) - 1, -1, -1):
+            if _same_row(tail[i], head[j]):
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+
+    matched, i, j = set(), 0, 0
+    while i < len(tail) and j < len(head):
+        if _same_row(tail[i], head[j]) and lengths[i][j] == lengths[i + 1][j + 1] + 1:
+            matched.add(j)
+            i, j = i + 1, j + 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return matched
+
+def merge_tile_extractions(tiles: list[dict], overlap: float = None) -> dict:
+    """
+    Combines the extractions of a page's strips (top to bottom) into one LedgerExtraction.
+    Rows read twice where strips overlap are kept once, from the upper strip.
+    """
+    overlap = EXTRACTION_TILE_OVERLAP if overlap is None else overlap
+    valid = [t for t in tiles if t.get("is_valid_ledger")]
+    entries, previous, duplicates = [], [], 0
+    for tile in tiles:
+        current = list(tile.get("entries") or [])
+        if previous:
+            # Rows that fit in the shared band, plus slack for uneven row heights
+            window = math.ceil(max(len(previous), len(current)) * overlap) + 2
+            matched = _overlap_matches(previous, current, window)
+            duplicates += len(matched)
+            current_kept = [e for j, e in enumerate(current) if j not in matched]
+        else:
+            current_kept = current
+        entries.extend(current_kept)
+        previous = current
+
+    confidences = [t["confidence"] for t in valid if isinstance(t.get("confidence"), (int, float))]
+    tiers = {t.get("model_tier") for t in tiles}
+    return {
+        "is_valid_ledger": bool(valid),
+        "error_message": "" if valid else next((t.get("error_message", "") for t in tiles if t.get("error_message")), ""),
+        "entries": entries,
+        "confidence": min(confidences) if confidences else 0.0,
+        "model_tier": "strong" if "strong" in tiers else next(iter(tiers), None),
+        "tiles": len(tiles),
+        "overlap_duplicates": duplicates,
+    }
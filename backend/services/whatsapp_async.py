@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import asyncio
+import httpx
+from services.admission import admit_async, throttle
+from services.metrics import observe_call, RETRIES
+
+WHATSAPP_ACCESS_TOKEN = os.getenv("WHATSAPP_ACCESS_TOKEN")
+WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
+
+# Overridable so benchmarks can point the client at a local stand-in.
+GRAPH_API_BASE = os.getenv("WHATSAPP_GRAPH_API_BASE", "https://graph.facebook.com/v19.0")
+
+WHATSAPP_HTTP_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_HTTP_TIMEOUT_SECONDS", "15"))
+WHATSAPP_MAX_RETRIES = int(os.getenv("WHATSAPP_MAX_RETRIES", "3"))
+WHATSAPP_BACKOFF_BASE_SECONDS = float(os.getenv("WHATSAPP_BACKOFF_BASE_SECONDS", "0.5"))
+# Cloud API default throughput is 80 messages/second per business phone number.
+WHATSAPP_SEND_RATE_PER_SECOND = float(os.getenv("WHATSAPP_SEND_RATE_PER_SECOND", "80"))
+WHATSAPP_SEND_BURST = int(os.getenv("WHATSAPP_SEND_BURST", "80"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# A POST (send, upload) may have been carried out even when its response was lost or a 5xx.
+# It is only retried when it certainly was not: refused with 429, or never sent at all.
+POST_RETRYABLE_STATUS_CODES = {429}
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class TokenBucket:
+    """
+    Async token bucket: acquire() waits until a token is available.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+_client: httpx.AsyncClient | None = None
+_send_limiter: TokenBucket | None = None
+
+def _get_client() -> httpx.AsyncClient:
+    """
+    One keep-alive connection pool to graph.facebook.com shared by every call in the process.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WHATSAPP_HTTP_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        )
+    return _client
+
+def _get_send_limiter() -> TokenBucket:
+    global _send_limiter
+    if _send_limiter is None:
+        _send_limiter = TokenBucket(WHATSAPP_SEND_RATE_PER_SECOND, WHATSAPP_SEND_BURST)
+    return _send_limiter
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    backoff = WHATSAPP_BACKOFF_BASE_SECONDS * (2 ** attempt)
+    return backoff + random.uniform(0, backoff / 2)
+
+async def _request(method: str, url: str, operation: str, rate_limited: bool = False, **kwargs) -> httpx.Response | None:
+    """
+    Sends a Graph API request with a per-call timeout, retrying with exponential backoff.
+    GETs are retried on 429/5xx and any transport error; other methods only on 429 and
+    errors before the request went out, so a message is never sent twice. Returns the last
+    response, or None if every attempt failed to get one.
+    """
+    client = _get_client()
+    response = None
+    idempotent = method.upper() in ("GET", "HEAD")
+    retryable_statuses = RETRYABLE_STATUS_CODES if idempotent else POST_RETRYABLE_STATUS_CODES
+    for attempt in range(WHATSAPP_MAX_RETRIES + 1):
+        if rate_limited:
+            await _get_send_limiter().acquire()
+        try:
+            # Graph calls only come from background work, so they always wait for a slot.
+            async with admit_async("graph", wait=True):
+                with observe_call("graph", operation):
+                    response = await client.request(method, url, **kwargs)
+            if response.status_code == 429:
+                throttle("graph", _retry_delay(attempt, response))
+            if response.status_code not in retryable_statuses:
+                return response
+            print(f"Graph API {method} {url} returned {response.status_code} (attempt {attempt + 1})")
+        except httpx.TransportError as e:
+            response = None
+            print(f"Graph API {method} {url} failed (attempt {attempt + 1}): {e}")
+            if not idempotent and not isinstance(e, UNSENT_ERRORS):
+                return None
+
+        if attempt < WHATSAPP_MAX_RETRIES:
+            RETRIES.inc(api="graph", operation=operation)
+            await asyncio.sleep(_retry_delay(attempt, response))
+    return response
+
+async def get_media_url(media_id: str) -> str:
+    """
+    Calls WhatsApp Cloud API to get the temporary download URL for an image.
+    """
+    if not WHATSAPP_ACCESS_TOKEN:
+        print("ERROR: WHATSAPP_ACCESS_TOKEN not set!")
+        return ""
+
+    url = f"{GRAPH_API_BASE}/{media_id}"
+    headers = {"Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}"}
+
+    response = await _request("GET", url, "get_media_url", headers=headers)
+    if response is not None and response.status_code == 200:
+        return response.json().get("url")
+    print("Failed to get media URL:", response.text if response is not None else "no response")
+    return ""
+
+async def download_media_bytes(media_url: str) -> tuple[bytes, str]:
+    """
+    Downloads the actual binary image from Meta's servers into memory.
+    Returns (content, mime_type), or (b"", "") on failure.
+    """
+    headers = {"Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}"}
+    response = await _request("GET", media_url, "download_media", headers=headers)
+
+    if response is not None and response.status_code == 200:
+        mime_type = response.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
+        return response.content, mime_type
+    print("Failed to download media:", response.text if response is not None else "no response")
+    return b"", ""
+
+async def send_whatsapp_message(to_number: str, message: str):
+    """
+    Sends a text message back to the user via WhatsApp.
+    """
+    if not WHATSAPP_PHONE_ID or not WHATSAPP_ACCESS_TOKEN:
+        print("ERROR: Missing WhatsApp credentials for sending message.")
+        return
+
+    url = f"{GRAPH_API_BASE}/{WHATSAPP_PHONE_ID}/messages"
+    headers = {
+        "Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to_number,
+        "type": "text",
+        "text": {"body": message}
+    }
+
+    response = await _request("POST", url, "send_message", rate_limited=True, headers=headers, json=payload)
+    if response is None or response.status_code != 200:
+        print("Failed to send WhatsApp message:", response.text if response is not None else "no response")
+
+async def upload_whatsapp_media_bytes(content: bytes, filename: str, mime_type: str) -> str:
+    """
+    Uploads an in-memory file to Meta's servers to get a media_id for sending.
+    """
+    if not WHATSAPP_PHONE_ID or not WHATSAPP_ACCESS_TOKEN:
+        print("ERROR: Missing WhatsApp credentials for uploading media.")
+        return ""
+
+    url = f"{GRAPH_API_BASE}/{WHATSAPP_PHONE_ID}/media"
+    headers = {"Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}"}
+
+    files = {"file": (filename, content, mime_type)}
+    data = {"messaging_product": "whatsapp"}
+    response = await _request("POST", url, "upload_media", headers=headers, data=data, files=files)
+
+    if response is not None and response.status_code == 200:
+        return response.json().get("id")
+    print("Failed to upload media to WhatsApp:", response.text if response is not None else "no response")
+    return ""
+
+async def send_whatsapp_document(to_number: str, media_id: str, filename: str, caption: str = ""):
+    """
+    Sends a document message (like an Excel file) to the user.
+    """
+    if not WHATSAPP_PHONE_ID or not WHATSAPP_ACCESS_TOKEN:
+        print("ERROR: Missing WhatsApp credentials for sending document.")
+        return
+
+    url = f"{GRAPH_API_BASE}/{WHATSAPP_PHONE_ID}/messages"
+    headers = {
+        "Authorization": f"Bearer {WHATSAPP_ACCESS_TOKEN}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to_number,
+        "type": "document",
+        "document": {
+            "id": media_id,
+            "caption": caption,
+            "filename": filename
+        }
+    }
+
+    response = await _request("POST", url, "send_document", rate_limited=True, headers=headers, json=payload)
+    if response is None or response.status_code != 200:
+        print("Failed to send WhatsApp document:", response.text if response is not None else "no response")
@@ -0,0 +1,32 @@
+import io
+import math
+
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+HEADER_ROW = ["Date", "Description/Name", "Amount", "Status"]
+
+def _cell_value(value):
+    text = str(value)
+    try:
+        number = float(text.replace(",", ""))
+    except ValueError:
+        return text
+    # "nan", "inf" and "1e999" parse too, but are not valid cell numbers
+    return number if math.isfinite(number) else text
+
+def build_ledger_xlsx(rows: list[list[str]], sheet_title: str = "Ledger") -> bytes:
+    """
+    Builds an .xlsx with the header row plus the given ledger rows entirely in memory.
+    Uses openpyxl's write-only mode, which streams rows instead of holding a cell grid.
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    # Excel caps sheet titles at 31 characters
+    worksheet = workbook.create_sheet(title=sheet_title[:31])
+    worksheet.append(HEADER_ROW)
+    for row in rows:
+        worksheet.append([row[0], row[1], _cell_value(row[2]), row[3]])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
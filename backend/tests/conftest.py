@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Services read their settings at import time, so the databases are pointed at a scratch
+# directory before any test module imports them.
+_data_dir = tempfile.mkdtemp(prefix="airstore-tests-")
+os.environ["RECORDS_DB_PATH"] = os.path.join(_data_dir, "records.db")
+os.environ["EXTRACTION_CACHE_DB"] = os.path.join(_data_dir, "extraction_cache.db")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+os.environ["STARTUP_WARMUP"] = "lazy"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import json
+from services.entry_stream import EntryStreamParser
+
+DOCUMENT = {
+    "is_valid_ledger": True,
+    "error_message": "",
+    "entries": [
+        {"date": "01/10/2026", "name": "Ramesh {advance}", "amount": "500", "status": "Paid"},
+        {"date": "02/10/2026", "name": 'Shop "A", [east]', "amount": "1,200", "status": "Due"},
+        {"date": "N/A", "name": "Back\\slash", "amount": "7", "status": ""},
+    ],
+    "confidence": 0.9,
+}
+
+def feed_in_chunks(text: str, size: int) -> list[dict]:
+    parser = EntryStreamParser()
+    entries = []
+    for i in range(0, len(text), size):
+        entries.extend(parser.feed(text[i:i + size]))
+    return entries
+
+def test_entries_are_emitted_whatever_the_chunking():
+    text = json.dumps(DOCUMENT)
+    for size in (1, 2, 7, 64, len(text)):
+        assert feed_in_chunks(text, size) == DOCUMENT["entries"]
+
+def test_entry_is_emitted_as_soon_as_it_closes():
+    text = json.dumps(DOCUMENT)
+    first_end = text.index('"Paid"}') + len('"Paid"}')
+    parser = EntryStreamParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [DOCUMENT["entries"][0]]
+
+def test_only_the_top_level_entries_array_counts():
+    text = json.dumps({
+        "meta": {"entries": [{"name": "nested"}]},
+        "notes": "entries",
+        "entries": [{"name": "real"}],
+    })
+    assert feed_in_chunks(text, 5) == [{"name": "real"}]
+
+def test_text_returns_everything_fed():
+    parser = EntryStreamParser()
+    parser.feed('{"entries": [')
+    parser.feed("]}")
+    assert parser.text() == '{"entries": []}'
@@ -0,0 +1,89 @@
+import time
+import threading
+from contextlib import contextmanager
+import pytest
+from services import hedging
+from services.hedging import hedged_call, DeadlineExceeded
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_RETRY_BACKOFF_SECONDS", 0.01)
+
+class Attempts:
+    """
+    attempt(deadline) that plays the given behaviours in order: a value to return,
+    an exception to raise, or ("sleep", seconds, value).
+    """
+
+    def __init__(self, *behaviours):
+        self.behaviours = list(behaviours)
+        self.calls = 0
+        self.deadlines = []
+        self._lock = threading.Lock()
+
+    def __call__(self, deadline: float):
+        with self._lock:
+            behaviour = self.behaviours[min(self.calls, len(self.behaviours) - 1)]
+            self.calls += 1
+            self.deadlines.append(deadline)
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        if isinstance(behaviour, tuple):
+            _, seconds, value = behaviour
+            time.sleep(seconds)
+            return value
+        return behaviour
+
+def test_returns_the_first_answer():
+    attempts = Attempts("ok")
+    assert hedged_call(attempts, "test", "op", deadline_seconds=1, hedge_after=0.5) == "ok"
+    assert attempts.calls == 1
+
+def test_a_slow_primary_is_overtaken_by_the_hedge():
+    attempts = Attempts(("sleep", 0.5, "primary"), "hedge")
+    assert hedged_call(attempts, "test", "op", deadline_seconds=2, hedge_after=0.05) == "hedge"
+    assert attempts.calls == 2
+
+def test_no_hedge_when_may_hedge_declines():
+    attempts = Attempts(("sleep", 0.2, "primary"), "hedge")
+    assert hedged_call(attempts, "test", "op", deadline_seconds=2, hedge_after=0.05, may_hedge=lambda: False) == "primary"
+    assert attempts.calls == 1
+
+def test_transient_failures_are_retried():
+    attempts = Attempts(TimeoutError("slow"), ConnectionError("reset"), "ok")
+    assert hedged_call(attempts, "test", "op", deadline_seconds=2) == "ok"
+    assert attempts.calls == 3
+
+def test_permanent_failures_are_raised_without_retry():
+    attempts = Attempts(ValueError("bad request"), "ok")
+    with pytest.raises(ValueError):
+        hedged_call(attempts, "test", "op", deadline_seconds=2)
+    assert attempts.calls == 1
+
+def test_retries_stop_at_max_attempts():
+    attempts = Attempts(TimeoutError("slow"))
+    with pytest.raises(TimeoutError):
+        hedged_call(attempts, "test", "op", deadline_seconds=2, max_attempts=2)
+    assert attempts.calls == 2
+
+def test_deadline_exceeded_and_abandoned_results_are_released():
+    released = []
+    attempts = Attempts(("sleep", 0.3, "late"))
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_call(attempts, "test", "op", deadline_seconds=0.1, max_attempts=1, on_abandoned=released.append)
+    assert time.monotonic() - start < 0.25
+    time.sleep(0.4)
+    assert released == ["late"]
+
+def test_deadline_starts_once_the_first_attempt_is_admitted():
+    @contextmanager
+    def slow_admission():
+        time.sleep(0.2)
+        yield
+
+    attempts = Attempts(("sleep", 0.05, "ok"))
+    before = time.monotonic()
+    assert hedged_call(attempts, "test", "op", deadline_seconds=0.15, admit=slow_admission) == "ok"
+    # The attempt's own deadline is counted from admission, not from the call
+    assert attempts.deadlines[0] >= before + 0.2 + 0.15
@@ -0,0 +1,51 @@
+import random
+from services.page_index import MultiIndexHash
+
+def flip(value: int, bits: list[int]) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def test_search_matches_a_brute_force_scan():
+    rng = random.Random(15)
+    hashes = {item_id: rng.getrandbits(64) for item_id in range(500)}
+    index = MultiIndexHash()
+    for item_id, value in hashes.items():
+        index.add(item_id, value)
+
+    for _ in range(200):
+        base = hashes[rng.randrange(len(hashes))]
+        query = flip(base, rng.sample(range(64), rng.randint(0, 10)))
+        for max_distance in (0, 3, 7):
+            expected = sorted(
+                ((value ^ query).bit_count(), item_id)
+                for item_id, value in hashes.items()
+                if (value ^ query).bit_count() <= max_distance
+            )
+            assert index.search(query, max_distance) == expected
+
+def test_a_match_with_bits_spread_over_every_chunk_is_found():
+    index = MultiIndexHash()
+    index.add(1, 0)
+    # 7 bits: two in each of the first three chunks and one in the last
+    query = flip(0, [0, 1, 16, 17, 32, 33, 48])
+    assert index.search(query, 7) == [(7, 1)]
+    assert index.search(query, 6) == []
+
+def test_results_are_nearest_first():
+    index = MultiIndexHash()
+    index.add(1, flip(0, [1, 2, 3]))
+    index.add(2, flip(0, [5]))
+    index.add(3, 0)
+    assert index.search(0, 7) == [(0, 3), (1, 2), (3, 1)]
+
+def test_remove_and_duplicate_add():
+    index = MultiIndexHash()
+    index.add(1, 42)
+    index.add(1, 7)
+    assert len(index) == 1
+    assert index.search(42, 0) == [(0, 1)]
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.search(42, 7) == []
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from services.record_store import _encode_cursor, _decode_cursor, create_record, claim_for_confirm, mark_confirmed
+
+@pytest.fixture(scope="module")
+def client():
+    import main
+    with TestClient(main.app) as c:
+        yield c
+
+def test_cursor_round_trip():
+    for created_at, record_id in [
+        ("2026-10-17 09:30:00.123", "8f1c2a"),
+        ("2026-10-17 09:30:00", "id|with|pipes"),
+        ("", ""),
+    ]:
+        cursor = _encode_cursor(created_at, record_id)
+        assert "=" not in cursor
+        assert _decode_cursor(cursor) == (created_at, record_id)
+
+def test_invalid_cursors_are_rejected():
+    for cursor in ("not base64!", _encode_cursor("a", "b")[:-1] + "*", "bm9waXBl"):
+        with pytest.raises(ValueError):
+            _decode_cursor(cursor)
+
+def test_bad_cursor_is_a_400(client):
+    assert client.get("/records", params={"cursor": "bm9waXBl"}).status_code == 400
+
+def test_pages_follow_next_cursor(client):
+    ids = {create_record({"entries": [{"name": f"row {i}"}]}) for i in range(5)}
+    seen, cursor = [], ""
+    while True:
+        page = client.get("/records", params={"limit": 2, "cursor": cursor}).json()
+        seen.extend(r["record_id"] for r in page["records"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert ids <= set(seen)
+    assert len(seen) == len(set(seen))
+
+def test_unchanged_list_is_a_304(client):
+    create_record({"entries": []})
+    first = client.get("/records", params={"status": "PENDING"})
+    assert first.status_code == 200
+    assert "Last-Modified" not in first.headers
+
+    again = client.get("/records", params={"status": "PENDING"}, headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+def test_record_leaving_the_list_invalidates_its_etag(client):
+    record_id = create_record({"entries": []})
+    first = client.get("/records", params={"status": "PENDING"})
+    assert record_id in [r["record_id"] for r in first.json()["records"]]
+
+    assert claim_for_confirm(record_id) == "CLAIMED"
+    mark_confirmed(record_id, {"entries": []})
+
+    after = client.get("/records", params={"status": "PENDING"}, headers={"If-None-Match": first.headers["ETag"]})
+    assert after.status_code == 200
+    assert record_id not in [r["record_id"] for r in after.json()["records"]]
+
+def test_lists_ignore_if_modified_since(client):
+    create_record({"entries": []})
+    response = client.get("/records", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
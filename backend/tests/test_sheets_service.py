@@ -0,0 +1,25 @@
+import datetime
+from services.sheets_service import _to_cell, SHEETS_EPOCH, DATE_CELL_FORMAT
+
+def serial(year: int, month: int, day: int) -> int:
+    return (datetime.date(year, month, day) - SHEETS_EPOCH).days
+
+def test_numbers_become_number_cells():
+    assert _to_cell("500") == {"userEnteredValue": {"numberValue": 500.0}}
+    assert _to_cell("1,200.50") == {"userEnteredValue": {"numberValue": 1200.5}}
+    assert _to_cell(-3) == {"userEnteredValue": {"numberValue": -3.0}}
+
+def test_non_finite_numbers_stay_text():
+    for text in ("nan", "inf", "-Infinity"):
+        assert _to_cell(text) == {"userEnteredValue": {"stringValue": text}}
+
+def test_dates_with_a_year_become_day_first_date_serials():
+    assert _to_cell("12/10/2026") == {"userEnteredValue": {"numberValue": serial(2026, 10, 12)}, "userEnteredFormat": DATE_CELL_FORMAT}
+    assert _to_cell("5 Oct, 2026")["userEnteredValue"] == {"numberValue": serial(2026, 10, 5)}
+    assert serial(1900, 1, 1) == 2
+
+def test_dates_without_a_year_and_text_stay_text():
+    assert _to_cell("12/10") == {"userEnteredValue": {"stringValue": "12/10"}}
+    assert _to_cell("N/A") == {"userEnteredValue": {"stringValue": "N/A"}}
+    assert _to_cell("Coffee") == {"userEnteredValue": {"stringValue": "Coffee"}}
+    assert _to_cell("") == {"userEnteredValue": {"stringValue": ""}}
@@ -0,0 +1,51 @@
+from services.tiled_extraction import merge_tile_extractions
+
+def entry(name: str, amount: str, date: str = "01/10/2026") -> dict:
+    return {"date": date, "name": name, "amount": amount, "status": "Paid"}
+
+def tile(entries: list[dict], valid: bool = True, **extra) -> dict:
+    return {"is_valid_ledger": valid, "error_message": "", "entries": entries, "confidence": 0.9, "model_tier": "fast", **extra}
+
+def test_rows_read_twice_in_the_overlap_are_kept_once():
+    upper = tile([entry("Ramesh", "500"), entry("Suresh", "200"), entry("Mahesh Traders", "75")])
+    # The shared band is read again, with a slightly different spelling
+    lower = tile([entry("Mahesh Tradres", "75"), entry("Dinesh", "40"), entry("Ganesh", "10")])
+    merged = merge_tile_extractions([upper, lower], overlap=0.2)
+    assert [e["name"] for e in merged["entries"]] == ["Ramesh", "Suresh", "Mahesh Traders", "Dinesh", "Ganesh"]
+    assert merged["overlap_duplicates"] == 1
+    assert merged["tiles"] == 2
+
+def test_equal_rows_outside_the_overlap_are_not_merged():
+    upper = tile([entry("Tea", "10"), entry("Rent", "900"), entry("Milk", "30"), entry("Bread", "25")])
+    lower = tile([entry("Salary", "5000"), entry("Gas", "800"), entry("Fuel", "300"), entry("Tea", "10")])
+    merged = merge_tile_extractions([upper, lower], overlap=0.1)
+    assert [e["name"] for e in merged["entries"]].count("Tea") == 2
+    assert merged["overlap_duplicates"] == 0
+
+def test_different_amounts_or_dates_are_different_rows():
+    upper = tile([entry("Ramesh", "500", "01/10/2026")])
+    lower = tile([entry("Ramesh", "50", "01/10/2026"), entry("Ramesh", "500", "02/10/2026")])
+    merged = merge_tile_extractions([upper, lower], overlap=0.5)
+    assert len(merged["entries"]) == 3
+
+def test_unreadable_date_matches_any_date():
+    upper = tile([entry("Ramesh", "500", "01/10/2026")])
+    lower = tile([entry("Ramesh", "500", "N/A")])
+    merged = merge_tile_extractions([upper, lower], overlap=0.5)
+    assert merged["entries"] == [entry("Ramesh", "500", "01/10/2026")]
+
+def test_summary_fields_combine_the_tiles():
+    merged = merge_tile_extractions([
+        tile([entry("A", "1")], confidence=0.95),
+        tile([entry("B", "2")], confidence=0.6, model_tier="strong"),
+        tile([], valid=False, error_message="blurred"),
+    ])
+    assert merged["is_valid_ledger"] is True
+    assert merged["confidence"] == 0.6
+    assert merged["model_tier"] == "strong"
+
+def test_all_tiles_invalid_keeps_the_error():
+    merged = merge_tile_extractions([tile([], valid=False), tile([], valid=False, error_message="not a ledger")])
+    assert merged["is_valid_ledger"] is False
+    assert merged["error_message"] == "not a ledger"
+    assert merged["entries"] == []
@@ -9,6 +9,7 @@ export default function Home() {
   const [file, setFile] = useState<File | null>(null);
   const [previewUrl, setPreviewUrl] = useState<string | null>(null);
   const [isUploading, setIsUploading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [extractedData, setExtractedData] = useState<any>(null);
   const [recordId, setRecordId] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
@@ -33,29 +34,71 @@ export default function Home() {
 
   const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+  // Applies one Server-Sent Event from /upload/stream to the review table.
+  const handleStreamEvent = (event: string, data: any) => {
+    if (event === "entry") {
+      setExtractedData((prev: any) => ({ ...(prev || {}), entries: [...(prev?.entries || []), data] }));
+    } else if (event === "restart") {
+      setExtractedData((prev: any) => ({ ...(prev || {}), entries: [] }));
+    } else if (event === "done") {
+      if (data.status === "error") {
+        setExtractedData(null);
+        setError(data.message || "An error occurred during extraction.");
+      } else {
+        setRecordId(data.record_id);
+        setExtractedData(data.data);
+      }
+    }
+  };
+
   const handleUpload = async () => {
     if (!file) return;
     setIsUploading(true);
+    setIsStreaming(true);
     setError(null);
+    setRecordId(null);
 
     const formData = new FormData();
     formData.append("file", file);
 
     try {
-      const response = await axios.post(`${API_URL}/upload`, formData, {
-        headers: { "Content-Type": "multipart/form-data" },
-      });
+      // Rows are streamed as Gemini writes them, so the review table fills in progressively.
+      const response = await fetch(`${API_URL}/upload/stream`, { method: "POST", body: formData });
+      if (!response.ok || !response.body) {
+        const detail = await response.json().catch(() => null);
+        throw new Error(detail?.detail || "An error occurred during extraction.");
+      }
 
-      if (response.data.status === "error") {
-        setError(response.data.message);
-      } else {
-        setRecordId(response.data.record_id);
-        setExtractedData(response.data.data);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let finished = false;
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const frame = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const event = frame.match(/^event: (.*)$/m)?.[1];
+          const data = frame.match(/^data: (.*)$/m)?.[1];
+          if (event && data) {
+            handleStreamEvent(event, JSON.parse(data));
+            if (event === "done") finished = true;
+          }
+        }
+      }
+      // The connection ended without a result (proxy timeout, server restart): the rows shown so far are incomplete.
+      if (!finished) {
+        throw new Error("The connection was lost before the extraction finished. Please try again.");
       }
     } catch (err: any) {
-      setError(err.response?.data?.detail || "An error occurred during extraction.");
+      setExtractedData(null);
+      setError(err.message || "An error occurred during extraction.");
     } finally {
       setIsUploading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -155,6 +198,21 @@ export default function Home() {
             </motion.div>
           )}
 
+          {!success && extractedData?.duplicate_of && (
+            <motion.div
+              key="duplicate"
+              initial={{ opacity: 0, y: -10 }}
+              animate={{ opacity: 1, y: 0 }}
+              exit={{ opacity: 0, y: -10 }}
+              className="mb-8 p-4 bg-amber-500/10 text-amber-300 rounded-2xl flex items-start gap-3 border border-amber-500/20 max-w-3xl mx-auto shadow-2xl backdrop-blur-md"
+            >
+              <AlertCircle className="w-5 h-5 shrink-0 mt-0.5" />
+              <p className="text-sm font-medium">
+                This page looks like one already uploaded on {extractedData.duplicate_of.first_seen}. Check your sheet before confirming it again.
+              </p>
+            </motion.div>
+          )}
+
           {success ? (
             <motion.div
               key="success"
@@ -211,7 +269,11 @@ export default function Home() {
                     <Sparkles className="w-6 h-6 text-indigo-400" />
                     Review Extraction
                   </h2>
-                  <p className="text-sm text-slate-400 mt-2">Make any necessary corrections before AirStore pushes this to your database.</p>
+                  <p className="text-sm text-slate-400 mt-2">
+                    {isStreaming
+                      ? "Reading your ledger... rows appear as soon as they are extracted."
+                      : "Make any necessary corrections before AirStore pushes this to your database."}
+                  </p>
                 </div>
               </div>
 
@@ -226,12 +288,13 @@ export default function Home() {
                     </tr>
                   </thead>
                   <tbody className="text-sm">
-                    {extractedData.entries.map((req: any, i: number) => (
+                    {(extractedData.entries || []).map((req: any, i: number) => (
                       <tr key={i} className="border-b border-white/5 last:border-0 hover:bg-white/[0.02] transition-colors group">
                         <td className="py-3 pl-4">
                           <input
                             className="bg-transparent text-slate-300 w-full px-3 py-2 focus:bg-[#1A1A1D] focus:ring-1 focus:ring-indigo-500/50 rounded-lg outline-none transition border border-transparent group-hover:border-white/10"
                             value={req.date}
+                            readOnly={isStreaming}
                             onChange={(e) => handleEditChange(i, 'date', e.target.value)}
                           />
                         </td>
@@ -239,6 +302,7 @@ export default function Home() {
                           <input
                             className="bg-transparent text-white font-medium w-full px-3 py-2 focus:bg-[#1A1A1D] focus:ring-1 focus:ring-indigo-500/50 rounded-lg outline-none transition border border-transparent group-hover:border-white/10"
                             value={req.name}
+                            readOnly={isStreaming}
                             onChange={(e) => handleEditChange(i, 'name', e.target.value)}
                           />
                         </td>
@@ -247,6 +311,7 @@ export default function Home() {
                             type="number"
                             className="bg-transparent text-indigo-300 font-semibold w-full px-3 py-2 text-right focus:bg-[#1A1A1D] focus:ring-1 focus:ring-indigo-500/50 rounded-lg outline-none transition border border-transparent group-hover:border-white/10"
                             value={req.amount}
+                            readOnly={isStreaming}
                             onChange={(e) => handleEditChange(i, 'amount', e.target.value)}
                           />
                         </td>
@@ -254,6 +319,7 @@ export default function Home() {
                           <input
                             className="bg-transparent text-slate-400 w-full px-3 py-2 focus:bg-[#1A1A1D] focus:ring-1 focus:ring-indigo-500/50 rounded-lg outline-none transition border border-transparent group-hover:border-white/10"
                             value={req.status}
+                            readOnly={isStreaming}
                             onChange={(e) => handleEditChange(i, 'status', e.target.value)}
                           />
                         </td>
@@ -267,17 +333,17 @@ export default function Home() {
                 <button
                   onClick={() => setExtractedData(null)}
                   className="px-6 py-3 text-sm font-medium text-slate-400 hover:text-white transition"
-                  disabled={isConfirming}
+                  disabled={isConfirming || isStreaming}
                 >
                   Discard
                 </button>
                 <button
                   onClick={handleConfirm}
-                  disabled={isConfirming}
+                  disabled={isConfirming || isStreaming || !recordId}
                   className="px-8 py-3 text-sm font-semibold bg-gradient-to-r from-indigo-500 to-blue-600 text-white rounded-xl shadow-[0_0_20px_rgba(99,102,241,0.3)] hover:shadow-[0_0_30px_rgba(99,102,241,0.5)] transition hover:scale-[1.02] active:scale-95 disabled:opacity-70 disabled:hover:scale-100 flex items-center gap-2"
                 >
-                  {isConfirming ? <Loader2 className="w-5 h-5 animate-spin" /> : <Database className="w-5 h-5" />}
-                  {isConfirming ? 'Pushing to AirStore...' : 'Confirm & Sync'}
+                  {isConfirming || isStreaming ? <Loader2 className="w-5 h-5 animate-spin" /> : <Database className="w-5 h-5" />}
+                  {isConfirming ? 'Pushing to AirStore...' : isStreaming ? 'Extracting...' : 'Confirm & Sync'}
                 </button>
               </div>
             </motion.div>